@@ -0,0 +1,180 @@
+#vectorized reports over a Bank, built on NumPy
+#
+#accounts and their TransactionStore arrays are projected once into flat
+#NumPy arrays; every report is then a handful of array operations instead of
+#a Python loop over Account and Transaction objects. Money columns are int64
+#minor units, so totals are exact and come back as Decimals.
+#
+#amounts are kept in each account's own minor units. Coins (crypto wallets,
+#8 places) and currency (2 places) are never added together: the money
+#reports take places, 2 by default, and cover the accounts with that many.
+#
+#   analytics = LedgerAnalytics.from_bank(bank)
+#   analytics.balance_by_type()
+#   analytics.top_accounts(10)
+#   analytics.daily_volume()
+#   analytics.total_balance(places=8)   # coins in crypto wallets
+#   analytics.failure_rates()
+
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+try:
+    import numpy as np
+except ImportError as e:
+    raise ImportError("bank_analytics requires NumPy: pip install numpy") from e
+
+from bank_system import _STATUS_CODES, _TYPE_CODES, _TYPE_NAMES, from_units
+
+#transaction types that move money in and out of an account. Transfers are
+#left out because a transfer is also recorded as a Deposit and a Withdraw.
+DEPOSIT_TYPES = ("Deposit", "OpeningDeposit", "Interest")
+WITHDRAWAL_TYPES = ("Withdraw", "Withdrawal", "Fee")
+
+
+#the largest int64; sums that could pass it are added as Python ints
+_INT64_MAX = 2 ** 63 - 1
+
+
+def _codes(names):
+    return np.array([_TYPE_CODES[name] for name in names if name in _TYPE_CODES], dtype=np.uint8)
+
+
+def _offset(timestamp):
+    #local UTC offset in seconds at an epoch timestamp
+    return datetime.fromtimestamp(timestamp, timezone.utc).astimezone().utcoffset().total_seconds()
+
+
+def _local_offsets(timestamps):
+    #the local UTC offset of every timestamp. Offsets are looked up once per
+    #distinct hour; the few hours in which the offset changes are looked up
+    #per timestamp
+    hours = (timestamps // 3600).astype(np.int64)
+    unique_hours, hour_index = np.unique(hours, return_inverse=True)
+    starts = np.array([_offset(int(hour) * 3600) for hour in unique_hours])
+    ends = np.array([_offset(int(hour) * 3600 + 3599) for hour in unique_hours])
+    offsets = starts[hour_index]
+    for i in np.flatnonzero((starts != ends)[hour_index]):
+        offsets[i] = _offset(float(timestamps[i]))
+    return offsets
+
+
+class LedgerAnalytics:
+    def __init__(self, accounts):
+        accounts = list(accounts)
+        self.kinds = sorted({acc.get_account_type() for acc in accounts})
+        kind_codes = {kind: code for code, kind in enumerate(self.kinds)}
+
+        #one row per account
+        self.account_numbers = np.array([int(acc.account_number) for acc in accounts], dtype=np.int64)
+        self.holders = [acc.holder_name for acc in accounts]
+        self.account_kinds = np.array([kind_codes[acc.get_account_type()] for acc in accounts], dtype=np.uint8)
+        #balances and amounts are in each account's own minor units
+        self.account_places = np.array([acc.places for acc in accounts], dtype=np.uint8)
+        self.kind_places = {acc.get_account_type(): acc.places for acc in accounts}
+        self.balances = np.array([acc.units for acc in accounts], dtype=np.int64)
+
+        #one row per transaction; owner is the row of the account it belongs to
+        #archived transactions (see bank_archive.py) are not projected
+        stores = [acc.transactions.load() for acc in accounts]
+        counts = np.array([len(store.types) for store in stores], dtype=np.int64)
+        self.owners = np.repeat(np.arange(len(accounts)), counts)
+        self.types = self._column(stores, "types", np.uint8)
+        self.statuses = self._column(stores, "statuses", np.uint8)
+        self.amounts = self._column(stores, "amounts", np.int64)
+        self.places = np.repeat(self.account_places, counts)
+        self.timestamps = self._column(stores, "timestamps", np.float64)
+
+    @classmethod
+    def from_bank(cls, bank):
+        return cls(bank.accounts.values())
+
+    @staticmethod
+    def _column(stores, name, dtype):
+        #the store arrays are wrapped without copying and concatenated once
+        parts = [np.frombuffer(getattr(store, name), dtype=dtype) for store in stores if len(store.types)]
+        if not parts:
+            return np.empty(0, dtype=dtype)
+        return np.concatenate(parts)
+
+    @staticmethod
+    def _sums(groups, values, n):
+        #exact per-group sums; bincount would go through float64 weights, and
+        #int64 sums wrap silently, so values whose sum could pass the int64
+        #range are added as Python ints
+        if len(values) and int(np.abs(values).max()) * len(values) > _INT64_MAX:
+            sums = np.zeros(n, dtype=object)
+            np.add.at(sums, groups, values.astype(object))
+            return sums
+        sums = np.zeros(n, dtype=np.int64)
+        np.add.at(sums, groups, values)
+        return sums
+
+    def balance_by_type(self):
+        #{account type: {"count", "total", "average"}}, each in the places of
+        #that account type
+        n = len(self.kinds)
+        counts = np.bincount(self.account_kinds, minlength=n)
+        totals = self._sums(self.account_kinds, self.balances, n)
+        report = {}
+        for i, kind in enumerate(self.kinds):
+            places = self.kind_places[kind]
+            total = from_units(int(totals[i]), places)
+            average = (total / int(counts[i])).quantize(Decimal(1).scaleb(-places)) if counts[i] else total
+            report[kind] = {"count": int(counts[i]), "total": total, "average": average}
+        return report
+
+    def total_balance(self, places=2):
+        #the balances of the accounts with places places
+        balances = self.balances[self.account_places == places]
+        #one group holding every balance
+        total = self._sums(np.zeros(len(balances), dtype=np.intp), balances, 1)[0]
+        return from_units(int(total), places)
+
+    def top_accounts(self, n=10, places=2):
+        #[(account number, holder, balance)] of the accounts with places
+        #places, highest balance first
+        rows = np.flatnonzero(self.account_places == places)
+        n = min(n, len(rows))
+        if n <= 0:
+            return []
+        balances = self.balances[rows]
+        top = np.argpartition(-balances, n - 1)[:n]
+        top = rows[top[np.argsort(-balances[top], kind="stable")]]
+        return [(int(self.account_numbers[i]), self.holders[i], from_units(int(self.balances[i]), places))
+                for i in top]
+
+    def daily_volume(self, places=2):
+        #[(date, deposited, withdrawn)] for successful transactions of the
+        #accounts with places places, by local day
+        ok = (self.statuses == _STATUS_CODES["Success"]) & (self.places == places)
+        deposits = ok & np.isin(self.types, _codes(DEPOSIT_TYPES))
+        withdrawals = ok & np.isin(self.types, _codes(WITHDRAWAL_TYPES))
+        moving = deposits | withdrawals
+        if not moving.any():
+            return []
+
+        #timestamps are epoch seconds; shift each by the local UTC offset in
+        #force at that time (daylight saving time changes it) so days match
+        #the times shown in transaction history
+        timestamps = self.timestamps[moving]
+        days = ((timestamps + _local_offsets(timestamps)) // 86400).astype(np.int64)
+        unique_days, day_index = np.unique(days, return_inverse=True)
+        amounts = self.amounts[moving]
+        deposited = self._sums(day_index, np.where(deposits[moving], amounts, 0), len(unique_days))
+        withdrawn = self._sums(day_index, np.where(withdrawals[moving], amounts, 0), len(unique_days))
+        epoch = date(1970, 1, 1).toordinal()
+        return [(date.fromordinal(epoch + int(day)), from_units(int(deposited[i]), places),
+                 from_units(int(withdrawn[i]), places))
+                for i, day in enumerate(unique_days)]
+
+    def failure_rates(self):
+        #{transaction type: failed / total}, plus "all" across every type
+        failed = self.statuses == _STATUS_CODES["Failed"]
+        n = len(_TYPE_NAMES)
+        totals = np.bincount(self.types, minlength=n)
+        failures = np.bincount(self.types, weights=failed, minlength=n)
+        rates = {_TYPE_NAMES[code]: float(failures[code] / totals[code])
+                 for code in np.flatnonzero(totals)}
+        rates["all"] = float(failed.mean()) if len(failed) else 0.0
+        return rates
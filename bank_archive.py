@@ -0,0 +1,151 @@
+#transaction history retention for Bank: a hot window of recent transactions
+#stays in memory and in the snapshot, older ones move to compressed archive
+#segments that are read only when something asks for them
+#
+#   bank = Bank("bank_data.json", retention=RetentionPolicy(days=90, keep=10))
+#
+#every compaction moves each account's transactions older than days (but
+#never its newest keep) into gzip files partitioned by month:
+#
+#   bank_data.archive/2024-05.jsonl.gz
+#   bank_data.archive/2024-06.jsonl.gz
+#
+#one JSON line per transaction, as written to the data file plus its account
+#and position. The snapshot keeps, per account, how many transactions were
+#archived, what they add up to and which months hold them, so balances,
+#reconcile() and statements within the hot window never read the archive.
+#Iterating a history, or a range query reaching before the window, reads only
+#the months of that account (and that range).
+#
+#segments are appended as new gzip members and fsynced before the snapshot
+#that drops the entries is written. A compaction interrupted in between leaves
+#entries that are both archived and in the snapshot; the next one archives
+#them again, and readers skip positions the snapshot does not count as
+#archived as well as repeated ones.
+
+import gzip
+import json
+import os
+import time
+from bisect import bisect_left
+from datetime import timedelta
+from itertools import islice
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class RetentionPolicy:
+    def __init__(self, days=90, keep=10):
+        #transactions older than days are archived, except each account's
+        #newest keep, so the recent history the menu shows stays in memory
+        self.days = days
+        self.keep = keep
+
+    def due(self, store, now=None):
+        #whether store may have entries to archive. A history still in the
+        #snapshot is only read when its first entry is older than the window
+        if len(store) - store.archived <= self.keep:
+            return False
+        now = time.time() if now is None else now
+        oldest = store.oldest()
+        return oldest is not None and oldest < now - self.days * 86400
+
+    def split(self, store, now=None):
+        #how many of the loaded entries of store to archive: the leading ones
+        #older than the window
+        now = time.time() if now is None else now
+        cutoff = now - self.days * 86400
+        timestamps = store.timestamps
+        limit = max(len(timestamps) - self.keep, 0)
+        if store._is_sorted():
+            return bisect_left(timestamps, cutoff, 0, limit)
+        count = 0
+        while count < limit and timestamps[count] < cutoff:
+            count += 1
+        return count
+
+
+class TransactionArchive:
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, month):
+        return os.path.join(self.directory, month + ".jsonl.gz")
+
+    def append(self, lines):
+        #lines: {"YYYY-MM": [JSON line, ...]}; durable before it returns
+        os.makedirs(self.directory, exist_ok=True)
+        for month, month_lines in sorted(lines.items()):
+            with open(self.path(month), "ab") as f:
+                with gzip.GzipFile(fileobj=f, mode="wb", mtime=0) as z:
+                    z.write(("\n".join(month_lines) + "\n").encode())
+                f.flush()
+                os.fsync(f.fileno())
+        if hasattr(os, "O_DIRECTORY"):
+            #new segment files must survive a crash too
+            fd = os.open(self.directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def read(self, key, months, count, start=None, end=None):
+        #archived records of account key with start <= timestamp <= end
+        #(datetimes, either may be None), in position order; only positions
+        #below count are archived as far as the snapshot knows
+        prefix = '{"account":' + json.dumps(str(key)) + ","
+        #timestamps are stored to the second, so they compare as text once
+        #start is rounded up to a whole second
+        if start is not None and start.microsecond:
+            start = start.replace(microsecond=0) + timedelta(seconds=1)
+        lo = start.strftime(TIME_FORMAT) if start is not None else None
+        hi = end.strftime(TIME_FORMAT) if end is not None else None
+        found = {}
+        for month in months:
+            if (lo is not None and month < lo[:7]) or (hi is not None and month > hi[:7]):
+                continue
+            with gzip.open(self.path(month), "rt") as f:
+                for line in f:
+                    #every line starts with its account, so other accounts
+                    #are skipped without parsing them
+                    if not line.startswith(prefix):
+                        continue
+                    record = json.loads(line)
+                    position = record.pop("position")
+                    if position >= count or position in found:
+                        continue
+                    timestamp = record["timestamp"]
+                    if (lo is not None and timestamp < lo) or (hi is not None and timestamp > hi):
+                        continue
+                    del record["account"]
+                    found[position] = record
+        return [found[position] for position in sorted(found)]
+
+
+def archive_transactions(archive, policy, accounts):
+    #moves what policy no longer keeps hot from every account into archive
+    now = time.time()
+    lines = {}
+    moved = []
+    for acc in accounts:
+        store = acc.transactions
+        if not policy.due(store, now):
+            continue
+        count = policy.split(store.load(), now)
+        if not count:
+            continue
+        key = str(acc.account_number)
+        months = set()
+        records = islice(store.records(store.archived), count)
+        for position, record in enumerate(records, store.archived):
+            month = record["timestamp"][:7]
+            months.add(month)
+            lines.setdefault(month, []).append(
+                json.dumps({"account": key, "position": position, **record}, separators=(",", ":")))
+        moved.append((store, count, months, key))
+    if not lines:
+        return 0
+    archive.append(lines)
+    for store, count, months, key in moved:
+        store.archive_prefix(count, months, archive, key)
+    return sum(count for _, count, _, _ in moved)
@@ -0,0 +1,538 @@
+#fixed-width binary snapshot format for Bank, read through mmap
+#
+#layout (little-endian):
+#   header          magic, version, account count, offsets of the sections below
+#   names           JSON list of account kinds, transaction types and statuses;
+#                   the one-byte codes in the rest of the file index into it
+#   account table   one fixed-width record per account, sorted by account number
+#   transactions    one columnar segment per account: type codes, status codes,
+#                   amounts in minor units and timestamps, each a packed array
+#   strings         holder names, passwords, operation ids and archive
+#                   headers, referenced by offset and length
+#
+#get_account() and balance lookups binary-search the account table in the
+#mapped file, so opening a snapshot does not parse the whole ledger.
+
+import json
+import mmap
+import os
+import shutil
+import struct
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+from itertools import islice
+
+from bank_system import (Bank, JsonBackend, TransactionStore, _STATUS_CODES,
+                         _STATUS_NAMES, _TYPE_CODES, _TYPE_NAMES, _account_class,
+                         _archive_path, _intern, _make_account, _write_snapshot,
+                         from_units, to_units)
+
+MAGIC = b"BNKB"
+VERSION = 4
+
+#magic, version, account count, names offset, names length, account table
+#offset, strings offset
+HEADER = struct.Struct("<4sHxxIQQQQ")
+#account number, kind code, places, balance in minor units, holder offset,
+#holder length, password offset, password length, transactions offset, count,
+#op ids offset, op ids length, archive offset, archive length. The op ids are
+#a JSON list of [position, op id]; the archive header is the JSON object a
+#JSON snapshot keeps under "archived" (see bank_archive.py). count is the
+#number of transactions in the file, after the archived ones.
+ACCOUNT = struct.Struct("<qBBqQIQIQQQIQI")
+#version 3 has no archive headers
+ACCOUNT_V3 = struct.Struct("<qBBqQIQIQQQI")
+#versions 1 and 2 keep "balance is int" and a double balance where places
+#and the minor units are now, and their transactions have an int flag byte
+#and double amounts; version 1 records have no op ids
+ACCOUNT_V2 = struct.Struct("<qBBdQIQIQQQI")
+ACCOUNT_V1 = struct.Struct("<qBBdQIQIQQ")
+ACCOUNT_NUMBER = struct.Struct("<q")
+NO_PASSWORD = 0xFFFFFFFF
+
+#per transaction: type and status bytes, an int64 amount and a double timestamp
+_TXN_SIZE = 2 + 8 + 8
+_SWAP = sys.byteorder != "little"
+
+
+def _packed(values):
+    if _SWAP and values.itemsize > 1:
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _unpacked(typecode, data):
+    values = array(typecode)
+    values.frombytes(data)
+    if _SWAP and values.itemsize > 1:
+        values.byteswap()
+    return values
+
+
+def write_binary_snapshot(f, accounts):
+    #accounts: iterable of Account/CryptoWallet objects
+    accounts = sorted(accounts, key=lambda acc: int(acc.account_number))
+    kinds = []
+    kind_codes = {}
+    strings = bytearray()
+
+    def add_string(value):
+        if value is None:
+            return 0, NO_PASSWORD
+        data = value.encode("utf-8")
+        offset = len(strings)
+        strings.extend(data)
+        return offset, len(data)
+
+    records = []
+    segments = []
+    txn_offset = 0
+    for acc in accounts:
+        kind = _intern(kinds, kind_codes, acc.get_account_type())
+        store = acc.transactions.load()
+        holder = add_string(acc.holder_name)
+        password = add_string(acc.password)
+        op_ids = add_string(json.dumps(sorted(store._op_ids.items()))) if store._op_ids else (0, 0)
+        archived = store.archive_info()
+        archive = add_string(json.dumps(archived)) if archived else (0, 0)
+        count = len(store.types)
+        records.append((int(acc.account_number), kind, acc.places, acc.units,
+                        holder[0], holder[1], password[0], password[1], txn_offset, count,
+                        op_ids[0], op_ids[1], archive[0], archive[1]))
+        segments.append(store)
+        txn_offset += count * _TXN_SIZE
+
+    #names are only complete once every account kind has been seen
+    names = json.dumps({"kinds": kinds, "types": _TYPE_NAMES, "statuses": _STATUS_NAMES}).encode()
+    names_offset = HEADER.size
+    table_offset = names_offset + len(names)
+    txns_offset = table_offset + ACCOUNT.size * len(records)
+    strings_offset = txns_offset + txn_offset
+
+    f.write(HEADER.pack(MAGIC, VERSION, len(records), names_offset, len(names),
+                        table_offset, strings_offset))
+    f.write(names)
+    for record in records:
+        record = list(record)
+        record[8] += txns_offset
+        f.write(ACCOUNT.pack(*record))
+    for store in segments:
+        f.write(_packed(store.types))
+        f.write(_packed(store.statuses))
+        f.write(_packed(store.amounts))
+        f.write(_packed(store.timestamps))
+    f.write(strings)
+
+
+class BinarySnapshot:
+    def __init__(self, path, archive=None):
+        self.path = path
+        #the TransactionArchive for accounts with archived transactions
+        self.archive = archive
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.count, names_offset, names_length,
+         self._table, self._strings) = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a binary bank snapshot")
+        if version not in (1, 2, 3, VERSION):
+            raise ValueError(f"Unsupported binary snapshot version {version}")
+        self.version = version
+        self._account = {1: ACCOUNT_V1, 2: ACCOUNT_V2, 3: ACCOUNT_V3}.get(version, ACCOUNT)
+
+        names = json.loads(self._map[names_offset:names_offset + names_length])
+        self.kinds = names["kinds"]
+        #translate the file's one-byte codes to this process's codes
+        self._types = self._code_map(names["types"], _TYPE_NAMES, _TYPE_CODES)
+        self._statuses = self._code_map(names["statuses"], _STATUS_NAMES, _STATUS_CODES)
+
+    @staticmethod
+    def _code_map(file_names, names, codes):
+        mapped = [_intern(names, codes, name) for name in file_names]
+        if mapped == list(range(len(mapped))):
+            return None
+        return bytes(mapped + [0] * (256 - len(mapped)))
+
+    def __len__(self):
+        return self.count
+
+    def _number(self, i):
+        return ACCOUNT_NUMBER.unpack_from(self._map, self._table + i * self._account.size)[0]
+
+    def find(self, account_number):
+        #position of the account in the table, or None
+        try:
+            account_number = int(account_number)
+        except (TypeError, ValueError):
+            return None
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._number(mid) < account_number:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count and self._number(lo) == account_number:
+            return lo
+        return None
+
+    def account_numbers(self):
+        for i in range(self.count):
+            yield self._number(i)
+
+    def holders(self):
+        #(account number, holder name) for every account, without building them
+        for i in range(self.count):
+            record = self._record(i)
+            yield record[0], self._string(record[4], record[5])
+
+    def _record(self, i):
+        record = self._account.unpack_from(self._map, self._table + i * self._account.size)
+        if self._account is ACCOUNT_V1:
+            record += (0, 0)
+        if self.version < 4:
+            record += (0, 0)
+        if self.version < 3:
+            #(is int, balance) -> (places, minor units)
+            places = _account_class(self.kinds[record[1]]).places
+            balance = int(record[3]) if record[2] else record[3]
+            record = record[:2] + (places, to_units(balance, places)) + record[4:]
+        return record
+
+    def _string(self, offset, length):
+        if length == NO_PASSWORD:
+            return None
+        start = self._strings + offset
+        return self._map[start:start + length].decode("utf-8")
+
+    def balance(self, account_number):
+        i = self.find(account_number)
+        if i is None:
+            return None
+        _, _, places, units = self._record(i)[:4]
+        return from_units(units, places)
+
+    def account(self, account_number):
+        #builds the account; its history is read from the map on first use
+        i = self.find(account_number)
+        if i is None:
+            return None
+        (number, kind, places, units, holder_offset, holder_length, password_offset, password_length,
+         txn_offset, count, ops_offset, ops_length, archive_offset, archive_length) = self._record(i)
+        acc = _make_account(self.kinds[kind], str(number), self._string(holder_offset, holder_length), 0)
+        acc.units = units
+        acc.password = self._string(password_offset, password_length)
+        if count:
+            acc.transactions = TransactionStore.lazy(
+                count, _Segment(self, txn_offset, count, ops_offset, ops_length, places), places=places)
+        if archive_length:
+            acc.transactions.attach_archive(self.archive, str(number),
+                                            json.loads(self._string(archive_offset, archive_length)))
+        return acc
+
+    def oldest(self, offset, count):
+        #timestamp of the first entry of the history at offset, without reading the rest
+        offset += (2 if self.version >= 3 else 3) * count + 8 * count
+        return struct.unpack_from("<d", self._map, offset)[0]
+
+    def transactions(self, offset, count, ops_offset=0, ops_length=0, places=2):
+        store = TransactionStore(places)
+        m = self._map
+        types = m[offset:offset + count]
+        offset += count
+        statuses = m[offset:offset + count]
+        offset += count
+        if self._types is not None:
+            types = types.translate(self._types)
+        if self._statuses is not None:
+            statuses = statuses.translate(self._statuses)
+        store.types = _unpacked("B", types)
+        store.statuses = _unpacked("B", statuses)
+        if self.version < 3:
+            #older files keep doubles, converted once as they are read
+            int_amounts = m[offset:offset + count]
+            offset += count
+            amounts = _unpacked("d", m[offset:offset + 8 * count])
+            store.amounts = array("q", (to_units(int(amount) if is_int else amount, places)
+                                        for is_int, amount in zip(int_amounts, amounts)))
+        else:
+            store.amounts = _unpacked("q", m[offset:offset + 8 * count])
+        offset += 8 * count
+        store.timestamps = _unpacked("d", m[offset:offset + 8 * count])
+        if ops_length:
+            for position, op_id in json.loads(self._string(ops_offset, ops_length)):
+                store.tag(position, op_id)
+        return store
+
+
+#loads one account's history from the map when TransactionStore.lazy() asks
+class _Segment:
+    def __init__(self, snapshot, offset, count, ops_offset, ops_length, places):
+        self.snapshot = snapshot
+        self.offset = offset
+        self.count = count
+        self.ops_offset = ops_offset
+        self.ops_length = ops_length
+        self.places = places
+
+    def __call__(self):
+        return self.snapshot.transactions(self.offset, self.count, self.ops_offset, self.ops_length, self.places)
+
+    def oldest(self):
+        return self.snapshot.oldest(self.offset, self.count)
+
+
+def _account_key(key):
+    #accounts are kept under int numbers, so "5" and 5 find the same one;
+    #None for a key that is no account number
+    if isinstance(key, int) and not isinstance(key, bool):
+        return key
+    if isinstance(key, str):
+        try:
+            return int(key)
+        except ValueError:
+            return None
+    return None
+
+
+def _state(acc):
+    #what has to match for two copies of an account to be the same
+    return len(acc.transactions), acc.units, acc.password
+
+
+#Bank.accounts for a binary snapshot (or SQLite): accounts are built from the
+#snapshot the first time they are looked up.
+#
+#capacity bounds how many stay built; None keeps every one read. Past it, the
+#least recently used accounts are dropped again, to be rebuilt when they are
+#next used, but only those that still match the snapshot (nothing changed
+#since it was written, or since their last save was stored in it, see
+#stored()) and that no one holds, such as an operation that looked the
+#account up and is about to change it.
+class MappedAccounts(dict):
+    def __init__(self, snapshot, on_load=None, capacity=None, on_evict=None):
+        super().__init__()
+        self.snapshot = snapshot
+        self.on_load = on_load
+        self.capacity = capacity
+        self.on_evict = on_evict
+        self._complete = False
+        self._lock = threading.Lock()
+        self._successor = None #set by hand_over()
+        #with a capacity: numbers built, least recently used first, and
+        #number -> _state() of the account in the snapshot
+        self._recent = OrderedDict()
+        self._states = {}
+
+    def __getitem__(self, key):
+        acc = dict.__getitem__(self, key)
+        if self.capacity is not None:
+            try:
+                self._recent.move_to_end(key)
+            except KeyError:
+                #built just now by __missing__, under another key
+                pass
+        return acc
+
+    def __missing__(self, key):
+        number = _account_key(key)
+        if number is None:
+            raise KeyError(key)
+        #built under a lock so concurrent lookups share one account object
+        with self._lock:
+            if dict.__contains__(self, number):
+                return dict.__getitem__(self, number)
+            if self._successor is not None:
+                return self._successor[number]
+            acc = self.snapshot.account(number)
+            if acc is None:
+                raise KeyError(key)
+            dict.__setitem__(self, number, acc)
+            if self.capacity is not None:
+                self._recent[number] = None
+                self._states[number] = _state(acc)
+                self._evict()
+            if self.on_load:
+                self.on_load(acc)
+            return acc
+
+    def _evict(self):
+        #with _lock held. Only a few of the oldest accounts are looked at;
+        #those that cannot go yet count as used, so the next look goes further
+        excess = dict.__len__(self) - self.capacity
+        if excess <= 0:
+            return
+        for number in list(islice(self._recent, excess + 16)):
+            acc = dict.get(self, number)
+            if acc is not None and self._states.get(number) == _state(acc):
+                dict.__delitem__(self, number)
+                #acc here and in getrefcount(): anything more is a holder
+                if sys.getrefcount(acc) <= 2:
+                    del self._recent[number], self._states[number]
+                    if self.on_evict:
+                        self.on_evict(acc)
+                    excess -= 1
+                    if excess <= 0:
+                        return
+                    continue
+                dict.__setitem__(self, number, acc)
+            self._recent.move_to_end(number)
+
+    def __setitem__(self, key, acc):
+        number = _account_key(key)
+        if number is None:
+            raise KeyError(key)
+        dict.__setitem__(self, number, acc)
+        if self.capacity is not None:
+            #a new account is not in the snapshot, so it is never dropped
+            self._recent[number] = None
+
+    def __contains__(self, key):
+        number = _account_key(key)
+        if number is None:
+            return False
+        return dict.__contains__(self, number) or self.snapshot.find(number) is not None
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def stored(self, states):
+        #{account number: _state()} the snapshot holds now, for a snapshot
+        #that is written to as accounts are saved
+        if self.capacity is not None:
+            for key, state in states.items():
+                number = _account_key(key)
+                if dict.__contains__(self, number):
+                    self._states[number] = state
+
+    def adopt(self, accounts, states):
+        #takes over accounts (a dict) built from an older snapshot; states:
+        #{account number: _state()} of those this snapshot holds. The entries
+        #are copied as they are: going through a MappedAccounts would build
+        #the accounts it dropped, under the lock hand_over() holds
+        dict.update(self, dict.items(accounts))
+        if self.capacity is not None:
+            for number in dict.keys(accounts):
+                self._recent[number] = None
+                if number in states:
+                    self._states[number] = states[number]
+
+    def hand_over(self, accounts, states):
+        #moves the accounts built so far to accounts, the map of a newer
+        #snapshot, which from then on answers the lookups that miss here
+        with self._lock:
+            accounts.adopt(self, states)
+            #accounts holds them now; lookups that miss go there
+            dict.clear(self)
+            self._recent.clear()
+            self._states.clear()
+            self._successor = accounts
+
+    def trim(self):
+        #drops the clean accounts over capacity, for when many were saved at once
+        if self.capacity is not None:
+            with self._lock:
+                self._evict()
+
+    def loaded(self):
+        #accounts already built, without reading the rest of the table
+        return list(dict.values(self))
+
+    def _numbers(self):
+        #every account number: the snapshot's, then the ones created since
+        numbers = list(self.snapshot.account_numbers())
+        known = set(numbers)
+        numbers.extend(number for number in list(dict.keys(self)) if number not in known)
+        return numbers
+
+    def _load_all(self):
+        if not self._complete:
+            for number in self.snapshot.account_numbers():
+                if not dict.__contains__(self, number):
+                    self[number]
+            self._complete = True
+
+    #with a capacity, going over every account builds them one at a time
+    #instead of keeping them all
+    def __len__(self):
+        if self.capacity is not None:
+            return len(self._numbers())
+        self._load_all()
+        return dict.__len__(self)
+
+    def __iter__(self):
+        if self.capacity is not None:
+            return iter(self._numbers())
+        self._load_all()
+        return dict.__iter__(self)
+
+    def keys(self):
+        if self.capacity is not None:
+            return self._numbers()
+        self._load_all()
+        return dict.keys(self)
+
+    def values(self):
+        if self.capacity is not None:
+            return (self[number] for number in self._numbers())
+        self._load_all()
+        return dict.values(self)
+
+    def items(self):
+        if self.capacity is not None:
+            return ((number, self[number]) for number in self._numbers())
+        self._load_all()
+        return dict.items(self)
+
+
+def json_to_binary(json_path, binary_path):
+    #converts a bank_data.json snapshot (plus its journal) to the binary
+    #format; the source is only read, passwords are left as they are
+    bank = Bank(None)
+    source = JsonBackend(json_path)
+    try:
+        source.read(bank)
+        _copy_archive(json_path, binary_path)
+        with open(binary_path, "wb") as f:
+            write_binary_snapshot(f, bank.accounts.values())
+    finally:
+        source.close()
+        bank.close()
+
+
+def binary_to_json(binary_path, json_path):
+    #converts a binary snapshot to the layout written by Bank.save_data()
+    snapshot = BinarySnapshot(binary_path)
+    accounts = ((number, snapshot.account(number)) for number in snapshot.account_numbers())
+    _copy_archive(binary_path, json_path)
+    with open(json_path, "wb") as f:
+        _write_snapshot(f, accounts)
+
+
+def _copy_archive(source, target):
+    #archived transactions stay in the source's archive; the converted
+    #snapshot reads them from its own. An archive already there belongs to
+    #some other ledger and is not overwritten (FileExistsError)
+    source, target = _archive_path(source), _archive_path(target)
+    if os.path.isdir(source) and os.path.abspath(source) != os.path.abspath(target):
+        shutil.copytree(source, target)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert bank snapshots between JSON and binary")
+    parser.add_argument("source")
+    parser.add_argument("target")
+    parser.add_argument("--to", choices=["binary", "json"], required=True)
+    args = parser.parse_args()
+    if args.to == "binary":
+        json_to_binary(args.source, args.target)
+    else:
+        binary_to_json(args.source, args.target)
@@ -0,0 +1,400 @@
+#streaming import and export of accounts and transaction histories as CSV or
+#JSON Lines, for moving a ledger between systems without the menu
+#
+#   python bank_bulk.py export accounts accounts.csv --file bank_data.json
+#   python bank_bulk.py export transactions transactions.jsonl --file bank_data.json
+#   python bank_bulk.py import accounts accounts.csv --file new_data.json --history
+#   python bank_bulk.py import transactions transactions.jsonl --file new_data.json
+#
+#the format follows the file extension (.csv or .jsonl) unless --format is
+#given. Columns:
+#
+#   accounts       account_number, account_type, holder_name, balance, password
+#   transactions   account_number, position, type, amount, status, timestamp, op_id
+#
+#rows go through generators one at a time (read -> validate -> write), so
+#memory does not grow with the file. Exports read each account's history
+#without keeping it loaded, archived entries included.
+#
+#imported accounts are checked with the same rules as Bank.create_account():
+#known account type, unused account number (in the bank or earlier in the
+#file), and the $500 minimum for business accounts. Passwords may be hashes,
+#as exported, or plaintext, which is hashed on the way in (and is as slow as
+#the hasher is). With --history no OpeningDeposit is recorded, because the
+#account's history, opening deposit included, follows in a transactions file.
+#imported transactions are added to the history as they are and do not move
+#balances; afterwards the fees missing from checking histories exported before
+#fees were recorded are added (Bank.add_missing_fees()) and every account that
+#got some is reconciled. A row whose
+#position is already in the history is skipped, so an interrupted import can
+#simply be run again.
+#
+#accepted rows are saved batch_size at a time (one journal record per batch).
+#rejected rows are counted and, with --rejects, written to a JSON Lines file
+#with their line number and the reason.
+
+import argparse
+import csv
+import json
+import sys
+import time
+from datetime import datetime
+from decimal import Decimal
+
+from bank_system import (_STATUS_CODES, _TYPE_CODES, Bank, NullSink, _json_amount, _make_account,
+                         parse_amount, set_event_sink, to_units)
+
+ACCOUNT_FIELDS = ["account_number", "account_type", "holder_name", "balance", "password"]
+TRANSACTION_FIELDS = ["account_number", "position", "type", "amount", "status", "timestamp", "op_id"]
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def file_format(path, format=None):
+    if format is not None:
+        return format
+    if path.endswith(".csv"):
+        return "csv"
+    if path.endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    raise ValueError(f"Cannot tell the format of {path}; use .csv or .jsonl, or pass a format")
+
+
+def read_rows(path, format=None):
+    #(line number, row) for every row; a row is a dict, or None if the line
+    #is not valid JSON. CSV values are strings; JSON numbers with a fraction
+    #are read as Decimals, so amounts stay exact
+    format = file_format(path, format)
+    with open(path, newline="") as f:
+        if format == "csv":
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+            return
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line, parse_float=Decimal)
+            except ValueError:
+                row = None
+            yield line_number, row if isinstance(row, dict) else None
+
+
+def write_rows(path, rows, fields, format=None, progress=None):
+    #writes rows (dicts with the given fields) and returns how many
+    format = file_format(path, format)
+    meter = _Meter(progress)
+    with open(path, "w", newline="") as f:
+        if format == "csv":
+            writer = csv.DictWriter(f, fields, extrasaction="ignore")
+            writer.writeheader()
+            write = writer.writerow
+        else:
+            encode = json.JSONEncoder(separators=(",", ":")).encode
+            write = lambda row: f.write(encode(row) + "\n")
+        for row in rows:
+            write(row)
+            meter.tick()
+    return meter.done()
+
+
+def _accounts(bank):
+    #every account, without building and keeping the ones a binary snapshot
+    #or SQLite has not read yet
+    accounts = bank.accounts
+    snapshot = getattr(accounts, "snapshot", None)
+    if snapshot is None:
+        yield from accounts.values()
+        return
+    loaded = {str(acc.account_number): acc for acc in accounts.loaded()}
+    for number in snapshot.account_numbers():
+        acc = loaded.pop(str(number), None)
+        yield acc if acc is not None else snapshot.account(number)
+    #created since the snapshot was written
+    yield from loaded.values()
+
+
+def _kind(acc):
+    #"Savings Account" -> "savings", as create_account() takes it
+    return acc.get_account_type().split()[0].lower()
+
+
+def account_rows(bank):
+    for acc in _accounts(bank):
+        yield {
+            "account_number": int(acc.account_number),
+            "account_type": _kind(acc),
+            "holder_name": acc.holder_name,
+            "balance": _json_amount(acc.units, acc.places),
+            "password": acc.password,
+        }
+
+
+def transaction_rows(bank):
+    for acc in _accounts(bank):
+        number = int(acc.account_number)
+        for position, record in enumerate(acc.transactions.export_records()):
+            yield {"account_number": number, "position": position, **record}
+
+
+def export_accounts(bank, path, format=None, progress=None):
+    return write_rows(path, account_rows(bank), ACCOUNT_FIELDS, format, progress)
+
+
+def export_transactions(bank, path, format=None, progress=None):
+    return write_rows(path, transaction_rows(bank), TRANSACTION_FIELDS, format, progress)
+
+
+#reports progress to progress(rows, rejected, seconds) at most every interval
+#seconds, and once more at the end
+class _Meter:
+    def __init__(self, progress, interval=1.0):
+        self.progress = progress
+        self.interval = interval
+        self.rows = 0
+        self.rejected = 0
+        self.start = time.perf_counter()
+        self._next = self.start + interval
+
+    def tick(self, rejected=False):
+        self.rows += 1
+        self.rejected += rejected
+        #checking the clock on every row would cost more than the row
+        if self.progress is not None and self.rows % 1024 == 0:
+            now = time.perf_counter()
+            if now >= self._next:
+                self._next = now + self.interval
+                self.progress(self.rows, self.rejected, now - self.start)
+
+    def done(self):
+        if self.progress is not None:
+            self.progress(self.rows, self.rejected, time.perf_counter() - self.start)
+        return self.rows
+
+
+def _text(row, field):
+    value = row.get(field)
+    if value is None or not str(value).strip():
+        raise ValueError(f"Missing {field}.")
+    return str(value)
+
+
+def _amount(value):
+    if isinstance(value, str):
+        return parse_amount(value)
+    if isinstance(value, bool) or not isinstance(value, (int, Decimal)):
+        raise ValueError(f"Not an amount: {value!r}")
+    return value
+
+
+def _account_number(row):
+    value = row.get("account_number")
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    raise ValueError("Account number must be numeric.")
+
+
+def _new_account(bank, row, history):
+    #the account a row describes, checked like create_account(); ValueError
+    #with the reason otherwise
+    number = _account_number(row)
+    #the data file's "Savings Account" reads as "savings"
+    account_type = _text(row, "account_type").split()[0]
+    holder = _text(row, "holder_name")
+    balance = _amount(row.get("balance") or 0)
+    if balance < 0:
+        raise ValueError("Opening balance cannot be negative.")
+    refused = bank._refuse_account(account_type, number, balance)
+    if refused is not None:
+        _, message, fields = refused
+        raise ValueError(message.format(account=number, **fields))
+    password = _text(row, "password")
+    if not bank.password_hasher.is_hash(password):
+        password = bank.password_hasher.hash(password)
+
+    account = _make_account(account_type, number, holder, balance)
+    account.password = password
+    if account.units > 0 and not history:
+        account.transactions.add_units("OpeningDeposit", account.units, "Success")
+    return account
+
+
+def _add_transaction(bank, row):
+    #adds the entry a row describes to its account's history and returns the
+    #account, or None if that position is already there; ValueError otherwise
+    number = _account_number(row)
+    acc = bank.accounts.get(number)
+    if acc is None:
+        raise ValueError("Account not found.")
+    type = _text(row, "type")
+    if type not in _TYPE_CODES:
+        raise ValueError(f"Unknown transaction type {type!r}.")
+    status = _text(row, "status")
+    if status not in _STATUS_CODES:
+        raise ValueError(f"Unknown transaction status {status!r}.")
+    units = to_units(_amount(row.get("amount")), acc.places)
+    try:
+        timestamp = datetime.strptime(_text(row, "timestamp"), TIME_FORMAT)
+    except ValueError:
+        raise ValueError(f"Invalid timestamp {row.get('timestamp')!r}; expected {TIME_FORMAT}.") from None
+    op_id = row.get("op_id") or None
+
+    with bank._locked(number):
+        store = acc.transactions
+        position = row.get("position")
+        if position is not None and position != "":
+            position = int(position)
+            if position < len(store):
+                return None
+            if position > len(store):
+                raise ValueError(f"Position {position} leaves a gap; the history has {len(store)} entries.")
+        store.add_units(type, units, status, timestamp)
+        if op_id is not None:
+            store.tag(len(store) - 1, str(op_id))
+    return acc
+
+
+class _Rejects:
+    #rejected rows with their line number and reason, as JSON lines
+    def __init__(self, path):
+        self._file = open(path, "w") if path else None
+
+    def add(self, line, row, error):
+        if self._file is not None:
+            self._file.write(json.dumps({"line": line, "error": error, "row": row}, default=str) + "\n")
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+def import_accounts(bank, path, format=None, history=False, batch_size=10_000, rejects=None, progress=None):
+    #creates the accounts in a file; returns {"rows", "imported", "rejected"}
+    meter = _Meter(progress)
+    rejected = _Rejects(rejects)
+    batch = []
+    imported = 0
+    try:
+        with bank._bulk_indexing():
+            for line, row in read_rows(path, format):
+                try:
+                    if row is None:
+                        raise ValueError("Not a JSON object.")
+                    account = _new_account(bank, row, history)
+                    if not bank._insert_account(account):
+                        raise ValueError(f"Account number {account.account_number} already exists.")
+                except ValueError as e:
+                    rejected.add(line, row, str(e))
+                    meter.tick(rejected=True)
+                    continue
+                batch.append(account)
+                meter.tick()
+                if len(batch) >= batch_size:
+                    bank.save_data(*batch)
+                    imported += len(batch)
+                    batch = []
+            if batch:
+                bank.save_data(*batch)
+                imported += len(batch)
+    finally:
+        rejected.close()
+    meter.done()
+    return {"rows": meter.rows, "imported": imported, "rejected": meter.rejected}
+
+
+def import_transactions(bank, path, format=None, batch_size=10_000, rejects=None, progress=None):
+    #adds the transactions in a file to their accounts' histories; returns
+    #{"rows", "imported", "skipped", "rejected", "fees_added", "unreconciled"},
+    #where fees_added lists the accounts Bank.add_missing_fees() fixed and
+    #unreconciled is what Bank.reconcile() reports for the accounts touched
+    meter = _Meter(progress)
+    rejected = _Rejects(rejects)
+    batch = {}
+    pending = imported = skipped = 0
+    touched = set()
+    try:
+        for line, row in read_rows(path, format):
+            try:
+                if row is None:
+                    raise ValueError("Not a JSON object.")
+                acc = _add_transaction(bank, row)
+            except ValueError as e:
+                rejected.add(line, row, str(e))
+                meter.tick(rejected=True)
+                continue
+            meter.tick()
+            if acc is None:
+                skipped += 1
+                continue
+            #loaded accounts carry their number as a string; the bank's keys are ints
+            batch[int(acc.account_number)] = acc
+            pending += 1
+            if pending >= batch_size:
+                bank.save_data(*batch.values())
+                touched.update(batch)
+                imported += pending
+                batch, pending = {}, 0
+        if batch:
+            bank.save_data(*batch.values())
+            touched.update(batch)
+            imported += pending
+    finally:
+        rejected.close()
+    meter.done()
+    #histories exported before fees were recorded lack them
+    fees_added = bank.add_missing_fees(*touched) if touched else []
+    return {"rows": meter.rows, "imported": imported, "skipped": skipped, "rejected": meter.rejected,
+            "fees_added": fees_added, "unreconciled": bank.reconcile(*touched) if touched else []}
+
+
+def _print_progress(rows, rejected, seconds):
+    rate = rows / seconds if seconds else 0
+    print(f"\r{rows:,} rows ({rejected:,} rejected), {rate:,.0f} rows/s", end="", file=sys.stderr, flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import and export accounts and transactions as CSV or JSON Lines")
+    parser.add_argument("action", choices=("import", "export"))
+    parser.add_argument("kind", choices=("accounts", "transactions"))
+    parser.add_argument("path", help="CSV (.csv) or JSON Lines (.jsonl) file")
+    parser.add_argument("--file", default="bank_data.json", help="bank data file")
+    parser.add_argument("--storage", choices=("json", "binary", "sqlite"), default="json")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="instead of guessing from the extension")
+    parser.add_argument("--history", action="store_true",
+                        help="accounts only: record no opening deposit, the history is imported separately")
+    parser.add_argument("--batch-size", type=int, default=10_000, help="rows saved per batch")
+    parser.add_argument("--rejects", help="write rejected rows here as JSON lines")
+    parser.add_argument("--quiet", action="store_true", help="no progress output")
+    args = parser.parse_args(argv)
+
+    if args.storage == "sqlite":
+        from bank_sqlite import SqliteBackend
+        bank = Bank(storage=SqliteBackend(args.file))
+    else:
+        bank = Bank(args.file, lazy=True, snapshot_format=args.storage)
+    #one message per row would drown the progress line
+    set_event_sink(NullSink())
+    progress = None if args.quiet else _print_progress
+    try:
+        if args.action == "export":
+            export = export_accounts if args.kind == "accounts" else export_transactions
+            rows = export(bank, args.path, args.format, progress)
+            summary = {"rows": rows}
+        elif args.kind == "accounts":
+            summary = import_accounts(bank, args.path, args.format, args.history, args.batch_size, args.rejects,
+                                      progress)
+        else:
+            summary = import_transactions(bank, args.path, args.format, args.batch_size, args.rejects, progress)
+            summary["unreconciled"] = [acc_num for acc_num, _, _ in summary["unreconciled"]]
+    finally:
+        bank.close()
+    if progress is not None:
+        print(file=sys.stderr)
+    print(json.dumps(summary))
+    return 1 if summary.get("rejected") or summary.get("unreconciled") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+#command line interface for the banking system; the core lives in bank_system.py
+#
+#usage: python bank_cli.py [--file bank_data.json]
+
+import argparse
+
+from bank_system import Bank, parse_amount
+
+#Main Menu
+
+def MENU(file="bank_data.json"):
+    bank = Bank(file, lazy=True)
+    #account number -> session token, so the password is asked for (and
+    #hashed) once per account rather than on every operation
+    sessions = {}
+    print("Welcome to the Banking System")
+
+    while True:
+        print("Main Menu:")
+        print("1. Create new account (savings/checking/business/crypto)")
+        print("2. Deposit funds")
+        print("3. Withdraw funds")
+        print("4. Transfer funds between accounts")
+        print("5. View account details")
+        print("6. Display all accounts")
+        print("7. Exit")
+
+        choice = input("Choose an option (1-7): ").strip()
+
+        if choice == "1":
+            while True:
+                acct_type = input("Enter account type (savings/checking/business/crypto): ").strip().lower()
+
+                #Check for valid choice:
+                if acct_type in ["savings", "checking", "business", "crypto"]:
+                    break
+                else:
+                    print("Invalid account type. Please enter one of: savings, checking, business, or crypto.")
+                
+            try:
+                #Loop until the user enters a valid input
+                while True:
+                    acct_num_input = input("Enter account number (numeric): ").strip()
+
+                    if not acct_num_input.isdigit():
+                        print("Account number must be numeric.")
+                        continue
+                    acct_num = int(acct_num_input)
+                    
+                    #check if account number already exists
+                    if acct_num in bank.accounts:
+                        print(f"Account number {acct_num} already exists. Please use a different number.")
+                        continue
+                    break
+                holder = input("Enter holder name: ").strip()
+                while True:
+                    try:
+                        opening = parse_amount(input("Enter opening balance (>= 0): "))
+                        if opening < 0:
+                            print("Opening balance cannot be negative.")
+                            continue
+                        break
+                    except ValueError:
+                        print("Invalid input. Please enter a number")
+                        
+                bank.create_account(acct_type, acct_num, holder, opening)
+
+                #ask if user wants to continue
+                again = input("Do you want to continue? (y/n): ").strip().lower()
+                if again != "y":
+                    print("Goodbye!")
+                    break
+
+            except ValueError:
+                print("Invalid input. Please enter numbers for account number and balance.")
+
+        elif choice == "2":
+            try:
+                acct_num = int(input("Account number: ").strip())
+                amount = parse_amount(input("Deposit amount (> 0): "))
+                if amount <= 0:
+                    print("Amount must be greater than 0.")
+                    continue
+                acc = bank.session_account(sessions.get(acct_num), acct_num)
+                if acc is None:
+                    token = bank.login(acct_num)
+                    if token:
+                        sessions[acct_num] = token
+                        acc = bank.session_account(token, acct_num)
+                if acc:
+                    bank.deposit(acct_num, amount)
+                
+                again = input("Do you want to continue? (y/n): ").strip().lower()
+                if again != "y":
+                    print("Goodbye!")
+                    break
+
+            except ValueError:
+                print("Invalid input. Please enter numeric values.")
+
+        elif choice == "3":
+            try:
+                acct_num = int(input("Account number: ").strip())
+                while True:
+                    #Loop until a valid input is entered
+                    try:
+                        amount = parse_amount(input("Withdrawal amount (> 0): "))
+                        if amount <= 0:
+                            print("Amount must be greater than 0.")
+                            continue
+                        break
+                    except ValueError:
+                        print("Invalid input")
+
+                    
+                bank.withdraw(acct_num, amount)
+
+                again = input("Do you want to continue? (y/n): ").strip().lower()
+                if again != "y":
+                    print("Goodbye!")
+                    break
+
+            except ValueError:
+                print("Invalid input. Please enter numeric values.")
+
+        elif choice == "4":
+            try:
+                from_num = int(input("From account number: ").strip())
+                to_num = int(input("To account number: ").strip())
+                while True:
+                    try:
+                        amount = parse_amount(input("Transfer amount (> 0): "))
+                        if amount <= 0:
+                            print("Amount must be greater than 0.")
+                            continue
+                        break
+                    except ValueError:
+                        print("Invalid input.")
+                
+                bank.transfer_funds(from_num, to_num, amount)
+
+                #ask if user wants to continue
+                again = input("Do you want to continue? (y/n): ").strip().lower()
+                if again != "y":
+                    print("Goodbye!")
+                    break
+
+            except ValueError:
+                print("Invalid input. Please enter numeric values.")
+
+        elif choice == "5":
+            try:
+                acct_num = int(input("Account number: ").strip())
+                acc = bank.get_account(acct_num)
+                if acc:
+                    print(f"{acc.get_account_type()} | Account Number: {acc.account_number} | Holder: {acc.holder_name} | Balance: ${acc.balance}")
+                    print("\nRecent Transactions:")
+                    if not acc.transactions:
+                        print("No transactions yet.")
+                    else:
+                        for t in acc.transactions[-10:]:
+                            print(t)
+                #ask if user wants to continue even if account not found
+                again =  input("Do you want to continue? (y/n): ").strip().lower()
+                if again != "y":
+                    print("Goodbye!")
+                    break 
+
+            except ValueError:
+                print("Invalid input.")
+
+        elif choice == "6":
+            bank.display_all_accounts()
+            again = input("Do you want to continue? (y/n): ").strip().lower()
+            if again != "y":
+                print("Goodbye!")
+                break
+
+        elif choice == "7":
+            print("Goodbye!")
+            break
+
+        else:
+            print("Invalid option. Please choose 1-7.")
+
+    bank.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Interactive banking system")
+    parser.add_argument("--file", default="bank_data.json", help="data file to load and save")
+    args = parser.parse_args(argv)
+    MENU(args.file)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,253 @@
+#opt-in counters and latency histograms for Bank
+#
+#   metrics = Metrics()
+#   bank = Bank("bank_data.json", metrics=metrics)
+#   ...
+#   print(metrics.to_prometheus())       #Prometheus text format
+#   json.dumps(metrics.to_json())        #the same numbers as a dict
+#
+#instrument() shadows deposit, withdraw, transfer_funds, apply_batch,
+#save_data and load_data with timed versions on that one Bank instance, and
+#wraps storage.write to count bytes and storage.compact to time every
+#compaction, including the ones save_data starts in the background, so a bank
+#created without metrics runs exactly the code it ran before.
+#
+#the ops of a batch are counted one by one but timed as a batch. Account
+#methods called directly (acc.deposit() and the like) bypass the Bank and are
+#not counted; bank_cli.py goes through the Bank for that reason.
+
+import threading
+import time
+from bisect import bisect_left
+from functools import partial, wraps
+
+from bank_system import _batch_op
+
+#upper bounds in seconds, from 5 microseconds to 10 seconds
+LATENCY_BUCKETS = (5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+#upper bounds in bytes, from 64 bytes to 16 MiB
+SIZE_BUCKETS = tuple(64 * 4 ** i for i in range(10))
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {} #label values -> count
+
+    def inc(self, labels=(), amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def lines(self):
+        for labels, value in sorted(self.values.items()):
+            yield f"{self.name}{_labels(self.labels, labels)} {value}"
+
+    def samples(self):
+        return [{"labels": dict(zip(self.labels, labels)), "value": value}
+                for labels, value in sorted(self.values.items())]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, labels=(), value=0):
+        self.values[labels] = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.values = {} #label values -> [count per bucket (last is +Inf), sum]
+
+    def observe(self, value, labels=()):
+        series = self.values.get(labels)
+        if series is None:
+            series = self.values[labels] = [[0] * (len(self.buckets) + 1), 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def lines(self):
+        for labels, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_labels(self.labels, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labels, labels)} {total}"
+            yield f"{self.name}_count{_labels(self.labels, labels)} {cumulative}"
+
+    def samples(self):
+        samples = []
+        for labels, (counts, total) in sorted(self.values.items()):
+            samples.append({
+                "labels": dict(zip(self.labels, labels)),
+                "count": sum(counts),
+                "sum": total,
+                #per-bucket counts, not cumulative; the last bucket is +Inf
+                "buckets": dict(zip([str(bound) for bound in self.buckets] + ["+Inf"], counts)),
+            })
+        return samples
+
+
+#apply_batch op kinds under the names of the Bank methods they match
+_BATCH_OPS = {"deposit": "deposit", "withdraw": "withdraw", "transfer": "transfer_funds", "interest": "interest"}
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.operations = Counter("bank_operations_total", "Bank operations by result",
+                                  ("op", "account_type", "status"))
+        self.latency = Histogram("bank_operation_seconds", "Latency of Bank operations",
+                                 ("op", "account_type", "status"))
+        self.save_seconds = Histogram("bank_save_seconds", "Latency of Bank.save_data")
+        self.save_bytes = Histogram("bank_save_bytes", "Bytes written to storage per save", buckets=SIZE_BUCKETS)
+        self.load_seconds = Histogram("bank_load_seconds", "Latency of Bank.load_data")
+        self.batch_seconds = Histogram("bank_batch_seconds", "Latency of Bank.apply_batch")
+        self.compact_seconds = Histogram("bank_compact_seconds", "Latency of compactions, background ones included")
+        self.accounts = Gauge("bank_loaded_accounts", "Accounts in memory after load_data")
+        self._all = (self.operations, self.latency, self.batch_seconds, self.save_seconds, self.save_bytes,
+                     self.load_seconds, self.compact_seconds, self.accounts)
+
+    def instrument(self, bank):
+        #replaces the hot methods of this one bank with timed versions
+        for op in ("deposit", "withdraw", "transfer_funds"):
+            setattr(bank, op, partial(self._operation, bank, op, getattr(bank, op)))
+        bank.apply_batch = partial(self._batch, bank, bank.apply_batch)
+        if bank.storage is None:
+            #an in-memory bank has nothing to save or load
+            return
+        bank.save_data = self._timed(self.save_seconds, bank.save_data)
+        bank.storage.write = self._counted_write(bank.storage.write)
+        bank.storage.compact = self._timed_compact(bank.storage.compact)
+
+        load_data = self._timed(self.load_seconds, bank.load_data)
+
+        @wraps(load_data)
+        def load_and_count():
+            load_data()
+            with self._lock:
+                self.accounts.set(value=len(bank._loaded_accounts()))
+        bank.load_data = load_and_count
+
+    def _operation(self, bank, op, method, account_number, *args, **kwargs):
+        start = time.perf_counter()
+        ok = method(account_number, *args, **kwargs)
+        elapsed = time.perf_counter() - start
+        account = bank.accounts.get(account_number)
+        labels = (op, account.get_account_type() if account is not None else "unknown",
+                  "success" if ok else "failure")
+        with self._lock:
+            self.operations.inc(labels)
+            self.latency.observe(elapsed, labels)
+        return ok
+
+    def _batch(self, bank, method, ops, *args, **kwargs):
+        ops = list(ops)
+        start = time.perf_counter()
+        results = method(ops, *args, **kwargs)
+        elapsed = time.perf_counter() - start
+        counts = {}
+        for op, result in zip(ops, results):
+            try:
+                kind, accounts, _, _ = _batch_op(op)
+                op_name = _BATCH_OPS.get(kind, "invalid")
+                account = bank.accounts.get(accounts[0])
+            except (TypeError, ValueError, IndexError):
+                op_name, account = "invalid", None
+            labels = (op_name,
+                      account.get_account_type() if account is not None else "unknown",
+                      "success" if result["ok"] else "failure")
+            counts[labels] = counts.get(labels, 0) + 1
+        with self._lock:
+            self.batch_seconds.observe(elapsed)
+            for labels, count in counts.items():
+                self.operations.inc(labels, count)
+        return results
+
+    def _timed(self, histogram, method):
+        @wraps(method)
+        def timed(*args):
+            start = time.perf_counter()
+            try:
+                return method(*args)
+            finally:
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    histogram.observe(elapsed)
+        return timed
+
+    def _timed_compact(self, compact):
+        #a compaction copies the accounts while they are locked, then writes
+        #the snapshot from the function it returns, which Bank may call on
+        #its compactor thread; both parts are timed together
+        @wraps(compact)
+        def timed(bank):
+            start = time.perf_counter()
+            try:
+                finish = compact(bank)
+            except BaseException:
+                self._observe(self.compact_seconds, time.perf_counter() - start)
+                raise
+            copied = time.perf_counter() - start
+            if finish is None:
+                self._observe(self.compact_seconds, copied)
+                return None
+
+            def timed_finish():
+                start = time.perf_counter()
+                try:
+                    return finish()
+                finally:
+                    self._observe(self.compact_seconds, copied + time.perf_counter() - start)
+            return timed_finish
+        return timed
+
+    def _observe(self, histogram, value):
+        with self._lock:
+            histogram.observe(value)
+
+    def _counted_write(self, write):
+        #backends that know what they wrote return the byte count
+        @wraps(write)
+        def counted(record):
+            written = write(record)
+            if written is not None:
+                with self._lock:
+                    self.save_bytes.observe(written)
+            return written
+        return counted
+
+    def to_prometheus(self):
+        lines = []
+        with self._lock:
+            for metric in self._all:
+                lines.append(f"# HELP {metric.name} {metric.help}")
+                lines.append(f"# TYPE {metric.name} {metric.kind}")
+                lines.extend(metric.lines())
+        return "\n".join(lines) + "\n"
+
+    def to_json(self):
+        with self._lock:
+            return {metric.name: {"type": metric.kind, "help": metric.help, "samples": metric.samples()}
+                    for metric in self._all}
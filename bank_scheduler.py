@@ -0,0 +1,259 @@
+#scheduled and recurring operations for a Bank: standing orders, sweeps,
+#regular deposits and interest postings on savings accounts
+#
+#   scheduler = Scheduler(bank, "bank_data.schedule")
+#   scheduler.add({"op": "transfer", "from": 101, "to": 102, "amount": 50}, every="monthly", count=12)
+#   scheduler.add({"op": "interest", "account": 101, "rate": 0.04 / 12}, every="monthly")
+#   scheduler.add({"op": "deposit", "account": 103, "amount": 20}, every="weekly", start=datetime(2025, 1, 6, 9))
+#   scheduler.tick()      # applies whatever is due now
+#   scheduler.run(stop)   # or keeps ticking until stop (a threading.Event) is set
+#
+#jobs take the operations of Bank.apply_batch(). A job has a start time, an
+#interval (seconds, or "daily", "weekly" or "monthly") and optionally a number
+#of runs. Run n is due at start plus n intervals; monthly runs fall on the
+#start's day of the month, or the last day of shorter months, so schedules
+#never drift.
+#
+#the next run of every job sits in a heap ordered by due time. A tick pops
+#only the runs that are due, however many jobs there are, and applies them
+#batch_size at a time with apply_batch(atomic=False): one save per batch, and
+#a failed run (a standing order without funds, say) is recorded like any
+#failed operation while the job carries on.
+#
+#after downtime the next tick catches up: every missed run is applied, in
+#order. A job added with catch_up=False runs once for everything it missed
+#and continues with its first run after now.
+#
+#jobs and their progress are kept in a journal at path. Each run is applied
+#with op id "<job id>:<run>" and the bank is flushed before the progress is
+#written, so a run repeated after a crash is recognised by the bank as
+#already applied. clock returns the time in seconds since the epoch and can
+#be replaced, for example to test a schedule without waiting for it.
+
+import calendar
+import heapq
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from decimal import Decimal
+
+from bank_system import Journal, _batch_op, _is_amount
+
+PERIODS = {"daily": 86400, "weekly": 7 * 86400}
+
+
+class Job:
+    def __init__(self, job_id, seq, op, every, start, count=None, catch_up=True, run=0):
+        self.id = job_id
+        self.seq = seq #order of adding; runs due at the same time go in this order
+        self.op = op #an apply_batch dict op, without op_id
+        self.every = every #seconds, or "monthly"
+        self.start = start #seconds since the epoch
+        self.count = count #number of runs, or None for no end
+        self.catch_up = catch_up
+        self.run = run #the next run to apply
+
+    def due(self, run):
+        #when run n is due, in seconds since the epoch
+        if self.every != "monthly":
+            return self.start + run * self.every
+        start = datetime.fromtimestamp(self.start)
+        month = start.month - 1 + run
+        year, month = start.year + month // 12, month % 12 + 1
+        day = min(start.day, calendar.monthrange(year, month)[1])
+        return start.replace(year=year, month=month, day=day).timestamp()
+
+    def finished(self, run):
+        return self.count is not None and run >= self.count
+
+    def record(self):
+        #amounts and rates are written as decimal strings, so they stay exact
+        op = {key: str(value) if isinstance(value, Decimal) else value for key, value in self.op.items()}
+        return {"id": self.id, "seq": self.seq, "op": op, "every": self.every, "start": self.start,
+                "count": self.count, "catch_up": self.catch_up, "run": self.run}
+
+    @classmethod
+    def from_record(cls, record):
+        op = dict(record["op"])
+        key = "rate" if op["op"] == "interest" else "amount"
+        op[key] = Decimal(op[key])
+        return cls(record["id"], record["seq"], op, record["every"], record["start"], record["count"],
+                   record["catch_up"], record["run"])
+
+
+def _normalized(op):
+    #op as a dict with an exact amount; ValueError if apply_batch could never run it
+    try:
+        kind, accounts, amount, op_id = _batch_op(op)
+    except (TypeError, ValueError, IndexError):
+        raise ValueError(f"Invalid operation: {op!r}") from None
+    if (kind not in ("deposit", "withdraw", "transfer", "interest")
+            or len(accounts) != (2 if kind == "transfer" else 1)):
+        raise ValueError(f"Invalid operation: {op!r}")
+    if not _is_amount(amount):
+        raise ValueError("Rate must be greater than 0." if kind == "interest" else "Amount must be greater than 0.")
+    if op_id is not None:
+        raise ValueError("Scheduled operations get their op ids from the scheduler.")
+    amount = Decimal(repr(amount)) if type(amount) is float else Decimal(amount)
+    if kind == "transfer":
+        return {"op": kind, "from": accounts[0], "to": accounts[1], "amount": amount}
+    return {"op": kind, "account": accounts[0], "rate" if kind == "interest" else "amount": amount}
+
+
+class Scheduler:
+    def __init__(self, bank, path=None, clock=time.time, batch_size=1000):
+        #bank: a Bank or a ShardedBank; path: where jobs are kept, or None to
+        #keep them in memory only
+        self.bank = bank
+        self.path = path
+        self.clock = clock
+        self.batch_size = batch_size
+        self.jobs = {} #job id -> Job
+        self._heap = [] #(due, seq, job id, run); entries for runs already done or cancelled are skipped
+        self._lock = threading.Lock()
+        self._journal = None
+        if path is not None:
+            for record in Journal(path).replay():
+                if "op" in record:
+                    self.jobs[record["id"]] = Job.from_record(record)
+                elif record["id"] in self.jobs:
+                    if "run" in record:
+                        self.jobs[record["id"]].run = record["run"]
+                    else:
+                        del self.jobs[record["id"]]
+            self._rewrite()
+        self._seq = max((job.seq for job in self.jobs.values()), default=-1) + 1
+        for job in self.jobs.values():
+            self._heap.append((job.due(job.run), job.seq, job.id, job.run))
+        heapq.heapify(self._heap)
+
+    def _rewrite(self):
+        #starts the journal over with one record per job
+        if self._journal is not None:
+            self._journal.close()
+        with open(self.path + ".tmp", "w") as f:
+            for job in self.jobs.values():
+                f.write(json.dumps(job.record(), separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.path + ".tmp", self.path)
+        self._journal = Journal(self.path)
+
+    def add(self, op, every, start=None, count=None, catch_up=True, job_id=None):
+        #schedules op (see Bank.apply_batch) every interval from start (a
+        #datetime or seconds since the epoch; default now); returns the job id
+        op = _normalized(op)
+        if every in PERIODS:
+            every = PERIODS[every]
+        elif every != "monthly" and (isinstance(every, bool) or not isinstance(every, (int, float)) or every <= 0):
+            raise ValueError(f"Invalid interval: {every!r}")
+        if count is not None and count < 1:
+            raise ValueError("count must be at least 1.")
+        if start is None:
+            start = self.clock()
+        elif isinstance(start, datetime):
+            start = start.timestamp()
+
+        with self._lock:
+            job_id = job_id or uuid.uuid4().hex
+            if job_id in self.jobs:
+                raise ValueError(f"Job {job_id} already exists.")
+            job = Job(job_id, self._seq, op, every, start, count, catch_up)
+            self._seq += 1
+            if self._journal is not None:
+                self._journal.append(job.record())
+                self._journal.sync()
+            self.jobs[job_id] = job
+            heapq.heappush(self._heap, (job.due(0), job.seq, job_id, 0))
+        return job_id
+
+    def cancel(self, job_id):
+        #True if the job existed; runs already applied stay applied
+        with self._lock:
+            if self.jobs.pop(job_id, None) is None:
+                return False
+            if self._journal is not None:
+                self._journal.append({"id": job_id, "cancel": True})
+                self._journal.sync()
+            return True
+
+    def next_due(self):
+        #when the next run is due, or None without jobs
+        with self._lock:
+            while self._heap and not self._current(self._heap[0]):
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    def _current(self, entry):
+        job = self.jobs.get(entry[2])
+        return job is not None and job.run == entry[3]
+
+    def tick(self):
+        #applies every run due by now; returns {"runs": ..., "failed": ...}
+        with self._lock:
+            now = self.clock()
+            heap = self._heap
+            batch = [] #(job, run, next run)
+            runs = failed = 0
+            while heap and heap[0][0] <= now:
+                entry = heapq.heappop(heap)
+                if not self._current(entry):
+                    continue
+                job, run = self.jobs[entry[2]], entry[3]
+                following = run + 1
+                if not job.catch_up:
+                    #one run stands for all the missed ones
+                    while not job.finished(following) and job.due(following) <= now:
+                        following += 1
+                job.run = following
+                if not job.finished(following):
+                    heapq.heappush(heap, (job.due(following), job.seq, job.id, following))
+                batch.append((job, run, following))
+                if len(batch) >= self.batch_size:
+                    failed += self._apply(batch)
+                    runs += len(batch)
+                    batch = []
+            if batch:
+                failed += self._apply(batch)
+                runs += len(batch)
+            return {"runs": runs, "failed": failed}
+
+    def _apply(self, batch):
+        #returns how many runs failed
+        ops = [dict(job.op, op_id=f"{job.id}:{run}") for job, run, _ in batch]
+        results = self.bank.apply_batch(ops, atomic=False)
+        if self._journal is not None:
+            #the runs must be durable in the bank before they are marked done
+            self.bank.flush()
+            for job, _, following in batch:
+                if job.finished(following):
+                    self.jobs.pop(job.id, None)
+                    self._journal.append({"id": job.id, "done": True})
+                else:
+                    self._journal.append({"id": job.id, "run": following})
+            self._journal.sync()
+            #progress records pile up; fold them once they outnumber the jobs
+            if self._journal.records > 4 * len(self.jobs) + 1000:
+                self._rewrite()
+        else:
+            for job, _, following in batch:
+                if job.finished(following):
+                    self.jobs.pop(job.id, None)
+        return sum(not result["ok"] for result in results)
+
+    def run(self, stop, interval=1.0):
+        #ticks until stop (a threading.Event) is set, at least every interval
+        #seconds and sooner when a run is due earlier
+        while not stop.is_set():
+            self.tick()
+            due = self.next_due()
+            wait = interval if due is None else min(interval, max(due - self.clock(), 0))
+            stop.wait(wait)
+
+    def close(self):
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
@@ -0,0 +1,228 @@
+#asyncio front-end that serves one Bank to many concurrent clients
+#
+#protocol: one JSON object per line in each direction, for example
+#
+#   {"id": 1, "op": "create", "type": "savings", "account": 101, "holder": "Ann", "balance": 50, "password": "pw"}
+#   {"id": 2, "op": "deposit", "account": 101, "amount": 25, "password": "pw"}
+#   {"id": 3, "op": "withdraw", "account": 101, "amount": 10, "password": "pw"}
+#   {"id": 4, "op": "transfer", "from": 101, "to": 102, "amount": 5, "password": "pw"}
+#   {"id": 5, "op": "statement", "account": 101, "password": "pw", "limit": 10}
+#   {"id": 6, "op": "metrics", "format": "prometheus"}     (with --metrics; an error otherwise)
+#   {"id": 7, "op": "login", "account": 101, "password": "pw"}
+#   {"id": 8, "op": "deposit", "account": 101, "amount": 25, "session": "<token from login>"}
+#   {"id": 9, "op": "logout", "session": "<token>"}
+#
+#every response echoes "id" and has "ok", plus "error" or the result fields.
+#passwords are stored hashed and checking one is deliberately slow, so a
+#client making many requests should log in once and send the session token.
+#deposit, withdraw and transfer take an optional "op_id"; a request retried
+#with the same op_id is applied once and answered with the first result.
+#amounts are read as exact decimals, and balances and amounts are answered
+#as decimal strings such as "10.10".
+#
+#the Bank runs in concurrent mode, so journal writes happen on its writer
+#thread; operations themselves run in a thread pool so that waiting on an
+#account lock (for example during compaction) never stalls the event loop.
+#
+#usage: python bank_server.py [--file bank_data.json] [--host 127.0.0.1] [--port 8765]
+#       python bank_server.py --unix /tmp/bank.sock
+#       python bank_server.py --storage sqlite --file bank_data.db
+
+import argparse
+import asyncio
+import json
+from decimal import Decimal
+
+from bank_system import Bank, NullSink, _is_amount, from_units, set_event_sink, to_units
+
+ACCOUNT_TYPES = ("savings", "checking", "business", "crypto")
+DENIED = {"ok": False, "error": "Account not found or incorrect password."}
+
+
+def _json_default(value):
+    #Decimal balances and amounts are written as decimal strings: a JSON
+    #number would be read back as a float by most clients
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class BankServer:
+    def __init__(self, bank):
+        self.bank = bank
+
+    async def handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line, parse_float=Decimal)
+                    if not isinstance(request, dict):
+                        raise ValueError
+                except ValueError:
+                    response = {"ok": False, "error": "Request must be a JSON object on one line."}
+                else:
+                    response = dict(await loop.run_in_executor(None, self.dispatch, request))
+                    response["id"] = request.get("id")
+                writer.write(json.dumps(response, default=_json_default).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def dispatch(self, request):
+        handler = getattr(self, "op_" + str(request.get("op")), None)
+        if handler is None:
+            return {"ok": False, "error": f"Unknown operation: {request.get('op')!r}"}
+        try:
+            return handler(request)
+        except (KeyError, OverflowError, TypeError, ValueError) as e:
+            return {"ok": False, "error": f"Invalid request: {e}"}
+
+    def _account(self, request, key="account"):
+        #(account number, account), account None unless the session or the
+        #password matches
+        acc_num = int(request[key])
+        if "session" in request:
+            return acc_num, self.bank.session_account(request["session"], acc_num)
+        return acc_num, self.bank.authenticate(acc_num, request.get("password"))
+
+    @staticmethod
+    def _amount(request):
+        amount = request["amount"]
+        if not _is_amount(amount):
+            raise ValueError("amount must be a number greater than 0")
+        return amount
+
+    @staticmethod
+    def _op_id(request):
+        op_id = request.get("op_id")
+        return None if op_id is None else str(op_id)
+
+    def op_create(self, request):
+        account_type = str(request["type"]).lower()
+        if account_type not in ACCOUNT_TYPES:
+            return {"ok": False, "error": "Invalid account type."}
+        balance = request.get("balance", 0)
+        if balance != 0 and not _is_amount(balance):
+            return {"ok": False, "error": "Opening balance must be a number >= 0."}
+        password = request["password"]
+        if not isinstance(password, str) or not password:
+            return {"ok": False, "error": "A password is required."}
+        account = self.bank.create_account(account_type, int(request["account"]), str(request["holder"]),
+                                           balance, password=password)
+        if account is None:
+            return {"ok": False, "error": "Account not created: duplicate number or opening balance too low."}
+        return {"ok": True, "balance": account.balance}
+
+    def op_login(self, request):
+        password = request.get("password")
+        #login() would prompt on the server's console without one
+        if not isinstance(password, str):
+            return DENIED
+        token = self.bank.login(int(request["account"]), password)
+        if token is None:
+            return DENIED
+        return {"ok": True, "session": token}
+
+    def op_logout(self, request):
+        self.bank.logout(str(request["session"]))
+        return {"ok": True}
+
+    def op_deposit(self, request):
+        return self._move(request, self.bank.deposit)
+
+    def op_withdraw(self, request):
+        return self._move(request, self.bank.withdraw)
+
+    def _move(self, request, operation):
+        amount = self._amount(request)
+        acc_num, account = self._account(request)
+        if account is None:
+            return DENIED
+        if not operation(acc_num, amount, op_id=self._op_id(request)):
+            return {"ok": False, "error": "Rejected by the account rules.", "balance": account.balance}
+        return {"ok": True, "balance": account.balance}
+
+    def op_transfer(self, request):
+        amount = self._amount(request)
+        acc_num, account = self._account(request, "from")
+        if account is None:
+            return DENIED
+        if not self.bank.transfer_funds(acc_num, int(request["to"]), amount, op_id=self._op_id(request)):
+            return {"ok": False, "error": "Transfer failed.", "balance": account.balance}
+        return {"ok": True, "balance": account.balance}
+
+    def op_metrics(self, request):
+        if self.bank.metrics is None:
+            return {"ok": False, "error": "Metrics are not enabled; start the server with --metrics."}
+        if request.get("format", "json") == "prometheus":
+            return {"ok": True, "metrics": self.bank.metrics.to_prometheus()}
+        return {"ok": True, "metrics": self.bank.metrics.to_json()}
+
+    def op_statement(self, request):
+        _, account = self._account(request)
+        if account is None:
+            return DENIED
+        limit = int(request.get("limit", 10))
+        transactions = account.transactions
+        start = max(len(transactions) - limit, 0)
+        places = account.places
+        return {
+            "ok": True,
+            "account_type": account.get_account_type(),
+            "holder": account.holder_name,
+            "balance": account.balance,
+            #records() holds amounts as JSON numbers; they go out as decimals
+            #like the balance
+            "transactions": [dict(record, amount=from_units(to_units(record["amount"], places), places))
+                             for record in transactions.records(start)],
+        }
+
+
+async def serve(bank, host="127.0.0.1", port=8765, unix=None):
+    server = BankServer(bank)
+    if unix:
+        listener = await asyncio.start_unix_server(server.handle, path=unix)
+    else:
+        listener = await asyncio.start_server(server.handle, host, port)
+    async with listener:
+        await listener.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a Bank over line-delimited JSON")
+    parser.add_argument("--file", default="bank_data.json")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", help="listen on a Unix socket instead of TCP")
+    parser.add_argument("--storage", choices=("json", "binary", "sqlite"), default="json")
+    parser.add_argument("--metrics", action="store_true", help="collect metrics and serve the metrics op")
+    args = parser.parse_args()
+
+    metrics = None
+    if args.metrics:
+        from bank_metrics import Metrics
+        metrics = Metrics()
+    if args.storage == "sqlite":
+        from bank_sqlite import SqliteBackend
+        bank = Bank(storage=SqliteBackend(args.file), concurrent=True, metrics=metrics)
+    else:
+        bank = Bank(args.file, snapshot_format=args.storage, concurrent=True, metrics=metrics)
+    print(f"Serving {args.file} on {args.unix or f'{args.host}:{args.port}'}", flush=True)
+    #the per-operation messages are not useful on a server console
+    set_event_sink(NullSink())
+    try:
+        asyncio.run(serve(bank, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        bank.close()
+
+
+if __name__ == "__main__":
+    main()
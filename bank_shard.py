@@ -0,0 +1,456 @@
+#sharded Bank: accounts are partitioned by account number across worker
+#processes, so operations on different shards run on different cores
+#
+#   bank = ShardedBank("bank_shards", shards=4)
+#   bank.create_account("savings", 101, "Ann", 50, password="pw")
+#   bank.deposit(101, 25)
+#   bank.transfer_funds(101, 102, 5)
+#   bank.close()
+#
+#account n lives on shard n % shards. Every shard is a Bank in its own process
+#with its own storage file (shard-0.json, shard-1.json, ... in the directory),
+#and the number of shards is fixed when the directory is created.
+#
+#a transfer within one shard is an ordinary Bank.transfer_funds. A transfer
+#between shards uses two-phase commit, with this process as the coordinator:
+#
+#   prepare   the receiving shard checks the account and records the transfer
+#             as prepared; the sending shard records it, then withdraws
+#   commit    once both are prepared, the decision is fsynced to
+#             transfers.log, then the receiving shard deposits ("Transfer In")
+#             and the sending shard records "Transfer Out"
+#   abort     otherwise the sending shard refunds the withdrawal and records a
+#             failed "Transfer Out", as Bank.transfer_funds does
+#
+#prepared transfers are kept in a log per shard. When the bank is opened
+#again, every transfer a shard still holds as prepared is committed if
+#transfers.log has the decision and aborted otherwise. Each step is tagged
+#with an operation id, so repeating a commit or an abort changes nothing, and
+#money is never lost or created by a crash in the middle of a transfer.
+
+import json
+import multiprocessing
+import os
+import threading
+import uuid
+from collections import deque
+from concurrent.futures import Future
+
+from bank_system import Bank, Journal, NullSink, _batch_op, _is_amount, from_units, set_event_sink, to_units
+
+#storage name -> data file extension
+_EXTENSIONS = {"json": ".json", "binary": ".bin", "sqlite": ".db"}
+
+
+#transfers that are prepared (in a shard) or decided (in the coordinator) but
+#not finished yet: a journal of {"txid": ..., ...} records, where a record
+#with "done" finishes an earlier one
+class _TransferLog:
+    def __init__(self, path):
+        self.entries = {}
+        journal = Journal(path)
+        for record in journal.replay():
+            if record.get("done"):
+                self.entries.pop(record["txid"], None)
+            else:
+                self.entries[record["txid"]] = record
+
+        #start over with only the unfinished transfers
+        with open(path + ".tmp", "w") as f:
+            for record in self.entries.values():
+                f.write(json.dumps(record, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        self.journal = journal
+        self._lock = threading.Lock()
+
+    def add(self, txid, **fields):
+        #durable before it returns
+        fields["txid"] = txid
+        with self._lock:
+            self.journal.append(fields)
+            self.journal.sync()
+            self.entries[txid] = fields
+
+    def remove(self, txid):
+        #not fsynced: a lost removal only repeats a commit or an abort
+        with self._lock:
+            if self.entries.pop(txid, None) is not None:
+                self.journal.append({"txid": txid, "done": True})
+
+    def close(self):
+        with self._lock:
+            self.journal.close()
+
+
+#one shard, inside its worker process
+class _Shard:
+    def __init__(self, path, storage, options):
+        #the per-operation messages of several processes would interleave
+        set_event_sink(NullSink())
+        if storage == "sqlite":
+            from bank_sqlite import SqliteBackend
+            self.bank = Bank(storage=SqliteBackend(path), **options)
+        else:
+            self.bank = Bank(path, snapshot_format=storage, **options)
+        self.prepared = _TransferLog(os.path.splitext(path)[0] + ".prepared")
+
+    def close(self):
+        self.bank.close()
+        self.prepared.close()
+
+    #operations on this shard's accounts
+
+    def create_account(self, account_type, account_number, holder_name, balance, password):
+        return self.bank.create_account(account_type, account_number, holder_name, balance, password) is not None
+
+    def deposit(self, account_number, amount, op_id=None):
+        return self.bank.deposit(account_number, amount, op_id=op_id)
+
+    def withdraw(self, account_number, amount, op_id=None):
+        return self.bank.withdraw(account_number, amount, op_id=op_id)
+
+    def transfer_funds(self, from_acc_num, to_acc_num, amount, op_id=None):
+        return self.bank.transfer_funds(from_acc_num, to_acc_num, amount, op_id=op_id)
+
+    def apply_batch(self, ops, atomic):
+        return self.bank.apply_batch(ops, atomic)
+
+    def get_balance(self, account_number):
+        return self.bank.get_balance(account_number)
+
+    def authenticate(self, account_number, password):
+        return self.bank.authenticate(account_number, password) is not None
+
+    def total_balance(self):
+        #(accounts, sum of their balances)
+        return len(self.bank.accounts), sum(acc.balance for acc in self.bank.accounts.values())
+
+    def flush(self):
+        self.bank.flush()
+
+    def compact(self):
+        self.bank.compact()
+
+    #the two phases of a transfer between shards
+
+    def prepare_credit(self, txid, account_number, amount):
+        #the account's places once the transfer is prepared, or None if the
+        #account does not exist
+        account = self.bank.accounts.get(account_number)
+        if account is None:
+            return None
+        if txid in self.prepared.entries:
+            raise RuntimeError(f"Transfer {txid} is already in progress")
+        #amounts are logged as decimal strings so they stay exact
+        amount = from_units(to_units(amount, account.places), account.places)
+        self.prepared.add(txid, role="credit", account=account_number, amount=str(amount))
+        return account.places
+
+    def prepare_debit(self, txid, account_number, amount):
+        #(prepared, result): prepared is True once the amount is withdrawn;
+        #otherwise result is the outcome of the transfer
+        account = self.bank.accounts.get(account_number)
+        if account is None:
+            return False, False
+        previous = self.bank._previous_result(txid, account)
+        if previous is not None:
+            return False, previous
+        if txid in self.prepared.entries:
+            raise RuntimeError(f"Transfer {txid} is already in progress")
+        if from_units(to_units(amount, account.places), account.places) != amount:
+            #finer than this account can send; the credit is already prepared
+            #with this amount, so it cannot be rounded here
+            self._finish(txid, account, "Transfer Out", amount, False)
+            return False, False
+        #recorded before the withdrawal, so a crash right after it is refunded
+        self.prepared.add(txid, role="debit", account=account_number, amount=str(amount))
+        if self.bank.withdraw(account_number, amount, op_id=txid + ":debit"):
+            #the coordinator may commit as soon as this returns
+            self.bank.flush()
+            return True, None
+        self._finish(txid, account, "Transfer Out", amount, False)
+        self.prepared.remove(txid)
+        return False, False
+
+    def commit(self, txid):
+        entry = self.prepared.entries.get(txid)
+        if entry is None:
+            return
+        account = self.bank.accounts[entry["account"]]
+        amount = entry["amount"]
+        #an entry tagged with txid means the commit already happened
+        if account.transactions.find_op(txid) is None:
+            if entry["role"] == "credit":
+                account.deposit(amount)
+                self._finish(txid, account, "Transfer In", amount, True)
+            else:
+                self._finish(txid, account, "Transfer Out", amount, True)
+            self.bank.flush()
+        self.prepared.remove(txid)
+
+    def abort(self, txid):
+        entry = self.prepared.entries.get(txid)
+        if entry is None:
+            return
+        if entry["role"] == "debit":
+            account = self.bank.accounts[entry["account"]]
+            transactions = account.transactions
+            if transactions.find_op(txid) is None:
+                amount = entry["amount"]
+                withdrawn = transactions.find_op(txid + ":debit")
+                if withdrawn is not None and transactions[withdrawn].status == "Success":
+                    account.deposit(amount)
+                self._finish(txid, account, "Transfer Out", amount, False)
+                self.bank.flush()
+        self.prepared.remove(txid)
+
+    def in_doubt(self):
+        #transfers prepared here that were neither committed nor aborted
+        return list(self.prepared.entries)
+
+    def _finish(self, txid, account, type, amount, ok):
+        #the entry that records the outcome carries the transfer's id, and is
+        #saved in the same record as the deposit or refund before it
+        account.transactions.add(type, amount, "Success" if ok else "Failed")
+        self.bank._record_op(txid, account, len(account.transactions) - 1, ok)
+        self.bank.save_data(account)
+
+
+def _serve(conn, path, storage, options):
+    #worker process: runs requests (method name, args) in order and answers
+    #each with (True, result) or (False, exception)
+    shard = _Shard(path, storage, options)
+    try:
+        while True:
+            try:
+                request = conn.recv()
+            except EOFError:
+                break
+            if request is None:
+                break
+            method, args = request
+            try:
+                if method.startswith("_"):
+                    raise AttributeError(method)
+                conn.send((True, getattr(shard, method)(*args)))
+            except Exception as e:
+                conn.send((False, e))
+    finally:
+        shard.close()
+        conn.close()
+
+
+#the coordinator's end of one shard. Requests from any number of threads are
+#sent down one pipe; the shard answers in order, and a reader thread hands
+#each answer to the Future of its request.
+class _ShardClient:
+    def __init__(self, context, path, storage, options):
+        self.path = path
+        self._conn, child = context.Pipe()
+        self.process = context.Process(target=_serve, args=(child, path, storage, options),
+                                       name=f"bank-shard-{os.path.basename(path)}", daemon=True)
+        self.process.start()
+        child.close()
+        self._pending = deque()
+        self._send_lock = threading.Lock()
+        self._reader = threading.Thread(target=self._read, name="bank-shard-reader", daemon=True)
+        self._reader.start()
+
+    def submit(self, method, *args):
+        future = Future()
+        with self._send_lock:
+            self._pending.append(future)
+            self._conn.send((method, args))
+        return future
+
+    def call(self, method, *args):
+        return self.submit(method, *args).result()
+
+    def _read(self):
+        while True:
+            try:
+                ok, value = self._conn.recv()
+            except (EOFError, OSError):
+                break
+            future = self._pending.popleft()
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+        #the shard is gone; nothing more will be answered
+        while self._pending:
+            self._pending.popleft().set_exception(RuntimeError(f"Shard {self.path} stopped"))
+
+    def close(self):
+        with self._send_lock:
+            self._conn.send(None)
+        self.process.join()
+        self._reader.join()
+        self._conn.close()
+
+
+class ShardedBank:
+    def __init__(self, directory="bank_shards", shards=4, storage="json", **options):
+        #storage: "json", "binary" or "sqlite" for every shard; options are
+        #passed on to each shard's Bank (compact_every, lazy, op_cache_size, ...)
+        if storage not in _EXTENSIONS:
+            raise ValueError(f"Unknown storage: {storage}")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self._check_layout(shards, storage)
+        context = multiprocessing.get_context("spawn")
+        self.shards = [_ShardClient(context, os.path.join(directory, f"shard-{i}{_EXTENSIONS[storage]}"),
+                                    storage, options)
+                       for i in range(shards)]
+        self._decisions = _TransferLog(os.path.join(directory, "transfers.log"))
+        self._recover()
+
+    def _check_layout(self, shards, storage):
+        #accounts are placed by account number modulo the shard count, so a
+        #directory cannot be reopened with a different count
+        path = os.path.join(self.directory, "shards.json")
+        layout = {"shards": shards, "storage": storage}
+        try:
+            with open(path, "r") as f:
+                existing = json.load(f)
+        except FileNotFoundError:
+            with open(path, "w") as f:
+                json.dump(layout, f)
+            return
+        if existing != layout:
+            raise ValueError(f"{self.directory} holds {existing['shards']} {existing['storage']} shards, "
+                             f"not {shards} {storage} shards")
+
+    def _recover(self):
+        #finishes the transfers a crash left in the middle of phase two
+        decided = self._decisions.entries
+        for shard in self.shards:
+            for txid in shard.call("in_doubt"):
+                shard.call("commit" if txid in decided else "abort", txid)
+        for txid in list(decided):
+            self._decisions.remove(txid)
+
+    def shard_for(self, account_number):
+        try:
+            return self.shards[int(account_number) % len(self.shards)]
+        except (TypeError, ValueError):
+            raise ValueError(f"Account numbers must be integers: {account_number!r}") from None
+
+    def create_account(self, account_type, account_number, holder_name, balance=0, password=None):
+        #True if the account was created; the password is required here
+        if password is None:
+            raise ValueError("A sharded bank cannot prompt for a password")
+        account_number = int(account_number)
+        return self.shard_for(account_number).call("create_account", account_type, account_number,
+                                                   holder_name, balance, password)
+
+    def authenticate(self, account_number, password):
+        return self.shard_for(account_number).call("authenticate", int(account_number), password)
+
+    def deposit(self, account_number, amount, op_id=None):
+        return self.shard_for(account_number).call("deposit", int(account_number), amount, op_id)
+
+    def withdraw(self, account_number, amount, op_id=None):
+        return self.shard_for(account_number).call("withdraw", int(account_number), amount, op_id)
+
+    def get_balance(self, account_number):
+        return self.shard_for(account_number).call("get_balance", int(account_number))
+
+    def transfer_funds(self, from_acc_num, to_acc_num, amount, op_id=None):
+        source = self.shard_for(from_acc_num)
+        target = self.shard_for(to_acc_num)
+        from_acc_num, to_acc_num = int(from_acc_num), int(to_acc_num)
+        if source is target:
+            return source.call("transfer_funds", from_acc_num, to_acc_num, amount, op_id)
+        if not _is_amount(amount):
+            return False
+
+        #op_id, if given, makes a retried transfer a duplicate on the sending shard
+        txid = op_id if op_id is not None else uuid.uuid4().hex
+        places = target.call("prepare_credit", txid, to_acc_num, amount)
+        if places is None:
+            return False
+        #both sides move the amount as the receiving account holds it
+        amount = from_units(to_units(amount, places), places)
+        try:
+            prepared, result = source.call("prepare_debit", txid, from_acc_num, amount)
+        except BaseException:
+            target.call("abort", txid)
+            raise
+        if not prepared:
+            target.call("abort", txid)
+            return result
+
+        self._decisions.add(txid)
+        target.call("commit", txid)
+        source.call("commit", txid)
+        self._decisions.remove(txid)
+        return True
+
+    def apply_batch(self, ops, atomic=True):
+        #ops as for Bank.apply_batch. Ops are grouped by shard and the groups
+        #run in parallel, each as one Bank.apply_batch, so atomic applies per
+        #shard; transfers between shards run one by one afterwards. Results
+        #are in the order of ops.
+        ops = list(ops)
+        groups = {shard: [] for shard in self.shards}
+        transfers = []
+        results = [None] * len(ops)
+        for i, op in enumerate(ops):
+            try:
+                kind, accounts, amount, op_id = _batch_op(op)
+                owners = [self.shard_for(acc_num) for acc_num in accounts]
+                op = _normalized(op)
+            except (TypeError, ValueError, IndexError):
+                results[i] = {"ok": False, "error": f"Invalid operation: {op!r}"}
+                continue
+            if kind == "transfer" and len(set(owners)) == 2:
+                transfers.append((i, accounts, amount, op_id))
+            else:
+                #anything malformed is left for a shard to report
+                groups[owners[0] if owners else self.shards[0]].append((i, op))
+
+        futures = [(group, shard.submit("apply_batch", [op for _, op in group], atomic))
+                   for shard, group in groups.items() if group]
+        for group, future in futures:
+            for (i, _), result in zip(group, future.result()):
+                results[i] = result
+        for i, (from_acc_num, to_acc_num), amount, op_id in transfers:
+            if not _is_amount(amount):
+                results[i] = {"ok": False, "error": "Amount must be greater than 0."}
+            elif self.transfer_funds(from_acc_num, to_acc_num, amount, op_id):
+                results[i] = {"ok": True, "error": None}
+            else:
+                results[i] = {"ok": False, "error": "Transfer failed due to insufficient balance or account rules."}
+        return results
+
+    def total_balance(self):
+        #(accounts, sum of all balances) over every shard
+        totals = [future.result() for future in [shard.submit("total_balance") for shard in self.shards]]
+        return sum(count for count, _ in totals), sum(balance for _, balance in totals)
+
+    def flush(self):
+        for future in [shard.submit("flush") for shard in self.shards]:
+            future.result()
+
+    def compact(self):
+        for future in [shard.submit("compact") for shard in self.shards]:
+            future.result()
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+        self._decisions.close()
+
+
+def _normalized(op):
+    #the op with integer account numbers, as the shards store them
+    if isinstance(op, dict):
+        op = dict(op)
+        for key in (("from", "to") if op.get("op") == "transfer" else ("account",)):
+            op[key] = int(op[key])
+        return op
+    kind, *args = op
+    return (kind, *(int(acc_num) for acc_num in args[:-1]), args[-1])
@@ -0,0 +1,190 @@
+#SQLite storage backend for Bank
+#
+#   bank = Bank(storage=SqliteBackend("bank.db"))
+#
+#an account is read from the database the first time it is looked up and its
+#transaction history the first time it is used; every save writes only the
+#rows of the accounts that changed, in one transaction, so a transfer commits
+#both sides or neither. Startup and per-operation cost do not depend on the
+#number of accounts, and the ledger does not have to fit in memory.
+#
+#the database runs in WAL mode with synchronous=NORMAL, so commits are not
+#fsynced one by one; like the batched fsync of the JSON journal, a power loss
+#can lose the last commits but never leaves a half-written one behind.
+
+import sqlite3
+import threading
+from datetime import datetime
+from functools import partial
+
+from bank_system import (StorageBackend, Transaction, TransactionStore, _account_class, _make_account,
+                         from_units, to_units)
+
+#balance and amount have no declared type: they hold the whole-unit ints and
+#floats of the change records, which read back into exact minor units
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    number INTEGER PRIMARY KEY,
+    account_type TEXT NOT NULL,
+    holder_name TEXT NOT NULL,
+    holder_key TEXT NOT NULL,
+    password TEXT,
+    balance NOT NULL,
+    count INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS accounts_holder ON accounts (holder_key, number);
+
+CREATE TABLE IF NOT EXISTS transactions (
+    account INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    amount NOT NULL,
+    status TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    op_id TEXT,
+    PRIMARY KEY (account, seq)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS transactions_time ON transactions (account, timestamp);
+"""
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _number(account_number):
+    try:
+        return int(account_number)
+    except (TypeError, ValueError):
+        return None
+
+
+class SqliteBackend(StorageBackend):
+    reads_back = True
+
+    def __init__(self, path="bank_data.db"):
+        self.path = path
+        #one connection shared by the bank's threads, used under a lock
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        #databases written before operation ids lack the column
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(transactions)")]
+        if "op_id" not in columns:
+            self._db.execute("ALTER TABLE transactions ADD COLUMN op_id TEXT")
+
+    def _query(self, sql, *params):
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def load(self, bank):
+        #nothing is read up front; Bank.accounts faults accounts in
+        bank.accounts = bank._mapped_accounts(self)
+
+    def write(self, record):
+        headers, balances, passwords, rows = [], [], [], []
+        second = timestamp = None
+        for key, entry in record.items():
+            number = int(key)
+            n = entry["n"]
+            transactions = entry["transactions"]
+            if "account_type" in entry:
+                headers.append((number, entry["account_type"], entry["holder_name"],
+                                entry["holder_name"].casefold(), entry["password"], entry["balance"],
+                                n + len(transactions)))
+            else:
+                balances.append((entry["balance"], n + len(transactions), number))
+                if "password" in entry:
+                    passwords.append((entry["password"], number))
+            for i, t in enumerate(transactions, n):
+                #consecutive entries usually share a second
+                if t["timestamp"] != second:
+                    second = t["timestamp"]
+                    timestamp = datetime.strptime(second, TIME_FORMAT).timestamp()
+                rows.append((number, i, t["type"], t["amount"], t["status"], timestamp, t.get("op_id")))
+
+        with self._lock, self._db:
+            self._db.executemany("INSERT OR REPLACE INTO accounts VALUES (?, ?, ?, ?, ?, ?, ?)", headers)
+            self._db.executemany("UPDATE accounts SET balance = ?, count = ? WHERE number = ?", balances)
+            self._db.executemany("UPDATE accounts SET password = ? WHERE number = ?", passwords)
+            self._db.executemany("INSERT OR REPLACE INTO transactions VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def compact(self, bank):
+        #folds the write-ahead log into the database file and empties it
+        with self._lock:
+            self._db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def sync(self):
+        #a checkpoint fsyncs the write-ahead log first
+        with self._lock:
+            self._db.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def holder_accounts(self, name):
+        rows = self._query("SELECT number FROM accounts WHERE holder_key = ? ORDER BY number", name)
+        return [number for number, in rows]
+
+    def holder_prefix(self, prefix):
+        return self._query("SELECT holder_key, number FROM accounts WHERE holder_key >= ? AND holder_key < ? "
+                           "ORDER BY holder_key, number", prefix, prefix + "\U0010ffff")
+
+    #the lookups MappedAccounts expects from a snapshot
+
+    def find(self, account_number):
+        number = _number(account_number)
+        if number is None or not self._query("SELECT 1 FROM accounts WHERE number = ?", number):
+            return None
+        return number
+
+    def account_numbers(self):
+        return [number for number, in self._query("SELECT number FROM accounts ORDER BY number")]
+
+    def balance(self, account_number):
+        rows = self._query("SELECT account_type, balance FROM accounts WHERE number = ?", _number(account_number))
+        if not rows:
+            return None
+        places = _account_class(rows[0][0]).places
+        return from_units(to_units(rows[0][1], places), places)
+
+    def account(self, account_number):
+        #builds the account; its history is read on first use
+        number = _number(account_number)
+        rows = self._query("SELECT account_type, holder_name, password, balance, count FROM accounts "
+                           "WHERE number = ?", number)
+        if not rows:
+            return None
+        account_type, holder, password, balance, count = rows[0]
+        acc = _make_account(account_type, str(number), holder, balance)
+        acc.password = password
+        if count:
+            acc.transactions = TransactionStore.lazy(count, partial(self.transactions, number, count, acc.places),
+                                                     partial(self.between, number, count, acc.places), acc.places)
+        return acc
+
+    def transactions(self, number, count, places=2):
+        store = TransactionStore(places)
+        rows = self._query("SELECT type, amount, status, timestamp, op_id FROM transactions "
+                           "WHERE account = ? AND seq < ? ORDER BY seq", number, count)
+        for type, amount, status, timestamp, op_id in rows:
+            store.add(type, amount, status, datetime.fromtimestamp(timestamp))
+            if op_id is not None:
+                store.tag(len(store) - 1, op_id)
+        return store
+
+    def between(self, number, count, places=2, start=None, end=None):
+        #range query on the (account, timestamp) index
+        sql = "SELECT type, amount, status, timestamp, op_id FROM transactions WHERE account = ? AND seq < ?"
+        params = [number, count]
+        if start is not None:
+            sql += " AND timestamp >= ?"
+            params.append(start.timestamp())
+        if end is not None:
+            sql += " AND timestamp <= ?"
+            params.append(end.timestamp())
+        rows = self._query(sql + " ORDER BY timestamp, seq", *params)
+        return [Transaction(type, from_units(to_units(amount, places), places), status,
+                            datetime.fromtimestamp(timestamp), op_id)
+                for type, amount, status, timestamp, op_id in rows]
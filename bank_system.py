@@ -5,27 +5,146 @@ from abc import ABC, abstractmethod
 from datetime import datetime 
 
 #import
+import binascii
 import json
+import contextlib
+import copy
+from decimal import Decimal, InvalidOperation, ROUND_HALF_EVEN
+import hashlib
+import hmac
+import math
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+from functools import partial
+from itertools import islice
+import os
+import queue
+import re
+import secrets
+import threading
+import time
+
+#money is held as an int count of minor units: cents for bank accounts and
+#hundred-millionths of a coin for crypto wallets (an account's "places").
+#Amounts come in as ints, floats, Decimals or strings and go out as exact
+#Decimals, so sums never drift.
+#the largest balance or amount in minor units: histories and binary
+#snapshots keep them as 64-bit ints
+MAX_UNITS = 2 ** 63 - 1
+
+
+def to_units(amount, places=2):
+    #amount in whole minor units, rounded half to even; ValueError if it is
+    #not a number or does not fit in MAX_UNITS
+    units = _to_units(amount, places)
+    if not -MAX_UNITS <= units <= MAX_UNITS:
+        raise ValueError(f"Amount out of range: {amount!r}")
+    return units
+
+
+def _operation_units(amount, places):
+    #to_units() for a deposit or withdrawal: an amount that is not one, or
+    #is too large to store, is 0, which every operation refuses
+    try:
+        return to_units(amount, places)
+    except ValueError:
+        return 0
+
+
+def _to_units(amount, places):
+    scale = 10 ** places
+    if type(amount) is int:
+        return amount * scale
+    if type(amount) is float:
+        if not math.isfinite(amount):
+            raise ValueError(f"Not an amount: {amount!r}")
+        scaled = amount * scale
+        units = round(scaled)
+        #only a value halfway between two units can round differently than
+        #its decimal text; those take the Decimal path below
+        if abs(abs(scaled - units) - 0.5) > 1e-6 and abs(scaled) < 2 ** 52:
+            return units
+        amount = repr(amount)
+    try:
+        amount = Decimal(amount)
+        if not amount.is_finite():
+            raise ValueError(f"Not an amount: {amount!r}")
+        return int(amount.scaleb(places).to_integral_value(ROUND_HALF_EVEN))
+    except (InvalidOperation, TypeError) as e:
+        raise ValueError(f"Not an amount: {amount!r}") from e
+
+
+def from_units(units, places=2):
+    return Decimal(units).scaleb(-places)
+
+
+def parse_amount(text):
+    #a Decimal from user input such as "12.50"; ValueError if it is not a number
+    try:
+        amount = Decimal(text.strip())
+    except InvalidOperation:
+        raise ValueError(f"Not an amount: {text!r}") from None
+    if not amount.is_finite():
+        raise ValueError(f"Not an amount: {text!r}")
+    return amount
+
+
+def _is_amount(amount):
+    #a finite number greater than 0, given as anything to_units() takes:
+    #an int, float, Decimal or numeric string
+    if isinstance(amount, str):
+        try:
+            amount = Decimal(amount.strip())
+        except InvalidOperation:
+            return False
+    if isinstance(amount, bool) or not isinstance(amount, (int, float, Decimal)):
+        return False
+    if isinstance(amount, Decimal):
+        return amount.is_finite() and amount > 0
+    return math.isfinite(amount) and amount > 0
+
+
+def _json_amount(units, places):
+    #units as a JSON number in whole currency units: an int when it is one,
+    #otherwise a float whose shortest repr is the exact decimal
+    scale = 10 ** places
+    if units % scale == 0:
+        return units // scale
+    return units / scale
+
 
 #abstract class
 class Account(ABC):
+    #digits after the decimal point this account keeps
+    places = 2
+
     def __init__(self, account_number, holder_name, balance):
         self.account_number = account_number
         self.holder_name = holder_name
-        self.__balance = balance
-        self.transactions = []
+        self.__balance = to_units(balance, self.places)
+        self.transactions = TransactionStore(self.places)
         self.password = None
 
     #Encapsulation
     @property
     def balance(self):
-        return self.__balance
+        return from_units(self.__balance, self.places)
     
     @balance.setter
     def balance(self,amount):
-        if amount < 0:
+        self.units = to_units(amount, self.places)
+
+    #the balance in minor units
+    @property
+    def units(self):
+        return self.__balance
+
+    @units.setter
+    def units(self, units):
+        if units < 0:
             raise ValueError("Balance cannot be negative")
-        self.__balance = amount
+        self.__balance = units
 
     def __add__(self, other):
         if isinstance(other, Account):
@@ -58,30 +177,48 @@ class Account(ABC):
 class SavingsAccount(Account):
 
     def deposit(self, amount):
-        if amount > 0:
-            self.balance += amount
-            self.transactions.append(Transaction("Deposit",amount,"Success"))
-            print(f"Deposited ${amount}. New balance is: ${self.balance}")
+        units = _operation_units(amount, self.places)
+        if 0 < units <= MAX_UNITS - self.units:
+            self.units += units
+            self.transactions.add_units("Deposit", units, "Success")
+            _emit("deposit", "Deposited ${amount}. New balance is: ${balance}", status="success",
+                  account=self.account_number, amount=from_units(units, self.places), balance=self.balance)
             return True
         else:
-            self.transactions.append(Transaction("Deposit", amount, "Failed"))
-            print("Deposit amount must be positive")
+            self.transactions.add_units("Deposit", units, "Failed")
+            _emit("deposit", "Deposit amount must be positive", status="failed",
+                  account=self.account_number, amount=amount)
             return False
     
     
     def withdraw(self, amount):
-        if 0 < amount <= self.balance:
-            self.balance -= amount
-            self.transactions.append(Transaction("Withdraw",amount,"Success"))
-            print(f"Withdraw ${amount}. Remaining balance is: ${self.balance}")
+        units = _operation_units(amount, self.places)
+        if 0 < units <= self.units:
+            self.units -= units
+            self.transactions.add_units("Withdraw", units, "Success")
+            _emit("withdraw", "Withdraw ${amount}. Remaining balance is: ${balance}", status="success",
+                  account=self.account_number, amount=from_units(units, self.places), balance=self.balance)
             return True
         else:
-            self.transactions.append(Transaction("Withdraw", amount, "Failed"))
-            print("Invalid amount.")
+            self.transactions.add_units("Withdraw", units, "Failed")
+            _emit("withdraw", "Invalid amount.", status="failed", account=self.account_number, amount=amount)
             return False
-        
 
-    
+    def add_interest(self, rate):
+        #pays rate times the balance, rounded half to even to the cent; rate
+        #is per posting, e.g. 0.04 / 12 for 4% a year paid monthly
+        rate = Decimal(repr(rate)) if type(rate) is float else Decimal(rate)
+        units = int((self.units * rate).to_integral_value(ROUND_HALF_EVEN))
+        if units > MAX_UNITS - self.units:
+            #more than the balance can hold; nothing is paid
+            return 0
+        if units > 0:
+            self.units += units
+            self.transactions.add_units("Interest", units, "Success")
+            _emit("interest", "Interest of ${amount} paid. New balance is: ${balance}", status="success",
+                  account=self.account_number, amount=from_units(units, self.places), balance=self.balance)
+        return units
+
     def get_account_type(self):
         return "Savings Account"
         
@@ -91,30 +228,38 @@ class SavingsAccount(Account):
 class CheckingAccount(Account):
 
     def deposit(self, amount):
-        if amount > 0:
-            self.balance += amount
-            self.transactions.append(Transaction("Deposit", amount, "Success"))
-            print(f"Deposited ${amount} into Checking. New balance is: ${self.balance}")
+        units = _operation_units(amount, self.places)
+        if 0 < units <= MAX_UNITS - self.units:
+            self.units += units
+            self.transactions.add_units("Deposit", units, "Success")
+            _emit("deposit", "Deposited ${amount} into Checking. New balance is: ${balance}",
+                  status="success", account=self.account_number, amount=from_units(units, self.places),
+                  balance=self.balance)
             return True
         else:
-            self.transactions.append(Transaction("Deposit", amount, "Failed"))
-            print("Invalid amount")
+            self.transactions.add_units("Deposit", units, "Failed")
+            _emit("deposit", "Invalid amount", status="failed", account=self.account_number, amount=amount)
             return False
     
     
     def withdraw(self, amount):
         #withdraw rule for Checking Account.
-        fee = 2
-        total = amount + fee
+        units = _operation_units(amount, self.places)
+        fee = to_units(2, self.places)
+        total = units + fee
         #withdrawing from a checking account will lead to $2 fee
-        if amount > 0 and total <= self.balance:
-            self.balance -= total
-            self.transactions.append(Transaction("Withdrawal", amount, "Success"))
-            print(f"Withdraw ${amount} + ${fee} fee. Remaining balance: ${self.balance}.")
+        if units > 0 and total <= self.units:
+            self.units -= total
+            self.transactions.add_units("Withdrawal", units, "Success")
+            #the fee is its own entry so the history adds up to the balance
+            self.transactions.add_units("Fee", fee, "Success")
+            _emit("withdraw", "Withdraw ${amount} + ${fee} fee. Remaining balance: ${balance}.",
+                  status="success", account=self.account_number, amount=from_units(units, self.places),
+                  fee=from_units(fee, self.places), balance=self.balance)
             return True
         else:
-            self.transactions.append(Transaction("Withdrawal", amount, "Failed"))
-            print("Invalid amount")
+            self.transactions.add_units("Withdrawal", units, "Failed")
+            _emit("withdraw", "Invalid amount", status="failed", account=self.account_number, amount=amount)
             return False
 
     
@@ -125,29 +270,35 @@ class CheckingAccount(Account):
 #Business Account
 class BusinessAccount(Account):
     def deposit(self, amount):
-        if amount > 0:
-            self.balance += amount
-            self.transactions.append(Transaction("Deposit", amount, "Success"))
-            print(f"Deposited ${amount} into Business account. New balance is: ${self.balance}")
+        units = _operation_units(amount, self.places)
+        if 0 < units <= MAX_UNITS - self.units:
+            self.units += units
+            self.transactions.add_units("Deposit", units, "Success")
+            _emit("deposit", "Deposited ${amount} into Business account. New balance is: ${balance}",
+                  status="success", account=self.account_number, amount=from_units(units, self.places),
+                  balance=self.balance)
             return True
         else:
-            self.transactions.append(Transaction("Deposit", amount, "Failed"))
-            print("Invalid amount")
+            self.transactions.add_units("Deposit", units, "Failed")
+            _emit("deposit", "Invalid amount", status="failed", account=self.account_number, amount=amount)
             return False
         
     
     
     def withdraw(self, amount):
         #Business Account must have a $500 as a minimum balance
-        min_balance = 500
-        if amount > 0 and self.balance - amount >=min_balance:
-            self.balance -= amount
-            self.transactions.append(Transaction("Withdrawal", amount, "Success"))
-            print(f"Withdraw ${amount}. Remaining balance: ${self.balance}.")
+        units = _operation_units(amount, self.places)
+        min_balance = to_units(500, self.places)
+        if units > 0 and self.units - units >=min_balance:
+            self.units -= units
+            self.transactions.add_units("Withdrawal", units, "Success")
+            _emit("withdraw", "Withdraw ${amount}. Remaining balance: ${balance}.", status="success",
+                  account=self.account_number, amount=from_units(units, self.places), balance=self.balance)
             return True
         else:
-            self.transactions.append(Transaction("Withdrawal", amount, "Failed"))
-            print("Invalid amount. Minimum balance should be $500")
+            self.transactions.add_units("Withdrawal", units, "Failed")
+            _emit("withdraw", "Invalid amount. Minimum balance should be $500", status="failed",
+                  account=self.account_number, amount=amount)
             return False
         
     
@@ -156,45 +307,61 @@ class BusinessAccount(Account):
     
 #crypto Wallet(doent inherit from Account)
 class CryptoWallet:
+    #coins are divisible down to 10 ** -8
+    places = 8
+
     def __init__(self, wallet_id, holder_name, balance=0):
         self.account_number = wallet_id          
         self.holder_name = holder_name
-        self.__balance = balance                 
-        self.transactions = []
+        self.__balance = to_units(balance, self.places)
+        self.transactions = TransactionStore(self.places)
         self.password = None
     
     @property
     def balance(self):
-        return self.__balance
+        return from_units(self.__balance, self.places)
 
     @balance.setter
     def balance(self, amount):
-        if amount < 0:
+        self.units = to_units(amount, self.places)
+
+    @property
+    def units(self):
+        return self.__balance
+
+    @units.setter
+    def units(self, units):
+        if units < 0:
             raise ValueError("Balance cannot be negative.")
-        self.__balance = amount
+        self.__balance = units
 
     def deposit(self, amount):
 
-        if amount > 0:
-            self.balance = self.balance + amount
-            self.transactions.append(Transaction("Deposit", amount, "Success"))
-            print(f"Deposited {amount} coin(s). New balance is: {self.balance}")
+        units = _operation_units(amount, self.places)
+        if 0 < units <= MAX_UNITS - self.units:
+            self.units = self.units + units
+            self.transactions.add_units("Deposit", units, "Success")
+            _emit("deposit", "Deposited {amount} coin(s). New balance is: {balance}", status="success",
+                  account=self.account_number, amount=from_units(units, self.places), balance=self.balance)
             return True
         else:
-            self.transactions.append(Transaction("Deposit", amount, "Failed"))
-            print("Invalid amount")
+            self.transactions.add_units("Deposit", units, "Failed")
+            _emit("deposit", "Invalid amount", status="failed", account=self.account_number, amount=amount)
             return False
     
     def withdraw(self, amount):
 
-        if 0 < amount <= self.balance:
-            self.balance = self.balance - amount
-            self.transactions.append(Transaction("Withdrawal", amount, "Success"))
-            print(f"Withdrew {amount} coin(s). Remaining balance is: {self.balance}")
+        units = _operation_units(amount, self.places)
+        if 0 < units <= self.units:
+            self.units = self.units - units
+            self.transactions.add_units("Withdrawal", units, "Success")
+            _emit("withdraw", "Withdrew {amount} coin(s). Remaining balance is: {balance}",
+                  status="success", account=self.account_number, amount=from_units(units, self.places),
+                  balance=self.balance)
             return True
         else:
-            self.transactions.append(Transaction("Withdrawal", amount, "Failed"))
-            print("Invalid amount")
+            self.transactions.add_units("Withdrawal", units, "Failed")
+            _emit("withdraw", "Invalid amount", status="failed", account=self.account_number, amount=amount)
             return False
     
     def get_account_type(self):
@@ -205,11 +372,15 @@ class CryptoWallet:
 
 
 class Transaction:
-    def __init__(self, type, amount, status):
+    __slots__ = ("type", "amount", "status", "timestamp", "op_id")
+
+    def __init__(self, type, amount, status, timestamp=None, op_id=None):
         self.type = type
         self.amount = amount
-        self.timestamp = datetime.now()
+        self.timestamp = timestamp or datetime.now()
         self.status = status
+        #id of the Bank operation this entry records, if the caller gave one
+        self.op_id = op_id
 
     def __str__(self):
         return(f"Transaction:{self.type} | " 
@@ -218,159 +389,2055 @@ class Transaction:
                f"Time:{self.timestamp.strftime('%Y-%m-%d %H:%M:%S')}")
     
     
-#central controller for all accounts and transactions
-class Bank:
-    def __init__(self):
-        self.accounts = {} 
-        self.file = "bank_data.json"
-        self.load_data() #load saved data when program starts
-    
-    def save_data(self):
-        data = {} #create dictionary
-
-        for acc_num, acc in self.accounts.items():
-            key = str(acc_num)
-            data[key]={
-                "account_type": acc.get_account_type(),
-                "holder_name": acc.holder_name,
-                "balance": acc.balance,
-                "password": acc.password,
-                "transactions": [
-                    {
-                        "type": t.type,
-                        "amount": t.amount,
-                        "status": t.status,
-                        "timestamp": t.timestamp.strftime("%Y-%m-%d %H:%M:%S")
-                    }
-                    for t in acc.transactions
-                ],
+#transaction types and statuses are stored as one-byte codes into these tables
+_TYPE_NAMES = ["Deposit", "Withdraw", "Withdrawal", "Transfer In", "Transfer Out", "OpeningDeposit", "Fee",
+               "Interest"]
+_STATUS_NAMES = ["Success", "Failed"]
+_TYPE_CODES = {name: code for code, name in enumerate(_TYPE_NAMES)}
+_STATUS_CODES = {name: code for code, name in enumerate(_STATUS_NAMES)}
+
+#how a successful transaction moves the balance. A transfer is also recorded
+#as a Deposit and a Withdraw(al), so its own entries move nothing; neither do
+#failed transactions.
+_TYPE_SIGNS = {"Deposit": 1, "OpeningDeposit": 1, "Interest": 1, "Withdraw": -1, "Withdrawal": -1, "Fee": -1}
+
+
+def _intern(names, codes, name):
+    code = codes.get(name)
+    if code is None:
+        if len(names) == 256:
+            raise ValueError(f"Too many distinct transaction types or statuses: {name!r}")
+        code = codes[name] = len(names)
+        names.append(name)
+    return code
+
+
+#held while a lazy history is loaded or pointed somewhere else
+_sources_lock = threading.RLock()
+
+
+#columnar transaction history: parallel typed arrays instead of one object per
+#transaction. Transaction objects are only built when entries are read.
+#Amounts are kept in minor units of the owning account (see to_units), so
+#balances and totals are exact integer sums.
+class TransactionStore:
+    #a checkpoint (running balance, successful and failed counts) is kept for
+    #every this many entries, so a historical balance only replays the
+    #entries after the nearest one
+    checkpoint_every = 64
+
+    def __init__(self, places=2):
+        self.places = places
+        self.types = array("B")
+        self.statuses = array("B")
+        self.amounts = array("q") #minor units
+        self.timestamps = array("d") #seconds since the epoch
+        self._source = None
+        #entries moved to the archive by a retention policy (see
+        #bank_archive.py). They come first and keep their positions; what
+        #they add up to is kept so totals never have to read them.
+        self._archived = 0
+        self._archived_totals = (0, 0, 0)
+        self.archive_months = [] #"YYYY-MM" segments holding them
+        self._archive = None #(TransactionArchive, account key)
+        self._count = 0 #entries still in the snapshot when loading lazily
+        self._between = None #searches those entries by time without loading them
+        #timestamps are appended in time order, so range queries can bisect
+        #them directly; None when not known yet
+        self._sorted = True
+        self._by_time = None #(positions, timestamps) sorted by time otherwise
+        #totals before entry 0, checkpoint_every, 2 * checkpoint_every, ...;
+        #extended when a historical query needs them
+        self._checkpoints = [(0, 0, 0)]
+        #operation ids: position -> op id and op id -> position; None until
+        #the first entry is tagged
+        self._op_ids = None
+        self._op_positions = None
+
+    #history that stays in the snapshot until something first reads it;
+    #loader returns a TransactionStore with the first count entries, and
+    #between(start, end), if given, the Transactions among them in that
+    #time range, oldest first
+    @classmethod
+    def lazy(cls, count, loader, between=None, places=2):
+        store = cls(places)
+        store._source = loader
+        store._count = count
+        store._between = between
+        return store
+
+    @property
+    def loaded(self):
+        return self._source is None
+
+    def load(self):
+        if self._source is None:
+            return self
+        with _sources_lock:
+            if self._source is None:
+                return self
+            head = self._source()
+            for name in ("types", "statuses", "amounts", "timestamps"):
+                setattr(self, name, getattr(head, name) + getattr(self, name))
+            if head._op_ids:
+                #positions are absolute, so the tail's tags stay valid
+                for position, op_id in (self._op_ids or {}).items():
+                    head.tag(position, op_id)
+                self._op_ids, self._op_positions = head._op_ids, head._op_positions
+            self._source = None
+            self._count = 0
+            self._sorted = None
+            self._by_time = None
+        return self
+
+    def repoint(self, source, loader):
+        #switches an unloaded history from source over to loader, which reads
+        #the same entries from elsewhere; not once it has been loaded
+        with _sources_lock:
+            if self._source is source:
+                self._source = loader
+
+    def frozen(self):
+        #a copy of the entries as they are now, which later changes leave
+        #alone; an unloaded history is shared, since it is only ever read
+        frozen = copy.copy(self)
+        for name in ("types", "statuses", "amounts", "timestamps"):
+            setattr(frozen, name, getattr(self, name)[:])
+        frozen.archive_months = list(self.archive_months)
+        frozen._checkpoints = list(self._checkpoints)
+        frozen._by_time = None
+        if self._op_ids:
+            frozen._op_ids, frozen._op_positions = dict(self._op_ids), dict(self._op_positions)
+        return frozen
+
+    @classmethod
+    def from_records(cls, records, places=2, archived=0):
+        #archived: how many archived entries come before records
+        store = cls(places)
+        store._archived = archived
+        for t in records:
+            store.add_record(t)
+        return store
+
+    def add(self, type, amount, status, timestamp=None):
+        self.add_units(type, to_units(amount, self.places), status, timestamp)
+
+    def add_units(self, type, units, status, timestamp=None):
+        #everything is checked before the first column grows, so the columns
+        #never get out of step
+        if not -MAX_UNITS <= units <= MAX_UNITS:
+            raise ValueError(f"Amount out of range: {units!r} units")
+        type = _intern(_TYPE_NAMES, _TYPE_CODES, type)
+        status = _intern(_STATUS_NAMES, _STATUS_CODES, status)
+        timestamp = time.time() if timestamp is None else timestamp.timestamp()
+        if self._sorted and self.timestamps and timestamp < self.timestamps[-1]:
+            self._sorted = False
+        self._by_time = None
+        self.amounts.append(units)
+        self.types.append(type)
+        self.statuses.append(status)
+        self.timestamps.append(timestamp)
+
+    def add_record(self, t):
+        #t is a transaction as written to the data file
+        timestamp = t.get("timestamp")
+        if timestamp:
+            timestamp = datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S")
+        self.add(t["type"], t["amount"], t["status"], timestamp)
+        if "op_id" in t:
+            self.tag(len(self) - 1, t["op_id"])
+
+    def tag(self, position, op_id):
+        #records that the entry at position was written by operation op_id
+        if self._op_ids is None:
+            self._op_ids, self._op_positions = {}, {}
+        self._op_ids[position] = op_id
+        self._op_positions[op_id] = position
+
+    def find_op(self, op_id):
+        #position of the entry tagged with op_id, or None
+        self.load()
+        if self._op_positions is None:
+            return None
+        return self._op_positions.get(op_id)
+
+    def append(self, transaction):
+        self.add(transaction.type, transaction.amount, transaction.status, transaction.timestamp)
+        if transaction.op_id is not None:
+            self.tag(len(self) - 1, transaction.op_id)
+
+    def truncate(self, count):
+        #drop every entry from position count on
+        if count < self._archived:
+            raise ValueError("Archived transactions cannot be truncated")
+        if count < self._archived + self._count:
+            self.load()
+        start = count - self._archived - self._count
+        for name in ("types", "statuses", "amounts", "timestamps"):
+            del getattr(self, name)[start:]
+        self._by_time = None
+        del self._checkpoints[start // self.checkpoint_every + 1:]
+        if self._op_ids:
+            for position in [position for position in self._op_ids if position >= count]:
+                del self._op_positions[self._op_ids.pop(position)]
+
+    def between(self, start=None, end=None):
+        #transactions with start <= timestamp <= end (datetimes, either may be
+        #None), oldest first, found by bisecting the timestamps
+        rows = self._between_kept(start, end)
+        if self._archived:
+            #only the archive months the range overlaps are read
+            rows = sorted(self._archived_rows(start, end) + rows, key=lambda t: t.timestamp)
+        return rows
+
+    def _between_kept(self, start, end):
+        if self._source is not None and self._between is not None:
+            #the storage searches the entries it still holds
+            lo = float("-inf") if start is None else start.timestamp()
+            hi = float("inf") if end is None else end.timestamp()
+            tail = [self._row(i) for i, timestamp in enumerate(self.timestamps) if lo <= timestamp <= hi]
+            return sorted(self._between(start, end) + tail, key=lambda t: t.timestamp)
+        self.load()
+        timestamps = self.timestamps
+        if self._is_sorted():
+            positions, keys = None, timestamps
+        else:
+            if self._by_time is None:
+                order = sorted(range(len(timestamps)), key=timestamps.__getitem__)
+                self._by_time = (order, array("d", (timestamps[i] for i in order)))
+            positions, keys = self._by_time
+
+        lo = 0 if start is None else bisect_left(keys, start.timestamp())
+        hi = len(keys) if end is None else bisect_right(keys, end.timestamp())
+        if positions is None:
+            return [self._row(i) for i in range(lo, hi)]
+        return [self._row(i) for i in positions[lo:hi]]
+
+    def _is_sorted(self):
+        if self._sorted is None:
+            timestamps = self.timestamps
+            self._sorted = all(a <= b for a, b in zip(timestamps, islice(timestamps, 1, None)))
+        return self._sorted
+
+    def _fold(self, totals, start, stop, until=None, inclusive=True):
+        #totals after applying entries start..stop-1 to totals; with until,
+        #entries later than that timestamp (or at it, if not inclusive) are skipped
+        balance, succeeded, failed = totals
+        signs = [_TYPE_SIGNS.get(name, 0) for name in _TYPE_NAMES]
+        success = _STATUS_CODES["Success"]
+        for i in range(start, stop):
+            if until is not None and (self.timestamps[i] > until if inclusive else self.timestamps[i] >= until):
+                continue
+            if self.statuses[i] == success:
+                balance += signs[self.types[i]] * self.amounts[i]
+                succeeded += 1
+            else:
+                failed += 1
+        return balance, succeeded, failed
+
+    def _totals_at(self, position):
+        #totals of the first position entries: the nearest checkpoint plus the
+        #entries after it
+        every = self.checkpoint_every
+        checkpoints = self._checkpoints
+        k = position // every
+        while len(checkpoints) <= k:
+            last = len(checkpoints) - 1
+            checkpoints.append(self._fold(checkpoints[last], last * every, (last + 1) * every))
+        return self._fold(checkpoints[k], k * every, position)
+
+    def totals(self, timestamp=None, inclusive=True):
+        #(balance, successful count, failed count) over the entries up to
+        #timestamp (a datetime; None for all of them). The balance is what the
+        #successful entries add up to.
+        units, succeeded, failed = self.unit_totals(timestamp, inclusive)
+        return from_units(units, self.places), succeeded, failed
+
+    def unit_totals(self, timestamp=None, inclusive=True):
+        #totals() with the balance in minor units
+        self.load()
+        if timestamp is None:
+            return self._totals_at(len(self.types))
+        until = timestamp.timestamp()
+        if not self._is_sorted():
+            #out of order entries cannot use the checkpoints
+            return self._fold(self._archived_totals_at(until, inclusive), 0, len(self.types), until, inclusive)
+        find = bisect_right if inclusive else bisect_left
+        position = find(self.timestamps, until)
+        if position == 0 and self._archived:
+            #earlier than everything kept in memory
+            return self._archived_totals_at(until, inclusive)
+        return self._totals_at(position)
+
+    def balance_as_of(self, timestamp):
+        #balance right after the last entry at or before timestamp
+        return self.totals(timestamp)[0]
+
+    def _amount(self, i):
+        return from_units(self.amounts[i], self.places)
+
+    def _row(self, i):
+        op_id = self._op_ids.get(i + self._archived + self._count) if self._op_ids else None
+        return Transaction(_TYPE_NAMES[self.types[i]], self._amount(i),
+                           _STATUS_NAMES[self.statuses[i]],
+                           datetime.fromtimestamp(self.timestamps[i]), op_id)
+
+    def records(self, start=0):
+        #entries from start on in the data file layout, without building
+        #Transactions; archived entries are left out
+        start = max(start, self._archived)
+        if start < self._archived + self._count:
+            self.load()
+        offset = self._archived + self._count
+        second = text = None
+        op_ids = self._op_ids
+        places = self.places
+        for i in range(start - offset, len(self.types)):
+            #timestamps are written to the second; consecutive entries usually share one
+            if int(self.timestamps[i]) != second:
+                second = int(self.timestamps[i])
+                text = datetime.fromtimestamp(second).strftime("%Y-%m-%d %H:%M:%S")
+            record = {
+                "type": _TYPE_NAMES[self.types[i]],
+                "amount": _json_amount(self.amounts[i], places),
+                "status": _STATUS_NAMES[self.statuses[i]],
+                "timestamp": text
             }
-        with open(self.file, "w") as f:
-            json.dump(data, f, indent=4) 
+            if op_ids and i + offset in op_ids:
+                record["op_id"] = op_ids[i + offset]
+            yield record
+
+    def export_records(self):
+        #every entry, archived ones included, in the data file layout; unlike
+        #records(), a history still in the snapshot is read without keeping it
+        yield from self._archived_records()
+        if self._source is None:
+            yield from self.records()
+            return
+        head = self._source()
+        #loaders number their entries from 0; op ids are tagged by absolute position
+        head._archived = self._archived
+        yield from head.records()
+        yield from self.records(self._archived + self._count)
 
-    def load_data(self):
-        try:
-            with open(self.file, "r") as f:
-                data = json.load(f)
-            for acc_num, info in data.items():
-                acct_type = info["account_type"].lower()
-                holder = info["holder_name"]
-                balance = info["balance"]
-
-                if "savings" in acct_type:
-                    acc = SavingsAccount(acc_num, holder, balance)
-                elif "checking" in acct_type:
-                    acc = CheckingAccount(acc_num, holder, balance)
-                elif "business" in acct_type:
-                    acc = BusinessAccount(acc_num, holder, balance)
-                elif "crypto" in acct_type:
-                    acc = CryptoWallet(acc_num, holder, balance)
+    @property
+    def archived(self):
+        return self._archived
+
+    def archive_info(self):
+        #what a snapshot keeps about the archived entries, or None
+        if not self._archived:
+            return None
+        balance, succeeded, failed = self._archived_totals
+        return {"count": self._archived, "balance": _json_amount(balance, self.places),
+                "succeeded": succeeded, "failed": failed, "months": self.archive_months}
+
+    def attach_archive(self, archive, key, info):
+        #restores archive_info() read back from a snapshot, before any entry
+        #is added; archive reads the archived entries of account key
+        self._archive = (archive, key)
+        self._archived = info["count"]
+        self._archived_totals = (to_units(info["balance"], self.places), info["succeeded"], info["failed"])
+        self.archive_months = list(info["months"])
+        self._checkpoints = [self._archived_totals]
+
+    def archive_prefix(self, count, months, archive, key):
+        #forgets the first count entries kept in memory once archive holds
+        #them, in the given months
+        self.load()
+        totals = self._totals_at(count)
+        for name in ("types", "statuses", "amounts", "timestamps"):
+            del getattr(self, name)[:count]
+        self._archive = (archive, key)
+        self._archived += count
+        self._archived_totals = totals
+        self.archive_months = sorted(set(self.archive_months) | set(months))
+        self._checkpoints = [totals]
+        self._by_time = None
+        if self._op_ids:
+            #retries of archived operations are no longer recognised
+            for position in [position for position in self._op_ids if position < self._archived]:
+                del self._op_positions[self._op_ids.pop(position)]
+
+    def _archived_records(self, start=None, end=None):
+        if not self._archived:
+            return []
+        archive, key = self._archive
+        return archive.read(key, self.archive_months, self._archived, start, end)
+
+    def _archived_rows(self, start=None, end=None):
+        places = self.places
+        return [Transaction(t["type"], from_units(to_units(t["amount"], places), places), t["status"],
+                            datetime.strptime(t["timestamp"], "%Y-%m-%d %H:%M:%S"), t.get("op_id"))
+                for t in self._archived_records(start, end)]
+
+    def _archived_totals_at(self, until, inclusive):
+        #totals of the archived entries up to until (epoch seconds): the kept
+        #totals minus the archived entries after it
+        balance, succeeded, failed = self._archived_totals
+        for t in self._archived_records(datetime.fromtimestamp(until)):
+            timestamp = datetime.strptime(t["timestamp"], "%Y-%m-%d %H:%M:%S").timestamp()
+            if timestamp > until if inclusive else timestamp >= until:
+                if t["status"] == "Success":
+                    balance -= _TYPE_SIGNS.get(t["type"], 0) * to_units(t["amount"], self.places)
+                    succeeded -= 1
                 else:
-                    continue
+                    failed -= 1
+        return balance, succeeded, failed
+
+    def __len__(self):
+        return self._archived + self._count + len(self.types)
+
+    def oldest(self):
+        #timestamp of the first entry not archived, or None without any. A
+        #history still in the snapshot asks its loader, which can usually
+        #tell without reading the rest of it
+        if self._source is not None:
+            oldest = getattr(self._source, "oldest", None)
+            timestamp = oldest() if oldest is not None else None
+            if timestamp is not None:
+                return timestamp
+            self.load()
+        return self.timestamps[0] if self.timestamps else None
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __iter__(self):
+        yield from self._archived_rows()
+        self.load()
+        for i in range(len(self.types)):
+            yield self._row(i)
+
+    def __getitem__(self, index):
+        #entries appended since startup can be read without touching the
+        #snapshot, and kept entries without reading the archive
+        if isinstance(index, slice):
+            positions = range(*index.indices(len(self)))
+            if not positions:
+                return []
+            low, high = min(positions), max(positions)
+            old = self._archived_rows() if low < self._archived else None
+            if low < self._archived + self._count and high >= self._archived:
+                self.load()
+            offset = self._archived + self._count
+            return [old[i] if i < self._archived else self._row(i - offset) for i in positions]
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("transaction index out of range")
+        if index < self._archived:
+            return self._archived_rows()[index]
+        if index < self._archived + self._count:
+            self.load()
+        return self._row(index - self._archived - self._count)
+
+
+#append-only log of account changes, replayed on top of the snapshot at startup.
+#records are fsynced fsync_every at a time, and none stays unsynced for much
+#longer than fsync_interval seconds: the first record left unsynced starts a
+#timer that syncs it even if nothing is appended after it
+class Journal:
+    def __init__(self, path, fsync_every=64, fsync_interval=1.0):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.records = 0 #records written since the last compaction
+        self.bytes = 0 #and their size
+        self._file = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        #the timer runs on a thread of its own
+        self._lock = threading.RLock()
+        self._timer = None
+
+    def append(self, record):
+        #returns the number of bytes written
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a")
+            self._file.write(line)
+            self._file.flush()
+            self.records += 1
+            self.bytes += len(line)
+            self._unsynced += 1
+
+            #fsync in batches instead of once per record
+            if (self._unsynced >= self.fsync_every
+                    or time.monotonic() - self._last_sync >= self.fsync_interval):
+                self.sync()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.fsync_interval, self._sync_late)
+                self._timer.daemon = True
+                self._timer.start()
+        #json.dumps escapes everything outside ASCII
+        return len(line)
+
+    def _sync_late(self):
+        with self._lock:
+            self._timer = None
+            self.sync()
+
+    def sync(self):
+        with self._lock:
+            if self._file is not None and self._unsynced:
+                os.fsync(self._file.fileno())
+            self._unsynced = 0
+            self._last_sync = time.monotonic()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def replay(self):
+        try:
+            with open(self.path, "r") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        #torn last line from a crash in the middle of a write
+                        break
+        except FileNotFoundError:
+            return
+
+    def reset(self):
+        self.close()
+        open(self.path, "w").close()
+        self.records = self.bytes = 0
 
-                acc.password = info["password"]
-                for t in info.get("transactions", []):
-                    acc.transactions.append(Transaction(t["type"], t["amount"], t["status"]))
-                self.accounts[int(acc_num)] = acc
+    def rotate(self, path):
+        #moves everything written so far to path and starts over empty
+        self.close()
+        try:
+            os.replace(self.path, path)
+        except FileNotFoundError:
+            pass
+        self.records = self.bytes = 0
+
+    def close(self):
+        with self._lock:
+            self.sync()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+#a JSON snapshot opened for lazy reads. It stays readable after a compaction
+#replaces the file, until the last history reading it is loaded or moved on
+class _SnapshotReader:
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        self._lock = threading.Lock()
+
+    def read(self, offset, length):
+        with self._lock:
+            self._file.seek(offset)
+            return self._file.read(length)
+
+
+#the transaction list of one account in a JSON snapshot, as the loader of a
+#lazy TransactionStore. cut: the list goes on in the snapshot past length
+#bytes, with entries added after this one was read
+_TIMESTAMP_FIELD = re.compile(rb'"timestamp": "([^"]+)"')
+
+
+class _JsonSegment:
+    def __init__(self, reader, offset, length, places=2, archived=0, cut=False):
+        self.reader = reader
+        self.offset = offset
+        self.length = length
+        self.places = places
+        self.archived = archived
+        self.cut = cut
+
+    def raw(self):
+        #the list as _write_snapshot() lays it out
+        data = self.reader.read(self.offset, self.length)
+        return data + b"\n        ]" if self.cut else data
+
+    def __call__(self):
+        return TransactionStore.from_records(json.loads(self.raw()), self.places, self.archived)
+
+    def oldest(self):
+        #timestamp of the first entry, read from the start of the list alone;
+        #None if it is not within the first few hundred bytes
+        head = self.reader.read(self.offset, min(self.length, 1024)).split(b"}", 1)[0]
+        match = _TIMESTAMP_FIELD.search(head)
+        if match is None:
+            return None
+        return datetime.strptime(match.group(1).decode(), "%Y-%m-%d %H:%M:%S").timestamp()
+
+
+def _index_path(path):
+    return os.path.splitext(path)[0] + ".idx"
+
+
+def _archive_path(path):
+    #where the archive of the snapshot at path is kept (see bank_archive.py)
+    return os.path.splitext(path)[0] + ".archive"
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+
+def _file_stamp(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+#writes the same layout as json.dump(data, f, indent=4), one account at a time,
+#and returns where each account's transaction list starts so it can be read
+#lazily. A history still unloaded from an earlier snapshot is copied from it
+#as it is, and noted in copied (if given) as account number -> (its old
+#loader, a loader for the same entries in this snapshot)
+def _write_snapshot(f, accounts, copied=None):
+    index = []
+    f.write(b"{")
+    for i, (acc_num, acc) in enumerate(accounts):
+        key = str(acc_num)
+        header = {
+            "account_type": acc.get_account_type(),
+            "holder_name": acc.holder_name,
+            "balance": _json_amount(acc.units, acc.places),
+            "password": acc.password,
+        }
+        archived = acc.transactions.archive_info()
+        if archived:
+            header["archived"] = archived
+        chunk = ("," if i else "") + "\n    " + json.dumps(key) + ": {\n"
+        for field, value in header.items():
+            chunk += "        " + json.dumps(field) + ": " + json.dumps(value) + ",\n"
+        chunk += '        "transactions": '
+        f.write(chunk.encode())
+
+        offset = f.tell()
+        store = acc.transactions
+        source = store._source
+        if isinstance(source, _JsonSegment):
+            body = source.raw()
+            head = len(body)
+            tail = list(store.records(store.archived + store._count))
+            if tail:
+                #the tail's entries go on where the copied ones end
+                head = len(body.rstrip(b"\n ]"))
+                body = body[:head] + b"," + _json_list(tail)[1:]
+            if copied is not None:
+                copied[acc_num] = (source, _JsonSegment(None, offset, head, acc.places, store.archived,
+                                                        head < len(body)))
+        else:
+            body = _json_list(list(store.records()))
+        f.write(body)
+        f.write(b"\n    }")
+        index.append([key, header["account_type"], header["holder_name"], header["balance"],
+                      header["password"], offset, len(body), len(acc.transactions) - acc.transactions.archived,
+                      archived])
+    f.write(b"\n}" if index else b"}")
+    return index
+
+
+def _json_list(records):
+    #a transaction list laid out as it is inside a snapshot
+    return json.dumps(records, indent=4).replace("\n", "\n        ").encode()
+
+
+#streams a snapshot written with indent=4 and collects the account headers,
+#skipping over transaction lists; returns None for any other layout
+def _scan_snapshot(path):
+    index = []
+    with open(path, "rb") as f:
+        first = f.readline()
+        if first.strip() != b"{":
+            return None
+        pos = len(first)
+        header = None
+        for line in f:
+            start = pos
+            pos += len(line)
+            stripped = line.strip()
+            if line.startswith(b'    "') and stripped.endswith(b"{"):
+                key = json.loads(stripped[:-1].rstrip()[:-1])
+                header = {}
+            elif header is None:
+                continue
+            elif stripped.startswith(b'"transactions": ['):
+                offset = start + line.index(b"[")
+                length = 2
+                count = 0
+                if not stripped.startswith(b'"transactions": []'):
+                    for line in f:
+                        pos += len(line)
+                        if line == b"            {\n":
+                            count += 1
+                        elif line.rstrip() == b"        ]":
+                            length = pos - len(line) + 9 - offset
+                            break
+                try:
+                    index.append([key, header["account_type"], header["holder_name"], header["balance"],
+                                  header["password"], offset, length, count, header.get("archived")])
+                except KeyError:
+                    return None
+                header = None
+            elif line.startswith(b'        "'):
+                header.update(json.loads(b"{" + stripped.rstrip(b",") + b"}"))
+    return index
+
+
+#where accounts and the bank report what they did. Every event has a name
+#(deposit, withdraw, transfer, create_account, ...), a message template with
+#{field} placeholders, and fields such as status, account, amount and balance.
+class EventSink(ABC):
+    @abstractmethod
+    def emit(self, event, message, **fields):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+#prints the messages, as the program always has
+class ConsoleSink(EventSink):
+    def emit(self, event, message, **fields):
+        print(message.format(**fields))
+
+
+#drops every event; for bulk processing
+class NullSink(EventSink):
+    def emit(self, event, message, **fields):
+        pass
+
+
+#keeps events in memory and appends them to a file as JSON lines, buffer_size
+#at a time; messages are not formatted
+class BufferedFileSink(EventSink):
+    def __init__(self, path, buffer_size=4096):
+        self.path = path
+        self.buffer_size = buffer_size
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._file = None
+        #json.dumps with options builds a new encoder on every call
+        self._encoder = json.JSONEncoder(separators=(",", ":"), default=str)
+
+    def emit(self, event, message, **fields):
+        #fields is a fresh dict for every call, so it can be stored as it is
+        fields["event"] = event
+        fields["time"] = time.time()
+        with self._lock:
+            self._buffer.append(fields)
+            if len(self._buffer) >= self.buffer_size:
+                self._write()
+
+    def _write(self):
+        if self._file is None:
+            self._file = open(self.path, "a")
+        encode = self._encoder.encode
+        lines = [encode(fields) for fields in self._buffer]
+        self._file.write("\n".join(lines) + "\n")
+        self._file.flush()
+        self._buffer.clear()
+
+    def flush(self):
+        with self._lock:
+            if self._buffer:
+                self._write()
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+_events = ConsoleSink()
+
+
+def set_event_sink(sink):
+    #sends every account and bank event to sink; returns the previous sink
+    global _events
+    previous, _events = _events, sink
+    return previous
+
+
+@contextlib.contextmanager
+def event_sink(sink):
+    #uses sink for the duration of a with block
+    previous = set_event_sink(sink)
+    try:
+        yield sink
+    finally:
+        set_event_sink(previous)
+
+
+#sinks set by thread_event_sink(), for the thread that set them only
+_thread_sinks = threading.local()
+
+
+def _emit(event, message, **fields):
+    (getattr(_thread_sinks, "sink", None) or _events).emit(event, message, **fields)
+
+
+@contextlib.contextmanager
+def thread_event_sink(sink):
+    #like event_sink(), but only for the events of the calling thread; the
+    #other threads keep sending theirs to the sink set for every thread
+    previous = getattr(_thread_sinks, "sink", None)
+    _thread_sinks.sink = sink
+    try:
+        yield sink
+    finally:
+        _thread_sinks.sink = previous
+
+
+def _quiet():
+    #drops the messages the calling thread would print; a sink that keeps
+    #events elsewhere still gets them
+    sink = getattr(_thread_sinks, "sink", None) or _events
+    return thread_event_sink(NullSink() if isinstance(sink, ConsoleSink) else sink)
+
+
+def _batch_op(op):
+    #ops are dicts such as {"op": "transfer", "from": 1, "to": 2, "amount": 10}
+    #or tuples such as ("deposit", 1, 50) and ("transfer", 1, 2, 10); dicts
+    #may carry an "op_id". Interest ops carry a rate instead of an amount:
+    #{"op": "interest", "account": 1, "rate": 0.01} or ("interest", 1, 0.01)
+    if isinstance(op, dict):
+        kind = op.get("op")
+        if kind == "transfer":
+            return kind, (op.get("from"), op.get("to")), op.get("amount"), op.get("op_id")
+        if kind == "interest":
+            return kind, (op.get("account"),), op.get("rate"), op.get("op_id")
+        return kind, (op.get("account"),), op.get("amount"), op.get("op_id")
+    kind, *args = op
+    return kind, tuple(args[:-1]), args[-1], None
+
+
+def _account_class(account_type):
+    acct_type = account_type.lower()
+    if "savings" in acct_type:
+        return SavingsAccount
+    elif "checking" in acct_type:
+        return CheckingAccount
+    elif "business" in acct_type:
+        return BusinessAccount
+    elif "crypto" in acct_type:
+        return CryptoWallet
+    return None
+
+
+def _make_account(account_type, acc_num, holder, balance):
+    cls = _account_class(account_type)
+    if cls is None:
+        return None
+    return cls(acc_num, holder, balance)
+
+
+def _frozen(acc):
+    #a copy of acc as it is now, for a snapshot written while acc changes
+    frozen = copy.copy(acc)
+    frozen.transactions = acc.transactions.frozen()
+    return frozen
+
+
+#where a Bank keeps its accounts. The bank hands its backend change records
+#built by Bank.save_data(): {account number: entry}, where an entry has the
+#balance, the position "n" of its first new transaction and the transactions
+#added since the last save, plus account_type and holder_name the first time
+#the account is saved and its password then and whenever it changes.
+#Balances and amounts are JSON numbers in whole currency units, exact to the
+#account's places; accounts read them back into minor units.
+class StorageBackend(ABC):
+    #True when compact() rewrites everything from the accounts in memory, so
+    #no account may change while it runs
+    rewrites = False
+    #True when the accounts load() leaves to be built on first use are built
+    #from what write() stores, so an account saved since can be built again
+    reads_back = False
+
+    @abstractmethod
+    def load(self, bank):
+        #fills bank.accounts at startup
+        pass
+
+    @abstractmethod
+    def write(self, record):
+        #persists one change record, all of it or none of it; returns the
+        #number of bytes written, or None if the backend cannot tell
+        pass
+
+    def uncompacted(self):
+        #records written since the last compaction
+        return 0
+
+    def uncompacted_bytes(self):
+        #bytes written since the last compaction
+        return 0
+
+    def snapshot_size(self):
+        #bytes of what compact() folds them into
+        return 0
+
+    def compact(self, bank):
+        #a backend that rewrites may return a function that finishes the job
+        #from copies of the accounts; it is called once they are unlocked
+        pass
+
+    #holder searches for backends that leave accounts out of the bank's
+    #in-memory holder index; names are casefolded
+    def holder_accounts(self, name):
+        #account numbers of the accounts held by name
+        return ()
+
+    def holder_prefix(self, prefix):
+        #(name, account number) pairs for the names starting with prefix
+        return ()
+
+    def sync(self):
+        pass
+
+    def close(self):
+        pass
+
+
+#a JSON (or binary, see bank_binary.py) snapshot plus an append-only journal
+#that compact() folds back into it
+class JsonBackend(StorageBackend):
+    rewrites = True
+
+    def __init__(self, file="bank_data.json", lazy=False, snapshot_format="json", retention=None):
+        self.file = file
+        #lazy: stream account headers at startup and read each transaction
+        #history from the snapshot only when it is first used
+        self.lazy = lazy
+        #"json" or "binary" (see bank_binary.py)
+        if snapshot_format not in ("json", "binary"):
+            raise ValueError(f"Unknown snapshot format: {snapshot_format}")
+        self.snapshot_format = snapshot_format
+        self.journal = Journal(os.path.splitext(file)[0] + ".journal")
+        #retention: a bank_archive.RetentionPolicy; every compaction then
+        #moves older transactions to gzip segments in <file>.archive/
+        self.retention = retention
+        self._archive = None
+        #the journal a compaction started from, until its snapshot is in place
+        self._pending = self.journal.path + ".compacting"
+        self._snapshot_size = 0
+
+    @property
+    def archive(self):
+        #the TransactionArchive next to the snapshot, opened on first use
+        if self._archive is None:
+            from bank_archive import TransactionArchive
+            self._archive = TransactionArchive(_archive_path(self.file))
+        return self._archive
+
+    def load(self, bank):
+        self._fold_pending()
+        self._snapshot_size = _file_size(self.file)
+        try:
+            if self.snapshot_format == "binary":
+                self._load_binary(bank)
+            elif not (self.lazy and self._load_headers(bank)):
+                self._load_snapshot(bank)
         except FileNotFoundError:
             # If no file exists yet, just start empty
             pass
-            
-            
-    
-    def create_account(self, account_type, account_number, holder_name, balance = 0):
 
-        #prevent duplicates account number
-        if account_number in self.accounts:
-            print(f"Account number {account_number} already exists. Please use a different number.")
+        #replay everything saved since the last compaction
+        replayed = 0
+        for record in self.journal.replay():
+            for acc_num, entry in record.items():
+                self._apply_journal_entry(bank, acc_num, entry)
+            replayed += 1
+        self.journal.records = replayed
+        self.journal.bytes = _file_size(self.journal.path)
+
+    def read(self, bank):
+        #fills bank.accounts like load() but writes nothing, for reading a
+        #ledger without taking it over: no index is built, and the journal
+        #of an unfinished compaction is replayed where it lies
+        try:
+            if self.snapshot_format == "binary":
+                self._load_binary(bank)
+            else:
+                self._load_snapshot(bank)
+        except FileNotFoundError:
+            pass
+        for path in (self._pending, self.journal.path):
+            for record in Journal(path).replay():
+                for acc_num, entry in record.items():
+                    self._apply_journal_entry(bank, acc_num, entry)
+
+    def write(self, record):
+        return self.journal.append(record)
+
+    def uncompacted(self):
+        return self.journal.records
+
+    def uncompacted_bytes(self):
+        return self.journal.bytes
+
+    def snapshot_size(self):
+        return self._snapshot_size
+
+    def compact(self, bank):
+        #with every account locked: archives, copies the accounts and starts
+        #a new journal. The returned function writes the snapshot from the
+        #copies, then drops the old journal; what is saved in the meantime
+        #goes to the new one
+        if self.retention is not None:
+            from bank_archive import archive_transactions
+            archive_transactions(self.archive, self.retention, bank.accounts.values())
+        accounts = [(acc_num, _frozen(acc)) for acc_num, acc in bank.accounts.items()]
+        #a journal left by a compaction that failed is still needed
+        self._fold_pending()
+        self.journal.rotate(self._pending)
+        if self.snapshot_format == "binary":
+            return partial(self._compact_binary, bank, accounts)
+        return partial(self._compact_json, bank, accounts)
+
+    def sync(self):
+        self.journal.sync()
+
+    def close(self):
+        self.journal.close()
+
+    def _compact_json(self, bank, accounts):
+        #write the new snapshot next to the old one and swap it in atomically.
+        #Histories nobody has read are copied over without being parsed
+        tmp = self.file + ".tmp"
+        copied = {}
+        with open(tmp, "wb") as f:
+            index = _write_snapshot(f, accounts, copied)
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+        os.replace(tmp, self.file)
+        self._write_index(index)
+        if copied:
+            #those still unread move to the new snapshot, so the old one can go
+            reader = _SnapshotReader(self.file)
+            for acc_num, (source, segment) in copied.items():
+                acc = dict.get(bank.accounts, acc_num)
+                if acc is not None:
+                    segment.reader = reader
+                    acc.transactions.repoint(source, segment)
+        self._compacted(size)
+
+    def _compact_binary(self, bank, accounts):
+        from bank_binary import BinarySnapshot, MappedAccounts, _state, write_binary_snapshot
+
+        #lazy histories still point into the old map, which stays valid
+        #after the file is replaced
+        tmp = self.file + ".tmp"
+        with open(tmp, "wb") as f:
+            write_binary_snapshot(f, (acc for _, acc in accounts))
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+        os.replace(tmp, self.file)
+        #what the new snapshot holds for each account it was written from
+        states = {int(acc_num): _state(acc) for acc_num, acc in accounts}
+        accounts = bank._mapped_accounts(BinarySnapshot(self.file, self.archive))
+        #accounts built or created since the copies were taken move over too
+        with bank._create_lock:
+            if isinstance(bank.accounts, MappedAccounts):
+                bank.accounts.hand_over(accounts, states)
+            else:
+                accounts.adopt(bank.accounts, states)
+            bank.accounts = accounts
+        accounts.trim()
+        self._compacted(size)
+
+    def _compacted(self, size):
+        #the snapshot holds everything in the old journal now
+        self._snapshot_size = size
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self._pending)
+
+    def _fold_pending(self):
+        #puts a journal left by an unfinished compaction back in front of the
+        #current one. Replaying a record twice changes nothing, so a crash
+        #half way through loses nothing either
+        try:
+            with open(self._pending, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
             return
-    
-        if account_type.lower() == "business" and balance < 500:
-            print("Business accounts require a minimum $500 opening balance.")
+        #a torn last line would swallow the first line after it
+        data = data[:data.rfind(b"\n") + 1]
+        self.journal.close()
+        try:
+            with open(self.journal.path, "rb") as f:
+                data += f.read()
+        except FileNotFoundError:
+            pass
+        tmp = self.journal.path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.journal.path)
+        os.remove(self._pending)
+        self.journal.bytes = len(data)
+
+    def _write_index(self, index):
+        path = _index_path(self.file)
+        with open(path + ".tmp", "w") as f:
+            json.dump({"snapshot": _file_stamp(self.file), "accounts": index}, f)
+        os.replace(path + ".tmp", path)
+
+    def _read_index(self):
+        #the index is only trusted if it was written for the current snapshot
+        try:
+            with open(_index_path(self.file), "r") as f:
+                index = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if index.get("snapshot") != _file_stamp(self.file):
+            return None
+        return index["accounts"]
+
+    def _load_headers(self, bank):
+        index = self._read_index()
+        if index is None:
+            index = _scan_snapshot(self.file)
+            if index is None:
+                return False
+            self._write_index(index)
+
+        reader = _SnapshotReader(self.file)
+        for acc_num, acct_type, holder, balance, password, offset, length, count, *archived in index:
+            acc = _make_account(acct_type, acc_num, holder, balance)
+            if acc is None:
+                continue
+            acc.password = password
+            #indexes written before archiving have no archived column
+            archived = archived[0] if archived else None
+            if count:
+                acc.transactions = TransactionStore.lazy(
+                    count, _JsonSegment(reader, offset, length, acc.places, archived["count"] if archived else 0),
+                    places=acc.places)
+            if archived:
+                acc.transactions.attach_archive(self.archive, str(acc_num), archived)
+            bank.accounts[int(acc_num)] = acc
+            bank._index_holder(int(acc_num), holder)
+        return True
+
+    def _load_snapshot(self, bank):
+        with open(self.file, "r") as f:
+            data = json.load(f)
+        for acc_num, info in data.items():
+            acc = _make_account(info["account_type"], acc_num, info["holder_name"], info["balance"])
+            if acc is None:
+                continue
+
+            acc.password = info["password"]
+            if "archived" in info:
+                acc.transactions.attach_archive(self.archive, acc_num, info["archived"])
+            for t in info.get("transactions", []):
+                acc.transactions.add_record(t)
+            bank.accounts[int(acc_num)] = acc
+            bank._index_holder(int(acc_num), acc.holder_name)
+
+    def _load_binary(self, bank):
+        from bank_binary import BinarySnapshot
+
+        bank.accounts = bank._mapped_accounts(BinarySnapshot(self.file, self.archive))
+        for acc_num, holder in bank.accounts.snapshot.holders():
+            bank._index_holder(acc_num, holder)
+
+    def _apply_journal_entry(self, bank, acc_num, entry):
+        acc = bank.accounts.get(int(acc_num))
+        if acc is None:
+            if "account_type" not in entry:
+                return
+            acc = _make_account(entry["account_type"], acc_num, entry["holder_name"], entry["balance"])
+            if acc is None:
+                return
+            bank.accounts[int(acc_num)] = acc
+            bank._index_holder(int(acc_num), acc.holder_name)
+
+        #a record older than the snapshot (written while it was being
+        #compacted) carries nothing new
+        if entry["n"] + len(entry["transactions"]) < len(acc.transactions):
             return
-        
-        if account_type.lower() == "savings":
-            account = SavingsAccount(account_number, holder_name, balance)
-        elif account_type.lower() == "checking":
-            account = CheckingAccount(account_number, holder_name, balance)
-        elif account_type.lower() == "business":
-            account = BusinessAccount(account_number, holder_name, balance)
-        elif account_type.lower() == "crypto": 
-            account = CryptoWallet(account_number, holder_name, balance)
+        acc.balance = entry["balance"]
+        if "password" in entry:
+            acc.password = entry["password"]
+        #skip transactions that are already part of the snapshot
+        skip = len(acc.transactions) - entry["n"]
+        for t in entry["transactions"][max(skip, 0):]:
+            acc.transactions.add_record(t)
+
+
+#salted, key-stretched password hashes, stored where the plaintext used to be:
+#   scrypt$<n>$<r>$<p>$<salt>$<key>
+#   pbkdf2_sha256$<iterations>$<salt>$<key>
+#with base64 salt and key. The parameters are part of every hash, so hashes
+#made with other settings still verify; Bank rehashes them with the current
+#ones on the next successful login. Raising n or iterations makes every check
+#slower, for an attacker and for the bank alike.
+class PasswordHasher:
+    schemes = ("scrypt", "pbkdf2_sha256")
+
+    def __init__(self, scheme="scrypt", n=2 ** 14, r=8, p=1, iterations=600_000, salt_size=16):
+        if scheme not in self.schemes:
+            raise ValueError(f"Unknown password hash scheme: {scheme}")
+        self.scheme = scheme
+        self.n = n
+        self.r = r
+        self.p = p
+        self.iterations = iterations
+        self.salt_size = salt_size
+
+    def hash(self, password):
+        salt = os.urandom(self.salt_size)
+        if self.scheme == "scrypt":
+            params = (self.n, self.r, self.p)
         else:
-            print("Invalid account type")
+            params = (self.iterations,)
+        key = self._derive(self.scheme, params, salt, password)
+        return "$".join([self.scheme, *map(str, params), _b64(salt), _b64(key)])
+
+    def verify(self, stored, password):
+        #True if password matches stored, a hash or (from before passwords
+        #were hashed) the plaintext itself
+        if not isinstance(stored, str) or not isinstance(password, str):
+            return False
+        if not self.is_hash(stored):
+            return hmac.compare_digest(stored.encode(), password.encode())
+        try:
+            scheme, *params, salt, key = stored.split("$")
+            derived = self._derive(scheme, tuple(map(int, params)), binascii.a2b_base64(salt), password)
+            return hmac.compare_digest(derived, binascii.a2b_base64(key))
+        except ValueError:
+            #a malformed hash matches nothing
+            return False
+
+    def is_hash(self, stored):
+        return isinstance(stored, str) and stored.split("$", 1)[0] in self.schemes and "$" in stored
+
+    def needs_rehash(self, stored):
+        #plaintext, or hashed with other settings than these
+        if not self.is_hash(stored):
+            return True
+        scheme, *params, _, _ = stored.split("$")
+        current = [self.n, self.r, self.p] if self.scheme == "scrypt" else [self.iterations]
+        return scheme != self.scheme or list(map(int, params)) != current
+
+    @staticmethod
+    def _derive(scheme, params, salt, password):
+        password = password.encode()
+        if scheme == "scrypt":
+            n, r, p = params
+            #scrypt needs 128 * r * (n + p + 2) bytes; OpenSSL refuses more than 32 MiB unless told
+            return hashlib.scrypt(password, salt=salt, n=n, r=r, p=p, dklen=32,
+                                  maxmem=128 * r * (n + p + 2) + 2 ** 20)
+        return hashlib.pbkdf2_hmac("sha256", password, salt, params[0])
+
+
+def _b64(data):
+    return binascii.b2a_base64(data, newline=False).decode("ascii")
+
+
+#a bounded map whose entries expire: the least recently used key is dropped
+#past size entries, and a key is forgotten ttl seconds after it was put.
+#Bank keeps the results of recent operations by op id in one (the ledger
+#still has every id it forgets, see Bank._previous_result) and login
+#sessions in another.
+class _ExpiringCache:
+    def __init__(self, size=100_000, ttl=24 * 3600):
+        self.size = size
+        self.ttl = ttl
+        self._values = OrderedDict() #key -> (value, expiry)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        #the value, or None
+        with self._lock:
+            found = self._values.get(key)
+            if found is None:
+                return None
+            if found[1] <= time.monotonic():
+                del self._values[key]
+                return None
+            self._values.move_to_end(key)
+            return found[0]
+
+    def put(self, key, value):
+        with self._lock:
+            self._values[key] = (value, time.monotonic() + self.ttl)
+            self._values.move_to_end(key)
+            while len(self._values) > self.size:
+                self._values.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            found = self._values.pop(key, None)
+        return None if found is None else found[0]
+
+    def __len__(self):
+        return len(self._values)
+
+
+#a journal this small replays in no time, whatever the size of the snapshot
+COMPACT_MIN_BYTES = 2 ** 20
+
+
+#central controller for all accounts and transactions
+class Bank:
+    def __init__(self, file="bank_data.json", compact_every=None, lazy=False, snapshot_format="json",
+                 concurrent=False, storage=None, metrics=None, op_cache_size=100_000, op_ttl=24 * 3600,
+                 password_hasher=None, session_ttl=15 * 60, retention=None, compact_ratio=0.5,
+                 account_cache_size=100_000):
+        self.accounts = {}
+        #storage: a StorageBackend; by default a JsonBackend on file, built
+        #with lazy, snapshot_format and retention (see bank_archive.py).
+        #file=None keeps the bank in memory only: nothing is read or written
+        if storage is None and file is not None:
+            storage = JsonBackend(file, lazy, snapshot_format, retention)
+        elif retention is not None:
+            raise ValueError("retention applies to the default JsonBackend; pass it to JsonBackend instead")
+        self.storage = storage
+        #the journal is folded back into the snapshot once it is compact_ratio
+        #times the snapshot's size (and at least COMPACT_MIN_BYTES). Each
+        #compaction then has at least a fixed share of its own work written
+        #since the last one, so its cost per save stays the same as the
+        #ledger grows. compact_every: a number of records instead
+        self.compact_every = compact_every
+        self.compact_ratio = compact_ratio
+        #held from the start of a compaction until its snapshot is written,
+        #in a thread of its own when a save started it
+        self._compacting = threading.Lock()
+        self._compactor = None
+        #account number -> (transactions, balance in minor units, password)
+        #already persisted
+        self._saved = {}
+        #secondary index on holder name (case-insensitive): exact name ->
+        #account numbers, and (name, account number) pairs kept sorted for
+        #prefix searches
+        self._holders = {}
+        self._holder_names = []
+        self._unsorted_holders = None #pairs waiting to be sorted in, see _bulk_indexing()
+
+        #concurrent: safe to share between threads. Every account gets its own
+        #lock, transfers take both locks in account number order, and journal
+        #records go through a queue to one writer thread.
+        self.concurrent = concurrent
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._create_lock = threading.Lock()
+        self._journal_lock = threading.Lock()
+        self._writes = None
+        self._writer = None
+        self._write_error = None #what stopped the writer or compactor thread, if anything
+
+        #deposit, withdraw, transfer_funds and apply_batch take an optional
+        #op_id; an operation whose id was already applied is not applied
+        #again and returns its first result
+        self._operations = _ExpiringCache(op_cache_size, op_ttl)
+        #account_cache_size: with a backend that builds accounts on first use
+        #(binary, SQLite), at most about this many accounts stay in memory; the
+        #least recently used are dropped once they are saved and not in use
+        self.account_cache_size = account_cache_size
+
+        #password_hasher: a PasswordHasher; its settings set what a password
+        #check costs. login() hands out session tokens that stay valid for
+        #session_ttl seconds, so a session checks its password only once.
+        self.password_hasher = password_hasher or PasswordHasher()
+        self._sessions = _ExpiringCache(ttl=session_ttl) #token -> account number
+
+        #metrics: a bank_metrics.Metrics that times the operations of this bank
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.instrument(self)
+
+        self.load_data() #load saved data when program starts
+
+        if concurrent and self.storage is not None:
+            self._writes = queue.Queue()
+            self._writer = threading.Thread(target=self._write_journal, name="bank-journal-writer", daemon=True)
+            self._writer.start()
+
+    def _lock_for(self, acc_num):
+        lock = self._locks.get(acc_num)
+        if lock is None:
+            with self._locks_guard:
+                lock = self._locks.setdefault(acc_num, threading.RLock())
+        return lock
+
+    @contextlib.contextmanager
+    def _locked(self, *acc_nums):
+        #holds the locks of the given accounts; always taken in the same order
+        #so two transfers in opposite directions cannot deadlock
+        if not self.concurrent:
+            yield
             return
-        
-        password = input("Create a password for this account:")
-        confirm = input("Confirm password: ")
+        with contextlib.ExitStack() as stack:
+            for acc_num in sorted(set(acc_nums), key=lambda n: (type(n).__name__, n)):
+                stack.enter_context(self._lock_for(acc_num))
+            yield
+
+    def _write_journal(self):
+        #the single writer: drains queued records into storage. The first
+        #error stops all further writes, since a journal with a record
+        #missing cannot be replayed; the queue still drains so nothing waits
+        #on it forever, and save_data() and flush() raise the error
+        while True:
+            records = [self._writes.get()]
+            while True:
+                try:
+                    records.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
 
-        if password != confirm:
-            print("Passwords do no match. Account not created")
+            try:
+                if self._write_error is None:
+                    with self._journal_lock:
+                        for item in records:
+                            if item is not None:
+                                record, states = item
+                                self.storage.write(record)
+                                self._stored(states)
+            except Exception as e:
+                self._write_error = e
+            finally:
+                for _ in records:
+                    self._writes.task_done()
+            if None in records:
+                return
+            if self._write_error is None:
+                try:
+                    self._compact_when_due()
+                except Exception as e:
+                    self._write_error = e
+
+    def _check_writer(self):
+        if self._write_error is not None:
+            raise self._write_error
+
+    def flush(self):
+        #waits until every queued record has been written
+        if self._writes is not None:
+            self._writes.join()
+        self._check_writer()
+        if self.storage is not None:
+            with self._journal_lock:
+                self.storage.sync()
+
+    def save_data(self, *accounts):
+        #write only what changed since the last save; with no arguments
+        #every account in memory is checked
+        if self.storage is None:
             return
-        
-        account.password = password
-        self.accounts[account_number] = account
+        self._check_writer()
+        record = {}
+        for acc in (accounts or self._loaded_accounts()):
+            key = str(acc.account_number)
+            saved = self._saved.get(key)
+            count = len(acc.transactions)
+            if saved == (count, acc.units, acc.password):
+                continue
+
+            entry = {}
+            if saved is None:
+                entry["account_type"] = acc.get_account_type()
+                entry["holder_name"] = acc.holder_name
+            if saved is None or saved[2] != acc.password:
+                entry["password"] = acc.password
+            start = saved[0] if saved else 0
+            entry["balance"] = _json_amount(acc.units, acc.places)
+            #position of the first new transaction, so a replay never applies it twice
+            entry["n"] = start
+            entry["transactions"] = list(acc.transactions.records(start))
+            record[key] = entry
+            self._saved[key] = (count, acc.units, acc.password)
+
+        if not record:
+            return
+        #what the storage holds for these accounts once the record is written
+        states = {key: self._saved[key] for key in record}
+        if self._writes is not None:
+            self._writes.put((record, states))
+            return
+        self.storage.write(record)
+        self._stored(states)
+        self._compact_when_due()
 
-        if balance > 0:
-            account.transactions.append(Transaction("OpeningDeposit", balance, "Success"))
-        print(f"{account_type.capitalize()} Account created for {holder_name} with balance ${balance}.")
-        self.save_data()
+    def _stored(self, states):
+        if self.storage.reads_back and hasattr(self.accounts, "stored"):
+            self.accounts.stored(states)
 
-    def get_account_secure(self, account_number):
-        if account_number not in self.accounts:
-            print("Account not found")
+    def compact(self):
+        #folds everything saved so far into a new snapshot before returning
+        if self.storage is None:
+            return
+        if not self.storage.rewrites:
+            #nothing is rebuilt from memory, so queued records only have to
+            #be written first
+            self.flush()
+        self._compacting.acquire()
+        self._compact(background=False)
+
+    def _compact_when_due(self):
+        #starts a compaction once enough was saved since the last one, unless
+        #one is still running
+        storage = self.storage
+        if self.compact_every is not None:
+            due = storage.uncompacted() >= self.compact_every
+        else:
+            due = storage.uncompacted_bytes() >= max(self.compact_ratio * storage.snapshot_size(),
+                                                     COMPACT_MIN_BYTES)
+        if due and self._compacting.acquire(blocking=False):
+            self._compact(background=True)
+
+    def _compact(self, background):
+        #with _compacting held; releases it once done
+        try:
+            if self.storage.rewrites:
+                #no account may be created while the accounts are copied, so
+                #the accounts locked here are all the ones there are
+                with self._create_lock:
+                    accounts = list(self.accounts) if self.concurrent else ()
+                    with self._locked(*accounts), self._journal_lock:
+                        finish = self.storage.compact(self)
+            else:
+                with self._journal_lock:
+                    finish = self.storage.compact(self)
+        except BaseException:
+            self._compacting.release()
+            raise
+        if finish is None:
+            self._compacting.release()
+        elif background:
+            self._compactor = threading.Thread(target=self._finish_compaction, args=(finish, True),
+                                               name="bank-compactor", daemon=True)
+            self._compactor.start()
+        else:
+            self._finish_compaction(finish, False)
+
+    def _finish_compaction(self, finish, background):
+        try:
+            finish()
+        except Exception as e:
+            if not background:
+                raise
+            self._write_error = e
+        finally:
+            self._compacting.release()
+
+    def load_data(self):
+        if self.storage is not None:
+            with self._bulk_indexing():
+                self.storage.load(self)
+        self._mark_saved()
+        #plaintext passwords from before they were hashed are not touched
+        #here, at the cost of a hash each: authenticate() replaces one with a
+        #hash on the account's next successful login
+
+    def _index_holder(self, acc_num, holder):
+        name = holder.casefold()
+        numbers = self._holders.setdefault(name, [])
+        if acc_num not in numbers:
+            numbers.append(acc_num)
+            if self._unsorted_holders is not None:
+                self._unsorted_holders.append((name, acc_num))
+            else:
+                insort(self._holder_names, (name, acc_num))
+
+    @contextlib.contextmanager
+    def _bulk_indexing(self):
+        #while loading or importing many accounts: holder names are sorted in
+        #once at the end instead of one insort (O(n) each) per account, and
+        #prefix searches find them from then on
+        if self._unsorted_holders is not None:
+            yield
+            return
+        self._unsorted_holders = []
+        try:
+            yield
+        finally:
+            with self._create_lock:
+                names = self._holder_names + self._unsorted_holders
+                names.sort()
+                self._holder_names = names
+                self._unsorted_holders = None
+
+    def find_accounts_by_holder(self, holder_name):
+        name = holder_name.casefold()
+        numbers = dict.fromkeys(self._holders.get(name, []))
+        if self.storage is not None:
+            numbers.update(dict.fromkeys(self.storage.holder_accounts(name)))
+        return [self.accounts[acc_num] for acc_num in numbers]
+
+    def find_accounts_by_holder_prefix(self, prefix):
+        prefix = prefix.casefold()
+        found = []
+        for name, acc_num in islice(self._holder_names, bisect_left(self._holder_names, (prefix,)), None):
+            if not name.startswith(prefix):
+                break
+            found.append((name, acc_num))
+        if self.storage is not None:
+            stored = list(self.storage.holder_prefix(prefix))
+            if stored:
+                found = sorted(set(found).union(stored))
+        return [self.accounts[acc_num] for _, acc_num in found]
+
+    def transactions_between(self, account_number, start=None, end=None):
+        #transactions of one account with start <= timestamp <= end
+        account = self.get_account(account_number)
+        if account is None:
+            return []
+        return account.transactions.between(start, end)
+
+    def balance_as_of(self, account_number, timestamp):
+        #balance right after the last transaction at or before timestamp,
+        #from the account's transaction history
+        account = self.get_account(account_number)
+        if account is None:
             return None
+        return account.transactions.balance_as_of(timestamp)
+
+    def statement(self, account_number, start=None, end=None):
+        #opening and closing balance around the transactions with
+        #start <= timestamp <= end, with counts for that period
+        account = self.get_account(account_number)
+        if account is None:
+            return None
+        store = account.transactions
+        opening = store.totals(start, inclusive=False) if start is not None else (from_units(0, store.places), 0, 0)
+        closing = store.totals(end)
+        return {
+            "opening_balance": opening[0],
+            "closing_balance": closing[0],
+            "succeeded": closing[1] - opening[1],
+            "failed": closing[2] - opening[2],
+            "transactions": store.between(start, end),
+        }
+
+    def reconcile(self, *account_numbers):
+        #[(account number, balance, history balance)] for every account (or
+        #each one given) whose balance is not what its history adds up to
+        numbers = account_numbers or list(self.accounts)
+        mismatched = []
+        for acc_num in numbers:
+            account = self.accounts.get(acc_num)
+            if account is None:
+                continue
+            #both sides are exact, so any difference is a real one
+            total = account.transactions.unit_totals()[0]
+            if account.units != total:
+                mismatched.append((acc_num, account.balance, from_units(total, account.places)))
+        return mismatched
+
+    def add_missing_fees(self, *account_numbers):
+        #one-time migration for checking histories written before the Fee
+        #entry existed: when the fees of the successful withdrawals without one
+        #are exactly what the history is short of, a Fee entry is added for
+        #each. They go at the end, dated now, so no position moves. Returns the
+        #account numbers fixed; anything else is left for reconcile() to report
+        fixed = []
+        for acc_num, _, _ in self.reconcile(*account_numbers):
+            with self._locked(acc_num):
+                account = self.accounts.get(acc_num)
+                if not isinstance(account, CheckingAccount):
+                    continue
+                fee = to_units(2, account.places)
+                missing = 0
+                withdrawal = False
+                for t in account.transactions:
+                    if withdrawal and not (t.type == "Fee" and t.status == "Success"):
+                        missing += 1
+                    withdrawal = t.type == "Withdrawal" and t.status == "Success"
+                missing += withdrawal
+                if not missing or account.transactions.unit_totals()[0] - missing * fee != account.units:
+                    continue
+                for _ in range(missing):
+                    account.transactions.add_units("Fee", fee, "Success")
+            fixed.append((acc_num, account))
+        self.save_data(*(account for _, account in fixed))
+        return [acc_num for acc_num, _ in fixed]
+
+    def _mark_saved(self):
+        self._saved = {}
+        for acc in self._loaded_accounts():
+            self._mark_loaded(acc)
+
+    def _mark_loaded(self, acc):
+        self._saved[str(acc.account_number)] = (len(acc.transactions), acc.units, acc.password)
+
+    def _mapped_accounts(self, snapshot):
+        #Bank.accounts for a backend that builds accounts on first use
+        from bank_binary import MappedAccounts
+
+        return MappedAccounts(snapshot, self._mark_loaded, self.account_cache_size, self._forget_saved)
+
+    def _forget_saved(self, acc):
+        #acc was dropped from memory; it is marked again when it is rebuilt
+        self._saved.pop(str(acc.account_number), None)
+
+    def _loaded_accounts(self):
+        #with a binary snapshot or SQLite, only the accounts read so far
+        if hasattr(self.accounts, "loaded"):
+            return self.accounts.loaded()
+        return self.accounts.values()
+
+    def close(self):
+        if self._writer is not None:
+            self._writes.put(None)
+            self._writer.join()
+            self._writer = None
+            self._writes = None
+        if self._compactor is not None:
+            self._compactor.join()
+            self._compactor = None
+        if self.storage is not None:
+            self.storage.close()
+            
+    
+    def create_account(self, account_type, account_number, holder_name, balance = 0, password=None):
+        #returns the new account, or None if it was not created; the password
+        #is prompted for when it is not given
+
+        refused = self._refuse_account(account_type, account_number, balance)
+        if refused is not None:
+            event, message, fields = refused
+            _emit(event, message, status="failed", account=account_number, **fields)
+            return
+        account = _make_account(account_type, account_number, holder_name, balance)
+        
+        if password is None:
+            password = input("Create a password for this account:")
+            confirm = input("Confirm password: ")
+
+            if password != confirm:
+                _emit("create_account", "Passwords do no match. Account not created", status="failed",
+                      account=account_number)
+                return
         
-        account = self.accounts[account_number]
-        password = input("Enter your password: ")
-        if password == account.password:
-            return account
+        account.password = self.password_hasher.hash(password)
+        if not self._insert_account(account):
+            event, message, fields = self._refuse_account(account_type, account_number, balance)
+            _emit(event, message, status="failed", account=account_number, **fields)
+            return
 
-        else: 
-            print("Incorrect password.")
+        with self._locked(account_number):
+            if account.units > 0:
+                account.transactions.add_units("OpeningDeposit", account.units, "Success")
+            _emit("create_account", "{account_type} Account created for {holder} with balance ${balance}.",
+                  status="success", account=account_number, account_type=account_type.capitalize(),
+                  holder=holder_name, balance=account.balance)
+            self.save_data(account)
+        return account
+
+    def _refuse_account(self, account_type, account_number, balance):
+        #why create_account() turns this account down, as (event, message
+        #template, fields), or None; bank_bulk.py checks imported rows with it
+        if account_number in self.accounts:
+            #prevent duplicate account numbers
+            return "account_exists", "Account number {account} already exists. Please use a different number.", {}
+        if account_type.lower() == "business" and balance < 500:
+            return ("create_account", "Business accounts require a minimum $500 opening balance.",
+                    {"balance": balance})
+        if account_type.lower() not in ("savings", "checking", "business", "crypto"):
+            return "create_account", "Invalid account type", {"account_type": account_type}
+        return None
+
+    def _insert_account(self, account):
+        #adds a new account; False if its number was taken in the meantime
+        with self._create_lock:
+            if account.account_number in self.accounts:
+                return False
+            self.accounts[account.account_number] = account
+            self._index_holder(account.account_number, account.holder_name)
+        return True
+
+    def authenticate(self, account_number, password):
+        #the account if the password matches, otherwise None. This hashes the
+        #password; login() and session_account() check it once per session.
+        account = self.accounts.get(account_number)
+        if account is None or not self.password_hasher.verify(account.password, password):
+            return None
+        if self.password_hasher.needs_rehash(account.password):
+            #plaintext or older settings: store a hash made with the current ones
+            with self._locked(account_number):
+                account.password = self.password_hasher.hash(password)
+                self.save_data(account)
+        return account
+
+    def login(self, account_number, password=None):
+        #a session token for the account, or None if the password is wrong;
+        #the password is prompted for when it is not given
+        account = self.get_account_secure(account_number, password)
+        if account is None:
+            return None
+        token = secrets.token_urlsafe(32)
+        self._sessions.put(token, account_number)
+        return token
+
+    def session_account(self, token, account_number=None):
+        #the account a live session was opened for (only if it is
+        #account_number, when given), without checking the password again
+        acc_num = self._sessions.get(token) if token else None
+        if acc_num is None or (account_number is not None and acc_num != account_number):
             return None
+        return self.accounts.get(acc_num)
+
+    def logout(self, token):
+        self._sessions.pop(token)
+
+    def get_account_secure(self, account_number, password=None, session=None):
+        #the password is prompted for when it is not given; a live session
+        #token for the account is accepted instead
+        if session is not None:
+            account = self.session_account(session, account_number)
+            if account is not None:
+                return account
+        if account_number not in self.accounts:
+            _emit("account_not_found", "Account not found", status="failed", account=account_number)
+            return None
+        
+        if password is None:
+            password = input("Enter your password: ")
+        account = self.authenticate(account_number, password)
+        if account is None:
+            _emit("incorrect_password", "Incorrect password.", status="failed", account=account_number)
+        return account
 
     def get_account(self, account_number):
         if account_number in self.accounts:
             return self.accounts[account_number]
         else:
-            print("Account not found")
+            _emit("account_not_found", "Account not found", status="failed", account=account_number)
             return None
         
-    def transfer_funds(self, from_acc_num, to_acc_num, amount):
+    def deposit(self, account_number, amount, op_id=None):
+        account = self.get_account(account_number)
+        if account is None:
+            return False
+        with self._locked(account_number):
+            previous = self._previous_result(op_id, account)
+            if previous is not None:
+                return previous
+            start = len(account.transactions)
+            ok = account.deposit(amount)
+            self._record_op(op_id, account, start, ok)
+            self.save_data(account)
+        return ok
+
+    def withdraw(self, account_number, amount, op_id=None):
+        account = self.get_account(account_number)
+        if account is None:
+            return False
+        with self._locked(account_number):
+            previous = self._previous_result(op_id, account)
+            if previous is not None:
+                return previous
+            start = len(account.transactions)
+            ok = account.withdraw(amount)
+            self._record_op(op_id, account, start, ok)
+            self.save_data(account)
+        return ok
+
+    def _previous_result(self, op_id, account, pending=None):
+        #the result of the operation op_id if it was already applied to
+        #account, otherwise None. Ids the cache has forgotten are looked up in
+        #the account's history, so they survive eviction and restarts.
+        if op_id is None:
+            return None
+        result = pending.get(op_id) if pending else None
+        if result is None:
+            result = self._operations.get(op_id)
+        if result is None:
+            position = account.transactions.find_op(op_id)
+            if position is None:
+                return None
+            result = account.transactions[position].status == "Success"
+            self._operations.put(op_id, result)
+        _emit("duplicate_operation", "Operation {op_id} was already applied.", status="duplicate",
+              account=account.account_number, op_id=op_id, result=result)
+        return result
+
+    def _record_op(self, op_id, account, position, ok):
+        #tags the entry at position with op_id and remembers the result
+        if op_id is not None:
+            account.transactions.tag(position, op_id)
+            self._operations.put(op_id, ok)
+
+    def get_balance(self, account_number):
+        #answered from the mapped snapshot without building the account
+        #when it has not been loaded yet
+        if dict.__contains__(self.accounts, account_number):
+            return self.accounts[account_number].balance
+        if hasattr(self.accounts, "snapshot"):
+            return self.accounts.snapshot.balance(account_number)
+        return None
+
+    def transfer_funds(self, from_acc_num, to_acc_num, amount, op_id=None):
         
         #Prevent transferring to the same account
         if from_acc_num == to_acc_num:
-            print("Cannot transfer to the same acount")
-            return
+            _emit("transfer", "Cannot transfer to the same acount", status="failed",
+                  account=from_acc_num, to_account=to_acc_num, amount=amount)
+            return False
         
-        if amount <= 0:
-            print("Transfer amount must be greater than 0.")
-            return
+        if not _is_amount(amount):
+            _emit("transfer", "Transfer amount must be greater than 0.", status="failed",
+                  account=from_acc_num, to_account=to_acc_num, amount=amount)
+            return False
     
         from_acc = self.get_account(from_acc_num)
         to_acc = self.get_account(to_acc_num)
         
         if not from_acc or not to_acc:
-            print("Transfer failed: one or both accounts not found.")
-            return
+            _emit("transfer", "Transfer failed: one or both accounts not found.", status="failed",
+                  account=from_acc_num, to_account=to_acc_num, amount=amount)
+            return False
 
+        with self._locked(from_acc_num, to_acc_num):
+            previous = self._previous_result(op_id, from_acc)
+            if previous is not None:
+                return previous
+            ok = self._transfer(from_acc, to_acc, amount)
+            #the sending account's Transfer Out entry carries the id
+            self._record_op(op_id, from_acc, len(from_acc.transactions) - 1, ok)
+            self.save_data(from_acc, to_acc)
+        return ok
+
+    def _transfer(self, from_acc, to_acc, amount):
+        #both sides move the same amount, rounded to the coarser of the two
+        places = min(from_acc.places, to_acc.places)
+        amount = from_units(_operation_units(amount, places), places)
         if from_acc.withdraw(amount):
             if to_acc.deposit(amount):
-                from_acc.transactions.append(Transaction("Transfer Out", amount, "Success"))
-                to_acc.transactions.append(Transaction("Transfer In", amount, "Success"))
-                print(f"Transferred ${amount} from Account {from_acc_num} to Account {to_acc_num}.")
+                from_acc.transactions.add("Transfer Out", amount, "Success")
+                to_acc.transactions.add("Transfer In", amount, "Success")
+                _emit("transfer", "Transferred ${amount} from Account {account} to Account {to_account}.",
+                      status="success", account=from_acc.account_number, to_account=to_acc.account_number,
+                      amount=amount)
+                return True
         
             else:
                 from_acc.deposit(amount)
-                from_acc.transactions.append(Transaction("Transfer Out", amount, "Failed"))
-                print("Transfer failed due to insufficient balance or invalid amount.")
+                from_acc.transactions.add("Transfer Out", amount, "Failed")
+                _emit("transfer", "Transfer failed due to insufficient balance or invalid amount.",
+                      status="failed", account=from_acc.account_number,
+                      to_account=to_acc.account_number, amount=amount)
         
         else:
-            from_acc.transactions.append(Transaction("Transfer Out", amount, "Failed"))
-            print("Transfer failed due to insufficient balance or invalid amount.")
+            from_acc.transactions.add("Transfer Out", amount, "Failed")
+            _emit("transfer", "Transfer failed due to insufficient balance or invalid amount.",
+                  status="failed", account=from_acc.account_number, to_account=to_acc.account_number,
+                  amount=amount)
+        return False
+
+    def apply_batch(self, ops, atomic=True):
+        #applies many deposits, withdrawals and transfers in memory with the
+        #normal account rules and persists once at the end.
+        #atomic=True: the first failure rolls the whole batch back.
+        #atomic=False: failed ops are recorded as usual and the rest still apply.
+        #returns one {"ok": bool, "error": str or None} per op; an op whose
+        #op_id was already applied is skipped and returns its first result
+        #with "duplicate": True
+        results = []
+        before = {} #account number -> (account, balance units, transactions) before the batch
+        pending = {} #op id -> result, cached only once the batch commits
+        aborted = False
+
+        def touch(acc_num):
+            acc = self.accounts.get(acc_num)
+            if acc is not None and acc_num not in before:
+                before[acc_num] = (acc, acc.units, len(acc.transactions))
+            return acc
+
+        locked = ()
+        if self.concurrent:
+            #lock every account the batch names up front, in the usual order
+            ops = list(ops)
+            locked = [acc_num for op in ops for acc_num in self._batch_accounts(op)]
+        ops = iter(ops)
+        with self._locked(*locked), _quiet():
+            for op in ops:
+                error = None
+                try:
+                    kind, accounts, amount, op_id = _batch_op(op)
+                except (TypeError, ValueError, IndexError):
+                    kind, accounts, amount, op_id = None, (), None, None
+
+                if (kind not in ("deposit", "withdraw", "transfer", "interest")
+                        or len(accounts) != (2 if kind == "transfer" else 1)):
+                    error = f"Invalid operation: {op!r}"
+                elif not _is_amount(amount):
+                    error = "Rate must be greater than 0." if kind == "interest" else "Amount must be greater than 0."
+                elif kind == "transfer" and accounts[0] == accounts[1]:
+                    error = "Cannot transfer to the same account."
+                else:
+                    found = [touch(acc_num) for acc_num in accounts]
+                    if None in found:
+                        error = "Account not found."
+                    else:
+                        previous = self._previous_result(op_id, found[0], pending)
+                        if previous is not None:
+                            #already applied: changes nothing, so it never aborts the batch
+                            results.append({"ok": previous, "error": None if previous else "Operation failed before.",
+                                            "duplicate": True})
+                            continue
+                        start = len(found[0].transactions)
+                        if kind == "deposit" and not found[0].deposit(amount):
+                            error = "Deposit failed."
+                        elif kind == "withdraw" and not found[0].withdraw(amount):
+                            error = "Withdrawal failed due to insufficient balance or account rules."
+                        elif kind == "transfer" and not self._transfer(found[0], found[1], amount):
+                            error = "Transfer failed due to insufficient balance or account rules."
+                        elif kind == "interest" and not isinstance(found[0], SavingsAccount):
+                            error = "Interest is only paid on savings accounts."
+                        elif kind == "interest":
+                            found[0].add_interest(amount)
+                        if op_id is not None:
+                            #a transfer is tagged on its Transfer Out entry, which comes last
+                            position = len(found[0].transactions) - 1 if kind == "transfer" else start
+                            #interest too small to round to a cent records nothing
+                            if position < len(found[0].transactions):
+                                found[0].transactions.tag(position, op_id)
+                            pending[op_id] = error is None
+
+                results.append({"ok": error is None, "error": error})
+                if error and atomic:
+                    aborted = True
+                    break
 
-        self.save_data()
+            if aborted:
+                for acc, units, count in before.values():
+                    acc.units = units
+                    acc.transactions.truncate(count)
+                for result in results[:-1]:
+                    if not result.get("duplicate"):
+                        result["ok"] = False
+                        result["error"] = "Rolled back: batch aborted."
+                results.extend({"ok": False, "error": "Not applied: batch aborted."} for _ in ops)
+                return results
+
+            for op_id, ok in pending.items():
+                self._operations.put(op_id, ok)
+            if before:
+                self.save_data(*(acc for acc, _, _ in before.values()))
+        return results
+
+    @staticmethod
+    def _batch_accounts(op):
+        try:
+            return [acc_num for acc_num in _batch_op(op)[1] if isinstance(acc_num, (int, str))]
+        except (TypeError, ValueError, IndexError):
+            return []
 
     def display_all_accounts(self):
         if not self.accounts:
@@ -398,176 +2465,9 @@ def show_account_details(account : Account):
           f"Account Number: {account.account_number} | "
           f"Holder: {account.holder_name} | "
           f"Balance: ${account.balance}")
-    
-#Main Menu
-
-def MENU():
-    bank = Bank()
-    print("Welcome to the Banking System")
-
-    while True:
-        print("Main Menu:")
-        print("1. Create new account (savings/checking/business/crypto)")
-        print("2. Deposit funds")
-        print("3. Withdraw funds")
-        print("4. Transfer funds between accounts")
-        print("5. View account details")
-        print("6. Display all accounts")
-        print("7. Exit")
-
-        choice = input("Choose an option (1-7): ").strip()
-
-        if choice == "1":
-            while True:
-                acct_type = input("Enter account type (savings/checking/business/crypto): ").strip().lower()
-
-                #Check for valid choice:
-                if acct_type in ["savings", "checking", "business", "crypto"]:
-                    break
-                else:
-                    print("Invalid account type. Please enter one of: savings, checking, business, or crypto.")
-                
-            try:
-                #Loop until the user enters a valid input
-                while True:
-                    acct_num_input = input("Enter account number (numeric): ").strip()
-
-                    if not acct_num_input.isdigit():
-                        print("Account number must be numeric.")
-                        continue
-                    acct_num = int(acct_num_input)
-                    
-                    #check if account number already exists
-                    if acct_num in bank.accounts:
-                        print(f"Account number {acct_num} already exists. Please use a different number.")
-                        continue
-                    break
-                holder = input("Enter holder name: ").strip()
-                while True:
-                    try:
-                        opening = float(input("Enter opening balance (>= 0): ").strip())
-                        if opening < 0:
-                            print("Opening balance cannot be negative.")
-                            continue
-                        break
-                    except ValueError:
-                        print("Invalid input. Please enter a number")
-                        
-                bank.create_account(acct_type, acct_num, holder, opening)
-
-                #ask if user wants to continue
-                again = input("Do you want to continue? (y/n): ").strip().lower()
-                if again != "y":
-                    print("Goodbye!")
-                    break
 
-            except ValueError:
-                print("Invalid input. Please enter numbers for account number and balance.")
-
-        elif choice == "2":
-            try:
-                acct_num = int(input("Account number: ").strip())
-                amount = float(input("Deposit amount (> 0): ").strip())
-                if amount <= 0:
-                    print("Amount must be greater than 0.")
-                    continue
-                acc = bank.get_account_secure(acct_num)
-                if acc and acc.deposit(amount):
-                    bank.save_data()
-                
-                again = input("Do you want to continue? (y/n): ").strip().lower()
-                if again != "y":
-                    print("Goodbye!")
-                    break
-
-            except ValueError:
-                print("Invalid input. Please enter numeric values.")
-
-        elif choice == "3":
-            try:
-                acct_num = int(input("Account number: ").strip())
-                while True:
-                    #Loop until a valid input is entered
-                    try:
-                        amount = float(input("Withdrawal amount (> 0): ").strip())
-                        if amount <= 0:
-                            print("Amount must be greater than 0.")
-                            continue
-                        break
-                    except ValueError:
-                        print("Invalid input")
-
-                    
-                acc = bank.get_account(acct_num)
-                if acc and acc.withdraw(amount):
-                    bank.save_data()
-
-                again = input("Do you want to continue? (y/n): ").strip().lower()
-                if again != "y":
-                    print("Goodbye!")
-                    break
-
-            except ValueError:
-                print("Invalid input. Please enter numeric values.")
-
-        elif choice == "4":
-            try:
-                from_num = int(input("From account number: ").strip())
-                to_num = int(input("To account number: ").strip())
-                while True:
-                    try:
-                        amount = float(input("Transfer amount (> 0): ").strip())
-                        if amount <= 0:
-                            print("Amount must be greater than 0.")
-                            continue
-                        break
-                    except ValueError:
-                        print("Invalid input.")
-                
-                bank.transfer_funds(from_num, to_num, amount)
-
-                #ask if user wants to continue
-                again = input("Do you want to continue? (y/n): ").strip().lower()
-                if again != "y":
-                    print("Goodbye!")
-                    break
-
-            except ValueError:
-                print("Invalid input. Please enter numeric values.")
-
-        elif choice == "5":
-            try:
-                acct_num = int(input("Account number: ").strip())
-                acc = bank.get_account(acct_num)
-                if acc:
-                    print(f"{acc.get_account_type()} | Account Number: {acc.account_number} | Holder: {acc.holder_name} | Balance: ${acc.balance}")
-                    print("\nRecent Transactions:")
-                    if not acc.transactions:
-                        print("No transactions yet.")
-                    else:
-                        for t in acc.transactions[-10:]:
-                            print(t)
-                #ask if user wants to continue even if account not found
-                again =  input("Do you want to continue? (y/n): ").strip().lower()
-                if again != "y":
-                    print("Goodbye!")
-                    break 
-
-            except ValueError:
-                print("Invalid input.")
-
-        elif choice == "6":
-            bank.display_all_accounts()
-            again = input("Do you want to continue? (y/n): ").strip().lower()
-            if again != "y":
-                print("Goodbye!")
-                break
-
-        elif choice == "7":
-            print("Goodbye!")
-            break
-
-        else:
-            print("Invalid option. Please choose 1-7.")
 
-MENU()
\ No newline at end of file
+if __name__ == "__main__":
+    #the interactive menu lives in bank_cli.py
+    from bank_cli import main
+    main()
@@ -0,0 +1,90 @@
+#bulk import and export throughput (bank_bulk.py) in CSV and JSON Lines
+#
+#a ledger of --accounts accounts with --per-account transactions each is
+#exported and imported into an empty bank, accounts first, then histories.
+#Every step reports rows per second; "peak MiB" is the most memory the export
+#pipeline itself held at once (traced in a separate run), which should not
+#grow with the number of rows.
+#
+#usage: python benchmarks/bulk.py [--accounts 10000] [--per-account 100]
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bank_bulk
+from bank_system import Bank, NullSink, PasswordHasher, set_event_sink
+
+PASSWORD = PasswordHasher().hash("secret")
+
+
+def make_ledger(path, accounts, per_account):
+    rng = random.Random(0)
+    bank = Bank(path)
+    start = datetime.now() - timedelta(days=365)
+    for acc_num in range(accounts):
+        bank.create_account("checking", acc_num, f"Holder {acc_num}", 0, password="secret")
+        acc = bank.accounts[acc_num]
+        acc.password = PASSWORD
+        for i in range(per_account):
+            amount = rng.randint(1, 500)
+            acc.transactions.add("Deposit", amount, "Success", start + timedelta(minutes=i))
+            acc.units += amount * 100
+    bank.compact()
+    bank.close()
+
+
+def timed(name, rows_of, function):
+    start = time.perf_counter()
+    result = function()
+    seconds = time.perf_counter() - start
+    rows = rows_of(result)
+    print(f"{name:<34}{rows:>12,}{seconds:>10.2f}{rows / seconds:>14,.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import and export benchmark")
+    parser.add_argument("--accounts", type=int, default=10_000)
+    parser.add_argument("--per-account", type=int, default=100)
+    args = parser.parse_args()
+    set_event_sink(NullSink())
+
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "source.json")
+        make_ledger(source, args.accounts, args.per_account)
+        print(f"{args.accounts:,} accounts, {args.accounts * args.per_account:,} transactions")
+        print(f"{'step':<34}{'rows':>12}{'s':>10}{'rows/s':>14}")
+        for format in ("csv", "jsonl"):
+            accounts = os.path.join(directory, "accounts." + format)
+            transactions = os.path.join(directory, "transactions." + format)
+            bank = Bank(source, lazy=True)
+            timed(f"export accounts ({format})", int, lambda: bank_bulk.export_accounts(bank, accounts))
+            timed(f"export transactions ({format})", int,
+                  lambda: bank_bulk.export_transactions(bank, transactions))
+            bank.close()
+
+            target = Bank(os.path.join(directory, "target-" + format + ".json"))
+            rows = lambda summary: summary["rows"]
+            timed(f"import accounts ({format})", rows,
+                  lambda: bank_bulk.import_accounts(target, accounts, history=True))
+            timed(f"import transactions ({format})", rows,
+                  lambda: bank_bulk.import_transactions(target, transactions))
+            target.close()
+
+        bank = Bank(source, lazy=True)
+        tracemalloc.start()
+        bank_bulk.export_transactions(bank, os.path.join(directory, "traced.jsonl"))
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        bank.close()
+        print(f"peak MiB while exporting transactions: {peak / 2 ** 20:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#cost of a deposit, compactions included, as the ledger grows
+#
+#a ledger of --accounts accounts holding each size of transactions in total
+#is written, reopened, and --ops deposits are made on random accounts. Every
+#deposit appends to the journal, and compactions start once the journal is
+#half the size of the snapshot and are written by a thread of their own. The
+#mean per deposit should stay flat as the ledger grows, and no single deposit
+#should pay for a whole snapshot.
+#
+#last, a binary snapshot with more accounts than Bank(account_cache_size=...)
+#keeps in memory is read through and compacted, which must finish with the
+#balances intact.
+#
+#usage: python benchmarks/compaction.py [--sizes 10000 100000 1000000] [--ops 200000]
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bank_system import Bank, JsonBackend, NullSink, PasswordHasher, SavingsAccount, set_event_sink
+
+PASSWORD = PasswordHasher().hash("secret")
+
+
+def make_ledger(path, accounts, size):
+    bank = Bank(path)
+    start = datetime(2025, 1, 1)
+    for acc_num in range(accounts):
+        acc = SavingsAccount(acc_num, f"Holder {acc_num}", 0)
+        acc.password = PASSWORD
+        bank.accounts[acc_num] = acc
+    for i in range(size):
+        acc = bank.accounts[i % accounts]
+        acc.transactions.add("Deposit", 1, "Success", start)
+        acc.units += 100
+    bank.compact()
+    bank.close()
+
+
+def cached_compaction(directory, accounts):
+    #seconds to compact a binary ledger of which only a tenth of the accounts
+    #stay in memory, after a pass over all of them and one deposit
+    path = os.path.join(directory, "bank_data.bin")
+    bank = Bank(path, snapshot_format="binary")
+    for acc_num in range(accounts):
+        acc = SavingsAccount(acc_num, f"Holder {acc_num}", 1)
+        acc.password = PASSWORD
+        bank.accounts[acc_num] = acc
+    bank.compact()
+    bank.close()
+
+    bank = Bank(path, snapshot_format="binary", account_cache_size=max(accounts // 10, 1))
+    total = sum(bank.get_balance(acc_num) for acc_num in range(accounts))
+    bank.deposit(0, 1)
+    start = time.perf_counter()
+    bank.compact()
+    seconds = time.perf_counter() - start
+    intact = sum(bank.get_balance(acc_num) for acc_num in range(accounts)) == total + 1
+    bank.close()
+    return seconds, intact
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deposit cost with compaction")
+    parser.add_argument("--accounts", type=int, default=1000)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--ops", type=int, default=200_000)
+    args = parser.parse_args()
+    set_event_sink(NullSink())
+
+    compactions = [0]
+    compact = JsonBackend.compact
+
+    def counted(self, bank):
+        compactions[0] += 1
+        return compact(self, bank)
+
+    JsonBackend.compact = counted
+    print(f"{'transactions':>14}{'snapshot MiB':>14}{'mean us':>10}{'worst ms':>10}{'compactions':>13}{'close ms':>10}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "bank_data.json")
+            make_ledger(path, args.accounts, size)
+            snapshot = os.path.getsize(path)
+            bank = Bank(path)
+            compactions[0] = 0
+            rng = random.Random(0)
+            worst = 0
+            start = time.perf_counter()
+            for _ in range(args.ops):
+                began = time.perf_counter()
+                bank.deposit(rng.randrange(args.accounts), 1)
+                worst = max(worst, time.perf_counter() - began)
+            mean = (time.perf_counter() - start) / args.ops
+            #waits for a compaction still being written
+            start = time.perf_counter()
+            bank.close()
+            closing = time.perf_counter() - start
+        print(f"{size:>14,}{snapshot / 2 ** 20:>14.1f}{mean * 1e6:>10.1f}{worst * 1e3:>10.1f}"
+              f"{compactions[0]:>13}{closing * 1e3:>10.1f}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        seconds, intact = cached_compaction(directory, args.accounts)
+    print(f"binary compaction with a tenth of {args.accounts:,} accounts cached: {seconds * 1e3:.1f} ms, "
+          f"balances intact: {intact}")
+    if not intact:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
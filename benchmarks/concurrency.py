@@ -0,0 +1,109 @@
+#stress test and throughput benchmark for Bank(concurrent=True)
+#
+#contended: every thread transfers between random accounts from one shared
+#pool, then the total balance and the state reloaded from disk are checked.
+#disjoint: every thread works on its own accounts, to see how throughput
+#scales with the number of threads.
+#
+#note that on a CPython build with the GIL, threads cannot run Python code in
+#parallel, so disjoint throughput stays roughly flat; it scales on
+#free-threaded builds.
+#
+#usage: python benchmarks/concurrency.py [--threads 1 2 4 8] [--ops N]
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bank_system import Bank, NullSink, PasswordHasher, SavingsAccount, event_sink
+
+#passwords are stored hashed; a plaintext one would be hashed at its first login
+PASSWORD = PasswordHasher().hash("secret")
+
+
+def make_bank(path, accounts, balance):
+    bank = Bank(path, concurrent=True, compact_every=5000)
+    for acc_num in range(accounts):
+        acc = SavingsAccount(acc_num, f"Holder {acc_num}", 0)
+        acc.password = PASSWORD
+        bank.accounts[acc_num] = acc
+        bank.deposit(acc_num, balance)
+    return bank
+
+
+def run_threads(threads, work):
+    workers = [threading.Thread(target=work, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - start
+
+
+def contended(directory, threads, ops, accounts=50, balance=1000):
+    path = os.path.join(directory, f"contended_{threads}.json")
+    bank = make_bank(path, accounts, balance)
+
+    def work(seed):
+        rng = random.Random(seed)
+        for _ in range(ops):
+            a, b = rng.sample(range(accounts), 2)
+            bank.transfer_funds(a, b, rng.randint(1, 200))
+
+    elapsed = run_threads(threads, work)
+    total = sum(acc.balance for acc in bank.accounts.values())
+    bank.close()
+
+    reloaded = Bank(path)
+    persisted = {n: acc.balance for n, acc in reloaded.accounts.items()}
+    in_memory = {n: acc.balance for n, acc in bank.accounts.items()}
+    reloaded.close()
+    return threads * ops / elapsed, total == accounts * balance, persisted == in_memory
+
+
+def disjoint(directory, threads, ops, balance=10**9):
+    path = os.path.join(directory, f"disjoint_{threads}.json")
+    bank = make_bank(path, 2 * threads, balance)
+
+    def work(i):
+        a, b = 2 * i, 2 * i + 1
+        for n in range(ops):
+            if n % 2:
+                bank.transfer_funds(a, b, 1)
+            else:
+                bank.deposit(a, 1)
+
+    elapsed = run_threads(threads, work)
+    bank.close()
+    return threads * ops / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent Bank stress test")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--ops", type=int, default=5000, help="operations per thread")
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as directory, event_sink(NullSink()):
+        rows = []
+        for threads in args.threads:
+            rate, conserved, durable = contended(directory, threads, args.ops)
+            scaling = disjoint(directory, threads, args.ops)
+            rows.append((threads, rate, conserved, durable, scaling))
+            failed = failed or not (conserved and durable)
+
+    print(f"{'threads':>8}{'contended ops/s':>18}{'conserved':>11}{'persisted':>11}{'disjoint ops/s':>17}")
+    for threads, rate, conserved, durable, scaling in rows:
+        print(f"{threads:>8}{rate:>18,.0f}{str(conserved):>11}{str(durable):>11}{scaling:>17,.0f}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#bulk deposit throughput with each event sink
+#
+#console: today's messages, printed to a pseudo-terminal (or, where there is
+#none, a line-buffered file); buffered: BufferedFileSink; null: NullSink.
+#
+#usage: python benchmarks/events.py [--ops 200000]
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bank_system import Bank, BufferedFileSink, ConsoleSink, NullSink, SavingsAccount, event_sink
+
+
+def bulk_deposits(ops):
+    bank = Bank(None)
+    bank.accounts[1] = SavingsAccount(1, "Bench", 0)
+    start = time.perf_counter()
+    for _ in range(ops):
+        bank.deposit(1, 10)
+    return ops / (time.perf_counter() - start)
+
+
+def console_output(directory):
+    #a line-buffered stream whose other end is drained like a terminal would be
+    try:
+        import pty
+        master, slave = pty.openpty()
+    except (ImportError, OSError):
+        return open(os.path.join(directory, "console.txt"), "w", buffering=1)
+
+    def drain():
+        while True:
+            try:
+                if not os.read(master, 65536):
+                    break
+            except OSError:
+                break
+
+    threading.Thread(target=drain, daemon=True).start()
+    return os.fdopen(slave, "w", buffering=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Event sink throughput")
+    parser.add_argument("--ops", type=int, default=200_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        console = console_output(directory)
+        stdout, sys.stdout = sys.stdout, console
+        try:
+            with event_sink(ConsoleSink()):
+                rates = {"console": bulk_deposits(args.ops)}
+        finally:
+            sys.stdout = stdout
+            console.close()
+
+        sink = BufferedFileSink(os.path.join(directory, "events.jsonl"))
+        with event_sink(sink):
+            start = time.perf_counter()
+            bulk_deposits(args.ops)
+            sink.close()
+            rates["buffered"] = args.ops / (time.perf_counter() - start)
+
+        with event_sink(NullSink()):
+            rates["null"] = bulk_deposits(args.ops)
+
+    for name, rate in rates.items():
+        print(f"{name:<10}{rate:>14,.0f} deposits/s{rate / rates['console']:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+#load generator for bank_server.py
+#
+#starts a server on a temporary data file (or targets --host/--port), opens
+#many concurrent connections and reports requests per second and p50/p99
+#latency for a mix of deposits, withdrawals, transfers and statements. Every
+#account is logged in to once during setup and the requests carry its session
+#token, as a real client would, instead of a password that is hashed each time.
+#
+#usage: python benchmarks/loadgen.py [--clients 50] [--requests 200] [--accounts 100]
+#       python benchmarks/loadgen.py --port 8765 --no-server
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = "loadgen"
+
+
+class Client:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.next_id = 0
+
+    @classmethod
+    async def connect(cls, host, port):
+        return cls(*await asyncio.open_connection(host, port))
+
+    async def call(self, **request):
+        self.next_id += 1
+        request["id"] = self.next_id
+        self.writer.write(json.dumps(request).encode() + b"\n")
+        await self.writer.drain()
+        return json.loads(await self.reader.readline())
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+def random_request(rng, accounts, sessions):
+    account = rng.choice(accounts)
+    session = sessions[account]
+    roll = rng.random()
+    if roll < 0.4:
+        return {"op": "deposit", "account": account, "amount": rng.randint(1, 100), "session": session}
+    if roll < 0.7:
+        return {"op": "withdraw", "account": account, "amount": rng.randint(1, 50), "session": session}
+    if roll < 0.9:
+        other = rng.choice(accounts)
+        while other == account:
+            other = rng.choice(accounts)
+        return {"op": "transfer", "from": account, "to": other, "amount": rng.randint(1, 50),
+                "session": session}
+    return {"op": "statement", "account": account, "session": session, "limit": 10}
+
+
+async def run_client(host, port, seed, requests, accounts, sessions, latencies):
+    rng = random.Random(seed)
+    client = await Client.connect(host, port)
+    for _ in range(requests):
+        request = random_request(rng, accounts, sessions)
+        start = time.perf_counter()
+        await client.call(**request)
+        latencies.append(time.perf_counter() - start)
+    await client.close()
+
+
+async def run(args):
+    accounts = list(range(1, args.accounts + 1))
+    sessions = {}
+    setup = await Client.connect(args.host, args.port)
+    for account in accounts:
+        await setup.call(op="create", type="savings", account=account, holder=f"Load {account}",
+                         balance=10_000, password=PASSWORD)
+        sessions[account] = (await setup.call(op="login", account=account, password=PASSWORD))["session"]
+    await setup.close()
+
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(run_client(args.host, args.port, seed, args.requests, accounts, sessions, latencies)
+                           for seed in range(args.clients)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)]
+    print(f"{len(latencies)} requests from {args.clients} clients in {elapsed:.2f}s")
+    print(f"{len(latencies) / elapsed:,.0f} req/s  p50 {p50 * 1000:.2f} ms  p99 {p99 * 1000:.2f} ms")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(host, port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"server did not start on {host}:{port}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator for bank_server.py")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int)
+    parser.add_argument("--no-server", action="store_true", help="use a server that is already running")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=200, help="requests per client")
+    parser.add_argument("--accounts", type=int, default=100)
+    args = parser.parse_args()
+
+    if args.no_server:
+        if args.port is None:
+            parser.error("--port is required with --no-server")
+        asyncio.run(run(args))
+        return
+
+    args.port = args.port or free_port()
+    with tempfile.TemporaryDirectory() as directory:
+        server = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, "bank_server.py"), "--file",
+             os.path.join(directory, "bank_data.json"), "--host", args.host, "--port", str(args.port)],
+            stdout=subprocess.DEVNULL)
+        try:
+            wait_for_port(args.host, args.port)
+            asyncio.run(run(args))
+        finally:
+            #SIGINT lets the server close the bank cleanly
+            server.send_signal(signal.SIGINT)
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+#compares the memory used by one account's transaction history stored as
+#a list of objects (the original layout) against TransactionStore
+#
+#usage: python benchmarks/memory.py [--count N]
+import argparse
+import os
+import sys
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bank_system import Transaction, TransactionStore
+
+
+#the layout every transaction had before TransactionStore: a plain object
+#with a __dict__ and a datetime
+class DictTransaction:
+    def __init__(self, type, amount, status):
+        self.type = type
+        self.amount = amount
+        self.timestamp = datetime.now()
+        self.status = status
+
+
+def build_dict_list(count):
+    return [DictTransaction("Deposit", float(i % 500), "Success") for i in range(count)]
+
+
+def build_slots_list(count):
+    return [Transaction("Deposit", float(i % 500), "Success") for i in range(count)]
+
+
+def build_store(count):
+    store = TransactionStore()
+    for i in range(count):
+        store.add("Deposit", float(i % 500), "Success")
+    return store
+
+
+def measure(build, count):
+    tracemalloc.start()
+    result = build(count)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Transaction history memory benchmark")
+    parser.add_argument("--count", type=int, default=1_000_000, help="transactions to store")
+    args = parser.parse_args()
+
+    layouts = [
+        ("list of objects", build_dict_list),
+        ("list of __slots__ objects", build_slots_list),
+        ("TransactionStore", build_store),
+    ]
+    baseline = None
+    print(f"{args.count} transactions")
+    for name, build in layouts:
+        size = measure(build, args.count)
+        baseline = baseline or size
+        print(f"{name:<28}{size / 2**20:10.1f} MiB{size / args.count:8.1f} B/txn"
+              f"{baseline / size:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#money arithmetic three ways: floats (how balances were kept before),
+#decimal.Decimal, and the int minor units Bank uses now
+#
+#"accumulate" adds --count cent amounts one at a time, as deposits do;
+#"aggregate" sums a stored column of them, as totals() and reconcile() do, and
+#with NumPy installed also as float64 and int64 arrays. Each row shows how far
+#the result is from the exact total.
+#
+#usage: python benchmarks/money.py [--count 1000000] [--runs 5]
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from array import array
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bank_system import from_units
+
+
+def timed(function, runs):
+    #(median seconds, result)
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def accumulate(values):
+    total = values[0] * 0
+    for value in values:
+        total += value
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Float, Decimal and integer money benchmark")
+    parser.add_argument("--count", type=int, default=1_000_000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    cents = [rng.randint(1, 100_000) for _ in range(args.count)]
+    exact = from_units(sum(cents))
+    floats = [c / 100 for c in cents]
+    decimals = [from_units(c) for c in cents]
+    float_column = array("d", floats)
+    int_column = array("q", cents)
+
+    cases = [
+        ("accumulate float", lambda: accumulate(floats)),
+        ("accumulate Decimal", lambda: accumulate(decimals)),
+        ("accumulate int", lambda: from_units(accumulate(cents))),
+        ("aggregate float", lambda: sum(float_column)),
+        ("aggregate Decimal", lambda: sum(decimals)),
+        ("aggregate int", lambda: from_units(sum(int_column))),
+    ]
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
+    if np is not None:
+        float64 = np.array(floats, dtype=np.float64)
+        int64 = np.array(cents, dtype=np.int64)
+        cases.append(("numpy float64", lambda: float64.sum()))
+        cases.append(("numpy int64", lambda: from_units(int(int64.sum()))))
+
+    print(f"{args.count:,} amounts, exact total {exact}")
+    print(f"{'case':<22}{'ms':>10}{'error':>16}")
+    for name, function in cases:
+        seconds, total = timed(function, args.runs)
+        error = Decimal(total) - exact
+        print(f"{name:<22}{seconds * 1e3:>10.2f}{error:>16.2E}")
+
+
+if __name__ == "__main__":
+    main()
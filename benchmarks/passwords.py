@@ -0,0 +1,85 @@
+#cost of password checks for several PasswordHasher settings, compared with a
+#session lookup, and the cost of migrating plaintext passwords
+#
+#each setting's hash and verify times are the median of --runs. The session
+#rows time Bank.authenticate (one hash per call) against
+#Bank.session_account with a token from Bank.login. The migration rows load a
+#data file whose passwords are still plaintext, which should not hash any of
+#them, then log in to every account once, which hashes and saves each one.
+#
+#usage: python benchmarks/passwords.py [--runs 5] [--lookups 100000] [--accounts 20]
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bank_system import Bank, NullSink, PasswordHasher, set_event_sink
+
+SETTINGS = [
+    ("scrypt n=2^12", PasswordHasher("scrypt", n=2 ** 12)),
+    ("scrypt n=2^14", PasswordHasher("scrypt", n=2 ** 14)),
+    ("scrypt n=2^16", PasswordHasher("scrypt", n=2 ** 16)),
+    ("pbkdf2 100k", PasswordHasher("pbkdf2_sha256", iterations=100_000)),
+    ("pbkdf2 600k", PasswordHasher("pbkdf2_sha256", iterations=600_000)),
+]
+
+
+def timed(function, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Password hashing and session benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--lookups", type=int, default=100_000, help="session lookups to time")
+    parser.add_argument("--accounts", type=int, default=20, help="plaintext accounts to migrate")
+    args = parser.parse_args()
+    set_event_sink(NullSink())
+
+    print(f"{'setting':<18}{'hash ms':>10}{'verify ms':>12}")
+    for name, hasher in SETTINGS:
+        stored = hasher.hash("secret")
+        hashed = timed(lambda: hasher.hash("secret"), args.runs)
+        verified = timed(lambda: hasher.verify(stored, "secret"), args.runs)
+        print(f"{name:<18}{hashed * 1e3:>10.2f}{verified * 1e3:>12.2f}")
+
+    bank = Bank(None)
+    bank.create_account("savings", 1, "Bench", 100, password="secret")
+    token = bank.login(1, "secret")
+    per_check = timed(lambda: bank.authenticate(1, "secret"), args.runs)
+    lookups = args.lookups
+    per_lookup = timed(lambda: [bank.session_account(token, 1) for _ in range(lookups)], 1) / lookups
+    print(f"\n{'authenticate':<18}{per_check * 1e6:>12,.1f} us per call")
+    print(f"{'session lookup':<18}{per_lookup * 1e6:>12,.1f} us per call  ({per_check / per_lookup:,.0f}x faster)")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bank_data.json")
+        data = {str(n): {"account_type": "Savings Account", "holder_name": f"Holder {n}", "balance": 100,
+                         "password": "secret", "transactions": []}
+                for n in range(args.accounts)}
+        with open(path, "w") as f:
+            json.dump(data, f, indent=4)
+        start = time.perf_counter()
+        bank = Bank(path)
+        loaded = time.perf_counter() - start
+        start = time.perf_counter()
+        for n in range(args.accounts):
+            bank.authenticate(n, "secret")
+        migrated = time.perf_counter() - start
+        bank.close()
+    print(f"{'load':<18}{loaded / args.accounts * 1e6:>12,.1f} us per plaintext account")
+    print(f"{'first login':<18}{migrated / args.accounts * 1e3:>12,.1f} ms per plaintext account")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#what a retention policy saves: a year of history per account, kept whole
+#versus with only the last --days in memory and in the snapshot
+#
+#for each case the ledger is compacted once (which archives, with a policy),
+#then the snapshot size, the memory held by the loaded histories, startup
+#time and the cost of a full iteration of one account's history are reported.
+#The archived ledger is then converted to a binary snapshot in another
+#directory and back, and every copy must read the same full history.
+#
+#usage: python benchmarks/retention.py [--accounts 1000] [--per-account 1000] [--days 90]
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bank_archive import RetentionPolicy
+from bank_binary import binary_to_json, json_to_binary
+from bank_system import Bank, NullSink, PasswordHasher, set_event_sink
+
+PASSWORD = PasswordHasher().hash("secret")
+
+
+def make_ledger(path, accounts, per_account):
+    #per_account transactions per account, spread evenly over the last year
+    rng = random.Random(0)
+    bank = Bank(path)
+    now = datetime.now()
+    step = timedelta(days=365) / per_account
+    for acc_num in range(accounts):
+        bank.create_account("savings", acc_num, f"Holder {acc_num}", 0, password="secret")
+        acc = bank.accounts[acc_num]
+        acc.password = PASSWORD
+        store = acc.transactions
+        for i in range(per_account):
+            amount = rng.randint(1, 500)
+            store.add("Deposit", amount, "Success", now - timedelta(days=365) + i * step)
+            acc.units += amount * 100
+    bank.compact()
+    bank.close()
+
+
+def measure(name, path, retention):
+    bank = Bank(path, retention=retention)
+    start = time.perf_counter()
+    bank.compact()
+    compacted = time.perf_counter() - start
+    bank.close()
+
+    start = time.perf_counter()
+    bank = Bank(path, retention=retention)
+    opened = time.perf_counter() - start
+    bank.close()
+
+    #tracing slows loading down, so memory is measured on a separate open
+    tracemalloc.start()
+    bank = Bank(path, retention=retention)
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    history = len(list(bank.accounts[0].transactions))
+    iterated = time.perf_counter() - start
+    bank.close()
+    size = os.path.getsize(path)
+    print(f"{name:<14}{size / 2 ** 20:>10.1f}{held / 2 ** 20:>10.1f}{compacted * 1e3:>12.0f}"
+          f"{opened * 1e3:>10.0f}{iterated * 1e3:>12.1f}  ({history} entries)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retention and archive benchmark")
+    parser.add_argument("--accounts", type=int, default=1000)
+    parser.add_argument("--per-account", type=int, default=1000)
+    parser.add_argument("--days", type=float, default=90)
+    args = parser.parse_args()
+    set_event_sink(NullSink())
+
+    print(f"{args.accounts:,} accounts x {args.per_account:,} transactions over a year, keeping {args.days:g} days")
+    print(f"{'':<14}{'file MiB':>10}{'heap MiB':>10}{'compact ms':>12}{'open ms':>10}{'history ms':>12}")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bank_data.json")
+        make_ledger(path, args.accounts, args.per_account)
+        measure("no retention", path, None)
+        measure("retention", path, RetentionPolicy(days=args.days))
+        archive = os.path.join(directory, "bank_data.archive")
+        size = sum(os.path.getsize(os.path.join(archive, name)) for name in os.listdir(archive))
+        print(f"archive: {len(os.listdir(archive))} month segments, {size / 2 ** 20:.1f} MiB")
+
+        #the archive goes along with every conversion
+        binary = os.path.join(directory, "binary", "bank_data.bin")
+        back = os.path.join(directory, "back", "bank_data.json")
+        os.makedirs(os.path.dirname(binary))
+        os.makedirs(os.path.dirname(back))
+        start = time.perf_counter()
+        json_to_binary(path, binary)
+        binary_to_json(binary, back)
+        converted = time.perf_counter() - start
+        histories = []
+        for name, format in ((path, "json"), (binary, "binary"), (back, "json")):
+            bank = Bank(name, snapshot_format=format)
+            histories.append([(t.type, t.amount, t.timestamp) for t in bank.accounts[0].transactions])
+            bank.close()
+        same = histories[0] == histories[1] == histories[2]
+        print(f"to binary and back: {converted * 1e3:.0f} ms, full history read the same: {same}")
+
+
+if __name__ == "__main__":
+    main()
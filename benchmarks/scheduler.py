@@ -0,0 +1,64 @@
+#scheduler tick cost (bank_scheduler.py): a tick should cost in proportion
+#to the runs that are due, not to the number of jobs
+#
+#--jobs daily interest postings are spread evenly over a day on --accounts
+#savings accounts. A simulated clock then steps through the day a minute at
+#a time; every step applies the runs that fell due in that minute. The rows
+#show the cost of a tick with nothing due and the throughput of due runs as
+#the number of jobs grows, with the schedule journal on disk.
+#
+#usage: python benchmarks/scheduler.py [--accounts 10000] [--jobs 1000 10000 100000]
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bank_scheduler import Scheduler
+from bank_system import Bank, NullSink, PasswordHasher, set_event_sink
+
+DAY = 86400
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scheduler tick benchmark")
+    parser.add_argument("--accounts", type=int, default=10_000)
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1000, 10_000, 100_000])
+    parser.add_argument("--idle-ticks", type=int, default=10_000)
+    args = parser.parse_args()
+    set_event_sink(NullSink())
+
+    bank = Bank(None, password_hasher=PasswordHasher(n=2 ** 10))
+    for acc_num in range(args.accounts):
+        bank.create_account("savings", acc_num, f"Holder {acc_num}", 1000, password="secret")
+
+    print(f"{'jobs':>10}{'idle tick us':>14}{'runs':>10}{'runs/s':>12}")
+    for jobs in args.jobs:
+        now = [0.0]
+        with tempfile.TemporaryDirectory() as directory:
+            scheduler = Scheduler(bank, os.path.join(directory, "schedule"), clock=lambda: now[0])
+            for i in range(jobs):
+                scheduler.add({"op": "interest", "account": i % args.accounts, "rate": 0.0001}, every="daily",
+                              start=DAY + i * DAY / jobs)
+
+            #before the first run is due
+            start = time.perf_counter()
+            for _ in range(args.idle_ticks):
+                scheduler.tick()
+            idle = (time.perf_counter() - start) / args.idle_ticks
+
+            runs = 0
+            start = time.perf_counter()
+            for minute in range(1, 24 * 60 + 1):
+                now[0] = DAY + minute * 60
+                runs += scheduler.tick()["runs"]
+            seconds = time.perf_counter() - start
+            scheduler.close()
+        print(f"{jobs:>10,}{idle * 1e6:>14.2f}{runs:>10,}{runs / seconds:>12,.0f}")
+    bank.close()
+
+
+if __name__ == "__main__":
+    main()
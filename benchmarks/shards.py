@@ -0,0 +1,117 @@
+#throughput of ShardedBank as the number of shard processes grows
+#
+#client threads send deposits and, with --transfers, transfers between random
+#accounts (mostly on different shards), one request at a time; with --batch
+#the same operations go through apply_batch in chunks. A plain in-process
+#Bank(concurrent=True) is measured first for comparison. After every run the
+#total balance is checked against what the deposits added.
+#
+#throughput can only grow up to the number of cores: with one core every
+#shard count does the same work plus the cost of the messages.
+#
+#usage: python benchmarks/shards.py [--shards 1 2 4 8] [--ops 20000] [--clients 16]
+#       python benchmarks/shards.py --batch 1000 --transfers 0.05
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bank_shard import ShardedBank
+from bank_system import Bank, NullSink, PasswordHasher, set_event_sink
+
+ACCOUNTS = 1000
+OPENING = 1000
+#creating the accounts hashes their passwords, which is not what is measured
+HASHER = PasswordHasher(n=16)
+
+
+def operations(seed, count, transfers):
+    rng = random.Random(seed)
+    for _ in range(count):
+        if rng.random() < transfers:
+            a, b = rng.sample(range(ACCOUNTS), 2)
+            yield ("transfer", a, b, rng.randint(1, 5))
+        else:
+            yield ("deposit", rng.randrange(ACCOUNTS), 1)
+
+
+def run(bank, args):
+    #returns (seconds, money deposited)
+    per_client = args.ops // args.clients
+    deposited = [0] * args.clients
+
+    def client(i):
+        ops = list(operations(i, per_client, args.transfers))
+        if args.batch:
+            for start in range(0, len(ops), args.batch):
+                chunk = ops[start:start + args.batch]
+                for op, result in zip(chunk, bank.apply_batch(chunk, atomic=False)):
+                    if op[0] == "deposit" and result["ok"]:
+                        deposited[i] += op[2]
+            return
+        for op in ops:
+            if op[0] == "deposit":
+                if bank.deposit(op[1], op[2]):
+                    deposited[i] += op[2]
+            else:
+                bank.transfer_funds(op[1], op[2], op[3])
+
+    clients = [threading.Thread(target=client, args=(i,)) for i in range(args.clients)]
+    start = time.perf_counter()
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    bank.flush()
+    return time.perf_counter() - start, sum(deposited)
+
+
+def measure(name, bank, args):
+    for acc_num in range(ACCOUNTS):
+        bank.create_account("savings", acc_num, f"Holder {acc_num}", OPENING, password="secret")
+    elapsed, deposited = run(bank, args)
+    if isinstance(bank, ShardedBank):
+        total = bank.total_balance()[1]
+    else:
+        total = sum(acc.balance for acc in bank.accounts.values())
+    bank.close()
+    status = "ok" if total == ACCOUNTS * OPENING + deposited else f"MISMATCH {total}"
+    ops = args.ops // args.clients * args.clients
+    print(f"{name:<12}{ops / elapsed:>14,.0f}{elapsed:>10.2f}s  {status}", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ShardedBank throughput benchmark")
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--ops", type=int, default=20_000)
+    parser.add_argument("--clients", type=int, default=16, help="client threads")
+    parser.add_argument("--transfers", type=float, default=0.0, help="fraction of operations that are transfers")
+    parser.add_argument("--batch", type=int, default=0, help="send operations through apply_batch in chunks of this size")
+    parser.add_argument("--storage", choices=("json", "binary", "sqlite"), default="json")
+    args = parser.parse_args()
+    set_event_sink(NullSink())
+
+    print(f"{os.cpu_count()} cores, {args.clients} clients, {args.transfers:.0%} transfers, "
+          f"{'batches of ' + str(args.batch) if args.batch else 'one request at a time'}")
+    print(f"{'bank':<12}{'ops/s':>14}{'time':>11}")
+    with tempfile.TemporaryDirectory() as directory:
+        if args.storage == "sqlite":
+            from bank_sqlite import SqliteBackend
+            bank = Bank(storage=SqliteBackend(os.path.join(directory, "bank_data.db")), concurrent=True,
+                        password_hasher=HASHER)
+        else:
+            bank = Bank(os.path.join(directory, "bank_data.json"), snapshot_format=args.storage, concurrent=True,
+                        password_hasher=HASHER)
+        measure("in-process", bank, args)
+        for shards in args.shards:
+            path = os.path.join(directory, f"shards-{shards}")
+            measure(f"{shards} shards", ShardedBank(path, shards, args.storage, password_hasher=HASHER), args)
+
+
+if __name__ == "__main__":
+    main()
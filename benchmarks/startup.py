@@ -0,0 +1,83 @@
+#measures how long it takes to import bank_system and to construct a Bank
+#
+#import time is measured in fresh interpreters, net of interpreter startup.
+#construction is measured for an in-memory bank and for a data file with
+#--accounts accounts, loaded eagerly, lazily and from a binary snapshot.
+#
+#usage: python benchmarks/startup.py [--runs 10] [--accounts 10000]
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bank_system import Bank, PasswordHasher, SavingsAccount
+
+#passwords are stored hashed; a plaintext one would be hashed at its first login
+PASSWORD = PasswordHasher().hash("secret")
+
+
+def interpreter_time(code, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True, stdin=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def construct_time(runs, **kwargs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        bank = Bank(**kwargs)
+        times.append(time.perf_counter() - start)
+        bank.close()
+    return statistics.median(times)
+
+
+def write_ledger(path, accounts):
+    bank = Bank(path)
+    for acc_num in range(accounts):
+        acc = SavingsAccount(acc_num, f"Holder {acc_num}", 100)
+        acc.password = PASSWORD
+        for amount in range(1, 6):
+            acc.transactions.add("Deposit", amount, "Success")
+        bank.accounts[acc_num] = acc
+    bank.compact()
+    bank.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import and construction time benchmark")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--accounts", type=int, default=10_000)
+    args = parser.parse_args()
+
+    bare = interpreter_time("pass", args.runs)
+    imported = interpreter_time("import bank_system", args.runs)
+    print(f"{'import bank_system':<36}{(imported - bare) * 1000:10.1f} ms")
+    print(f"{'Bank(None) (in memory)':<36}{construct_time(args.runs, file=None) * 1000:10.3f} ms")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bank_data.json")
+        write_ledger(path, args.accounts)
+        binary = os.path.join(directory, "bank_data.bin")
+        from bank_binary import json_to_binary
+        json_to_binary(path, binary)
+
+        label = f"{args.accounts} accounts"
+        print(f"{'Bank(file) ' + label:<36}{construct_time(args.runs, file=path) * 1000:10.1f} ms")
+        print(f"{'Bank(file, lazy=True) ' + label:<36}"
+              f"{construct_time(args.runs, file=path, lazy=True) * 1000:10.1f} ms")
+        print(f"{'Bank(binary) ' + label:<36}"
+              f"{construct_time(args.runs, file=binary, snapshot_format='binary') * 1000:10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
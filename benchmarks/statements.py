@@ -0,0 +1,64 @@
+#historical balance queries: replaying the whole history versus starting
+#from the nearest TransactionStore checkpoint
+#
+#usage: python benchmarks/statements.py [--count 1000000] [--queries 1000]
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bank_system import _TYPE_SIGNS, TransactionStore
+
+
+def replay(store, timestamp):
+    #what a balance query cost before checkpoints: walk every transaction
+    balance = 0
+    for t in store:
+        if t.timestamp > timestamp:
+            break
+        if t.status == "Success":
+            balance += _TYPE_SIGNS.get(t.type, 0) * t.amount
+    return balance
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Historical balance benchmark")
+    parser.add_argument("--count", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=1000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    start = datetime(2024, 1, 1)
+    store = TransactionStore()
+    for i in range(args.count):
+        kind = rng.choice(("Deposit", "Withdraw", "Fee"))
+        store.add(kind, rng.randint(1, 100), "Success" if rng.random() < 0.95 else "Failed",
+                  start + timedelta(seconds=i))
+    times = [start + timedelta(seconds=rng.randrange(args.count)) for _ in range(args.queries)]
+
+    began = time.perf_counter()
+    store.totals()
+    built = time.perf_counter() - began
+
+    began = time.perf_counter()
+    fast = [store.balance_as_of(t) for t in times]
+    checkpointed = (time.perf_counter() - began) / args.queries
+
+    slow_queries = times[:max(args.queries // 100, 1)]
+    began = time.perf_counter()
+    slow = [replay(store, t) for t in slow_queries]
+    replayed = (time.perf_counter() - began) / len(slow_queries)
+
+    assert slow == fast[:len(slow)]
+    print(f"{args.count:,} transactions, checkpoint every {TransactionStore.checkpoint_every}")
+    print(f"building checkpoints   {built * 1000:10.1f} ms (once)")
+    print(f"full replay            {replayed * 1e6:10.1f} us per query")
+    print(f"from checkpoint        {checkpointed * 1e6:10.1f} us per query")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#compares the storage backends as the number of accounts grows
+#
+#for each size a ledger is written with the JSON backend (eager and lazy
+#loading) and with SQLite, then the time to open it, the time per deposit on
+#a random account and the time per balance lookup are measured. With SQLite
+#the open time and per-operation cost should stay flat.
+#
+#usage: python benchmarks/storage.py [--accounts 1000 10000 100000] [--ops 2000]
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bank_system import Bank, NullSink, PasswordHasher, SavingsAccount, event_sink
+from bank_sqlite import SqliteBackend
+
+#passwords are stored hashed; a plaintext one would be hashed at its first login
+PASSWORD = PasswordHasher().hash("secret")
+
+
+def fill(bank, accounts):
+    for acc_num in range(accounts):
+        acc = SavingsAccount(acc_num, f"Holder {acc_num}", 100)
+        acc.password = PASSWORD
+        for amount in range(1, 6):
+            acc.transactions.add("Deposit", amount, "Success")
+        bank.accounts[acc_num] = acc
+
+
+def write_json(path, accounts):
+    bank = Bank(path)
+    fill(bank, accounts)
+    bank.compact()
+    bank.close()
+
+
+def write_sqlite(path, accounts):
+    #accounts are added to a plain dict, then written in one save
+    bank = Bank(None)
+    fill(bank, accounts)
+    bank.storage = SqliteBackend(path)
+    bank.save_data()
+    bank.close()
+
+
+def measure(open_bank, accounts, ops):
+    start = time.perf_counter()
+    bank = open_bank()
+    opened = time.perf_counter() - start
+
+    rng = random.Random(0)
+    start = time.perf_counter()
+    with event_sink(NullSink()):
+        for _ in range(ops):
+            bank.deposit(rng.randrange(accounts), 1)
+    deposit = (time.perf_counter() - start) / ops
+
+    start = time.perf_counter()
+    for _ in range(ops):
+        bank.get_balance(rng.randrange(accounts))
+    lookup = (time.perf_counter() - start) / ops
+    bank.close()
+    return opened, deposit, lookup
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Storage backend benchmark")
+    parser.add_argument("--accounts", type=int, nargs="+", default=[1000, 10_000, 100_000])
+    parser.add_argument("--ops", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'backend':<12}{'accounts':>10}{'open ms':>12}{'deposit us':>13}{'lookup us':>12}")
+    for accounts in args.accounts:
+        with tempfile.TemporaryDirectory() as directory:
+            json_path = os.path.join(directory, "bank_data.json")
+            db_path = os.path.join(directory, "bank_data.db")
+            write_json(json_path, accounts)
+            write_sqlite(db_path, accounts)
+
+            backends = [
+                ("json", lambda: Bank(json_path, compact_every=10**9)),
+                ("json lazy", lambda: Bank(json_path, compact_every=10**9, lazy=True)),
+                ("sqlite", lambda: Bank(storage=SqliteBackend(db_path))),
+            ]
+            for name, open_bank in backends:
+                opened, deposit, lookup = measure(open_bank, accounts, args.ops)
+                print(f"{name:<12}{accounts:>10}{opened * 1e3:>12.1f}{deposit * 1e6:>13.1f}{lookup * 1e6:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
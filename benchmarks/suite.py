@@ -0,0 +1,311 @@
+#benchmark suite for the banking core
+#
+#micro benchmarks time deposit and withdraw on every account type,
+#Bank.transfer_funds, Bank.deposit with and without metrics and with op ids
+#(fresh ones and one retried id); macro benchmarks time save_data, compact,
+#load_data and display_all_accounts on synthetic ledgers with a given number
+#of transactions. Ledgers are generated from a fixed seed, so two runs measure
+#the same work, and the per-operation messages are silenced.
+#
+#results are written as JSON and can be compared with an earlier run; the
+#comparison uses the fastest run of each benchmark, which is the least noisy,
+#and exits with status 1 when a benchmark got slower than --threshold.
+#
+#usage: python benchmarks/suite.py [--sizes 1000 100000 10000000] [--output results.json]
+#       python benchmarks/suite.py --quick --filter deposit
+#       python benchmarks/suite.py --output new.json --compare old.json
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bank_metrics import Metrics
+from bank_system import (Bank, BusinessAccount, CheckingAccount, CryptoWallet, NullSink, PasswordHasher, SavingsAccount,
+                         event_sink)
+
+#passwords are stored hashed; a plaintext one would be hashed at its first login
+PASSWORD = PasswordHasher().hash("secret")
+#where benchmarked code that prints writes to
+DEVNULL = open(os.devnull, "w")
+
+ACCOUNT_TYPES = {
+    "savings": SavingsAccount,
+    "checking": CheckingAccount,
+    "business": BusinessAccount,
+    "crypto": CryptoWallet,
+}
+TRANSACTIONS_PER_ACCOUNT = 100
+SEED = 1234
+
+
+def make_ledger(bank, transactions, seed=SEED):
+    #fills bank with accounts of every type holding `transactions` entries in
+    #total; the same arguments always give the same ledger
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    classes = list(ACCOUNT_TYPES.values())
+    accounts = max(transactions // TRANSACTIONS_PER_ACCOUNT, 1)
+    written = 0
+    for acc_num in range(accounts):
+        count = transactions - written if acc_num == accounts - 1 else TRANSACTIONS_PER_ACCOUNT
+        acc = classes[acc_num % len(classes)](acc_num, f"Holder {acc_num}", 0)
+        acc.password = PASSWORD
+        balance = 0
+        for i in range(count):
+            amount = rng.randint(1, 500)
+            if rng.random() < 0.6 or amount > balance:
+                acc.transactions.add("Deposit", amount, "Success", start + timedelta(seconds=written + i))
+                balance += amount
+            else:
+                acc.transactions.add("Withdrawal", amount, "Success", start + timedelta(seconds=written + i))
+                balance -= amount
+        acc.balance = balance
+        bank.accounts[acc_num] = acc
+        written += count
+    return bank
+
+
+def measure(setup, run, repeat):
+    #run(state) does the timed work and returns how many operations it did
+    times = []
+    ops = 1
+    for _ in range(repeat):
+        state = setup()
+        start = time.perf_counter()
+        ops = run(state)
+        times.append(time.perf_counter() - start)
+        close = getattr(state, "close", None)
+        if close:
+            close()
+    median = statistics.median(times)
+    return {"median": median, "min": min(times), "repeat": repeat, "ops": ops, "ns_per_op": median / ops * 1e9}
+
+
+def account_benchmarks(args):
+    n = args.ops
+    for name, cls in ACCOUNT_TYPES.items():
+        #enough balance that no withdrawal is refused (business keeps $500)
+        def funded(cls=cls):
+            return cls(1, "Bench", n * 10 + 1000)
+
+        def deposit(acc):
+            for _ in range(n):
+                acc.deposit(10)
+            return n
+
+        def withdraw(acc):
+            for _ in range(n):
+                acc.withdraw(1)
+            return n
+
+        yield f"{name}.deposit", funded, deposit, args.repeat
+        yield f"{name}.withdraw", funded, withdraw, args.repeat
+
+
+def transfer_benchmarks(args):
+    n = args.ops
+    accounts = 100
+
+    def setup():
+        bank = Bank(None)
+        for acc_num in range(accounts):
+            bank.accounts[acc_num] = SavingsAccount(acc_num, f"Holder {acc_num}", n * 10)
+        return bank
+
+    def transfer(bank):
+        rng = random.Random(SEED)
+        for _ in range(n):
+            a, b = rng.sample(range(accounts), 2)
+            bank.transfer_funds(a, b, rng.randint(1, 10))
+        return n
+
+    yield "bank.transfer_funds", setup, transfer, args.repeat
+
+
+def metrics_benchmarks(args):
+    #Bank.deposit with and without metrics, to keep the instrumentation cost in view
+    n = args.ops
+
+    def setup(metrics=None):
+        bank = Bank(None, metrics=metrics)
+        bank.accounts[1] = SavingsAccount(1, "Bench", 0)
+        return bank
+
+    def deposit(bank):
+        for _ in range(n):
+            bank.deposit(1, 10)
+        return n
+
+    yield "bank.deposit", setup, deposit, args.repeat
+    yield "bank.deposit.metrics", lambda: setup(Metrics()), deposit, args.repeat
+
+
+def idempotency_benchmarks(args):
+    #Bank.deposit with a new op id every time, and one op id retried n times,
+    #which should only cost a cache lookup
+    n = args.ops
+
+    def setup():
+        bank = Bank(None)
+        bank.accounts[1] = SavingsAccount(1, "Bench", 0)
+        return bank
+
+    def fresh(bank):
+        for i in range(n):
+            bank.deposit(1, 10, op_id=str(i))
+        return n
+
+    def retried(bank):
+        for _ in range(n):
+            bank.deposit(1, 10, op_id="retry")
+        return n
+
+    yield "bank.deposit.op_id", setup, fresh, args.repeat
+    yield "bank.deposit.retry", setup, retried, args.repeat
+
+
+class _Workspace:
+    #a data file in a temporary directory that is removed again by close()
+    def __init__(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "bank_data.json")
+        self.bank = None
+
+    def close(self):
+        if self.bank is not None:
+            self.bank.close()
+        self.directory.cleanup()
+
+
+def ledger_benchmarks(args):
+    for size in args.sizes:
+        #large ledgers take long enough that one run is representative
+        repeat = args.repeat if size < 1_000_000 else 1
+        ledger = make_ledger(Bank(None), size)
+
+        def unsaved(ledger=ledger):
+            #the whole ledger in a bank whose storage has nothing yet
+            ws = _Workspace()
+            ws.bank = Bank(ws.path)
+            ws.bank.accounts = ledger.accounts
+            ws.bank.compact_every = float("inf")
+            return ws
+
+        def saved(ledger=ledger):
+            ws = unsaved(ledger)
+            ws.bank.compact()
+            ws.bank.close()
+            ws.bank = None
+            return ws
+
+        def save_all(ws):
+            ws.bank.save_data()
+            ws.bank.storage.sync()
+            return size
+
+        def compact(ws):
+            ws.bank.compact()
+            return size
+
+        def load(ws, lazy=False):
+            ws.bank = Bank(ws.path, lazy=lazy)
+            return size
+
+        def display(bank):
+            #display_all_accounts() prints directly; the terminal is not timed
+            with contextlib.redirect_stdout(DEVNULL):
+                bank.display_all_accounts()
+            return len(bank.accounts)
+
+        yield f"save_data[{size}]", unsaved, save_all, repeat
+        yield f"compact[{size}]", unsaved, compact, repeat
+        yield f"load_data[{size}]", saved, load, repeat
+        yield f"load_data.lazy[{size}]", saved, lambda ws: load(ws, lazy=True), repeat
+        yield f"display_all_accounts[{size}]", lambda ledger=ledger: ledger, display, repeat
+
+
+def metadata():
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                  text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "revision": revision,
+        "time": datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def compare(results, baseline, threshold):
+    #prints the change per benchmark and returns the names that regressed
+    regressions = []
+    print(f"\n{'benchmark':<36}{'before':>12}{'after':>12}{'change':>10}")
+    for name, result in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        change = result["min"] / old["min"] - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<36}{old['min'] * 1e3:>10.2f}ms{result['min'] * 1e3:>10.2f}ms{change:>+10.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark suite for the banking core")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 10_000_000],
+                        help="transactions per synthetic ledger")
+    parser.add_argument("--quick", action="store_true", help="only the 1K and 100K ledgers")
+    parser.add_argument("--ops", type=int, default=100_000, help="operations per micro benchmark run")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--filter", help="only run benchmarks whose name contains this")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="slowdown that counts as a regression (0.10 = 10%%)")
+    args = parser.parse_args()
+    if args.quick:
+        args.sizes = [size for size in args.sizes if size <= 100_000]
+
+    results = {}
+    print(f"{'benchmark':<36}{'median':>12}{'min':>12}{'per op':>14}")
+    with event_sink(NullSink()):
+        groups = (account_benchmarks(args), transfer_benchmarks(args), metrics_benchmarks(args),
+                  idempotency_benchmarks(args), ledger_benchmarks(args))
+        for group in groups:
+            for name, setup, run, repeat in group:
+                if args.filter and args.filter not in name:
+                    continue
+                result = results[name] = measure(setup, run, repeat)
+                print(f"{name:<36}{result['median'] * 1e3:>10.2f}ms{result['min'] * 1e3:>10.2f}ms"
+                      f"{result['ns_per_op']:>12,.0f}ns", flush=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"meta": metadata(), "results": results}, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()